@@ -0,0 +1,364 @@
+"""End-to-end benchmarks for the Dorm workflows.
+
+    python benchmark.py --sizes 1000,10000,100000 --save baseline.json
+    python benchmark.py --sizes 1000,10000 --compare baseline.json
+
+Each size gets a dataset from dataset.generate() with that many
+residents. Every workflow then runs --ops times (--sweeps times for the
+whole-dorm ones) against it, timing each call on its own. The report
+gives ops/sec, p50/p99 latency, and the peak memory a run of --mem-ops
+calls allocates, measured in a separate traced pass. --save writes the
+results as JSON; failed calls are counted but kept out of the
+latencies. --compare diffs them against an earlier file and exits 1 if
+a workflow fails more often or its p50 latency grew by more than
+--threshold; the median is far steadier between runs than ops/sec,
+which one slow call (a lazy index build, a full GC) can swing.
+"""
+import argparse
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# the workflows log every success; keep that cost but not the output
+os.environ.setdefault("DORMIKA_LOG", os.devnull)
+
+from dataset import generate, _add_months
+from models.employee import Employee
+from models.staff import ElectricalTech
+from models.enum import *
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+CARD_PAYMENT = "666777, Kenny, 12/99, 123"
+
+
+class Workload:
+    """Generated dataset plus cursors handing out entities benchmarks have not used yet."""
+
+    def __init__(self, size, seed):
+        self.size = size
+        # about one room per resident, 60% of them let, so there are
+        # both free rooms to book and tenants to act for
+        self.dorm = generate(buildings=max(1, math.ceil(size / 100)), floors=5,
+                             rooms_per_floor=20, residents=size, occupancy=0.6,
+                             unpaid_rate=0.3, seed=seed)
+        self.employee_id = self.dorm.employees[0].id
+        tenants, free = [], []
+        for resident in self.dorm.residents:
+            (tenants if resident.contracts else free).append(resident)
+        self.__pools = {
+            "free_residents": free,
+            "tenants": tenants,
+            "debtors": [
+                resident for resident in tenants
+                if any(invoice.status == InvoiceStatus.UNPAID for invoice in resident.invoices)
+            ],
+            "free_rooms": [
+                (building.id, room.type)
+                for building in self.dorm.buildings for room in building.rooms
+                if room.status == RoomStatus.AVAILABLE
+            ],
+        }
+        self.__cursors = dict.fromkeys(self.__pools, 0)
+        self.__slot = 0
+        self.__period = 0
+
+    def take(self, pool, count, reuse=False):
+        """The next count entities of pool; reuse cycles through it instead of running out."""
+        items = self.__pools[pool]
+        start = self.__cursors[pool]
+        if reuse:
+            taken = [items[(start + i) % len(items)] for i in range(count)] if items else []
+        else:
+            taken = items[start:start + count]
+        self.__cursors[pool] = start + count
+        if len(taken) < count:
+            raise LookupError(
+                f"dataset of {self.size} residents has too few {pool.replace('_', ' ')} "
+                f"for {count} more calls")
+        return taken
+
+    def next_slot(self):
+        """A facility booking time no other benchmark call has used."""
+        self.__slot += 1
+        day, hour = divmod(self.__slot, 12)
+        start = datetime.datetime.combine(datetime.date.today(), datetime.time(8))
+        return (start + datetime.timedelta(days=day + 1, hours=hour)).strftime("%Y-%m-%d %H:%M")
+
+    def next_period(self):
+        """A future billing period the dataset has not been billed for."""
+        self.__period += 1
+        return _add_months(datetime.date.today().replace(day=1), self.__period).strftime("%Y-%m")
+
+
+# each prepare(workload, n) sets up untimed and returns n argument tuples
+
+def _prepare_request_booking(workload, n):
+    residents = workload.take("free_residents", n, reuse=True)
+    rooms = workload.take("free_rooms", n)
+    return [(resident.id, building_id, room_type)
+            for resident, (building_id, room_type) in zip(residents, rooms)]
+
+
+def _prepare_sign_contract(workload, n):
+    dorm = workload.dorm
+    return [(dorm.request_booking(*args)["contract_id"],)
+            for args in _prepare_request_booking(workload, n)]
+
+
+def _prepare_pay_contract_invoice(workload, n):
+    dorm = workload.dorm
+    return [(dorm.sign_contract(*args)["invoice_id"],)
+            for args in _prepare_sign_contract(workload, n)]
+
+
+def _tenant_rooms(workload, n):
+    return [(resident.id, resident.contracts[0].room.id)
+            for resident in workload.take("tenants", n)]
+
+
+def _prepare_request_cleaning_room(workload, n):
+    return _tenant_rooms(workload, n)
+
+
+def _prepare_request_maintenance(workload, n):
+    # a dispatching employee stays busy afterwards, so each call gets a fresh one
+    dorm = workload.dorm
+    for index in range(n):
+        dorm.add_employee(Employee(name="Bench"))
+        dorm.add_technician(ElectricalTech(name="Bench", phone_number=f"05{index:08d}",
+                                           status=AvailabilityStatus.AVAILABLE))
+    return [(resident_id, room_id, "ELECTRICAL")
+            for resident_id, room_id in _tenant_rooms(workload, n)]
+
+
+def _prepare_booking_share_facility(workload, n):
+    args = []
+    for resident in workload.take("tenants", n, reuse=True):
+        building = resident.contracts[0].room.building
+        facility = building.washing_machines[0]
+        args.append((resident.id, facility.id, building.id, workload.next_slot()))
+    return args
+
+
+def _unpaid_invoice_id(resident):
+    return next(invoice.id for invoice in resident.invoices
+                if invoice.status == InvoiceStatus.UNPAID)
+
+
+def _prepare_select_payment(workload, n):
+    return [(resident.id, "Card", _unpaid_invoice_id(resident))
+            for resident in workload.take("debtors", n, reuse=True)]
+
+
+def _prepare_payment_system(workload, n):
+    dorm = workload.dorm
+    args = []
+    for resident in workload.take("debtors", n):
+        dorm.select_payment_method_and_invoices(resident.id, "Card", _unpaid_invoice_id(resident))
+        args.append((resident.id, CARD_PAYMENT))
+    return args
+
+
+def _prepare_system_contract_invoice(workload, n):
+    return [(workload.employee_id, workload.next_period()) for _ in range(n)]
+
+
+def _prepare_add_strike(workload, n):
+    return [(workload.employee_id,)] * n
+
+
+# (workflow, prepare, sweeps the whole dorm); add_strike blacklists
+# residents, so it runs last
+BENCHMARKS = (
+    ("request_booking", _prepare_request_booking, False),
+    ("sign_contract", _prepare_sign_contract, False),
+    ("pay_contract_invoice", _prepare_pay_contract_invoice, False),
+    ("request_cleaning_room", _prepare_request_cleaning_room, False),
+    ("request_maintenance", _prepare_request_maintenance, False),
+    ("booking_share_facility", _prepare_booking_share_facility, False),
+    ("select_payment_method_and_invoices", _prepare_select_payment, False),
+    ("payment_system", _prepare_payment_system, False),
+    ("system_contract_invoice", _prepare_system_contract_invoice, True),
+    ("add_strike", _prepare_add_strike, True),
+)
+
+
+def _percentile(ordered, fraction):
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _is_error(result):
+    # some workflows report failures through show_error instead of raising
+    return isinstance(result, dict) and set(result) == {"error"}
+
+
+def run_workflow(workload, name, prepare, calls, mem_calls):
+    workflow = getattr(workload.dorm, name)
+    args = prepare(workload, calls)
+    latencies = []
+    errors = 0
+    gc.collect()
+    started = time.perf_counter()
+    for call_args in args:
+        call_started = time.perf_counter()
+        try:
+            result = workflow(*call_args)
+        except Exception:
+            result = {"error": None}
+        # a failed call usually returns early, so it would flatter the timings
+        if _is_error(result):
+            errors += 1
+        else:
+            latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+
+    # a separate, smaller pass: tracing slows every allocation down
+    args = prepare(workload, mem_calls)
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for call_args in args:
+        try:
+            workflow(*call_args)
+        except Exception:
+            pass
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "ops": calls,
+        "errors": errors,
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": _ms(_percentile(latencies, 0.50)) if latencies else None,
+        "p99_ms": _ms(_percentile(latencies, 0.99)) if latencies else None,
+        "max_ms": _ms(latencies[-1]) if latencies else None,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_size(size, ops, sweeps, mem_ops, seed, only=None):
+    started = time.perf_counter()
+    workload = Workload(size, seed)
+    result = {"setup_s": round(time.perf_counter() - started, 2), "workflows": {}}
+    for name, prepare, sweep in BENCHMARKS:
+        if only and name not in only:
+            continue
+        calls, mem_calls = (sweeps, 1) if sweep else (ops, mem_ops)
+        result["workflows"][name] = stats = run_workflow(
+            workload, name, prepare, calls, mem_calls)
+        print(f"{size:>7} {name:<36} {stats['ops_per_sec']!s:>10} {stats['p50_ms']!s:>9} "
+              f"{stats['p99_ms']!s:>9} {stats['peak_kib']:>10}"
+              + (f"  ({stats['errors']} errors)" if stats["errors"] else ""))
+    if resource is not None:
+        # ru_maxrss is the process peak so far, in KiB on Linux
+        result["max_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, report, threshold):
+    """Print per-workflow changes against baseline; return the regressed (size, workflow) pairs."""
+    regressions = []
+    print(f"\nagainst {baseline.get('commit') or 'baseline'} "
+          f"(regression: p50 up more than {threshold:.0%}, or more errors)")
+    for size, current in report["sizes"].items():
+        previous = baseline.get("sizes", {}).get(size)
+        if previous is None:
+            continue
+        for name, stats in current["workflows"].items():
+            before = previous["workflows"].get(name)
+            if before is None:
+                continue
+            # more failing calls is a regression whatever the timings say
+            errors_before = before.get("errors", 0)
+            regressed = stats["errors"] > errors_before
+            if before["p50_ms"] and stats["p50_ms"] is not None:
+                change = stats["p50_ms"] / before["p50_ms"] - 1
+                regressed = regressed or change > threshold
+                p50 = f"{change:>+7.1%}"
+            else:
+                p50 = f"{'n/a':>7}"
+            if regressed:
+                regressions.append((size, name))
+            print(f"{size:>7} {name:<36} p50 {p50}  "
+                  f"ops/sec {before['ops_per_sec']} -> {stats['ops_per_sec']}"
+                  + (f"  errors {errors_before} -> {stats['errors']}"
+                     if stats["errors"] != errors_before else "")
+                  + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Dorm workflows")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated resident counts")
+    parser.add_argument("--ops", type=int, default=100, help="calls per workflow")
+    parser.add_argument("--sweeps", type=int, default=3,
+                        help="calls per whole-dorm workflow (billing, strikes)")
+    parser.add_argument("--mem-ops", type=int, default=10,
+                        help="calls in the traced memory pass")
+    parser.add_argument("--only", help="comma-separated workflows to run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from an earlier --save")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="p50 growth that counts as a regression, as a fraction")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    only = set(args.only.split(",")) if args.only else None
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "ops": args.ops,
+        "sweeps": args.sweeps,
+        "mem_ops": args.mem_ops,
+        "seed": args.seed,
+        "sizes": {},
+    }
+    print(f"{'size':>7} {'workflow':<36} {'ops/sec':>10} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'peak KiB':>10}")
+    for size in sizes:
+        report["sizes"][str(size)] = run_size(
+            size, args.ops, args.sweeps, args.mem_ops, args.seed, only)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nsaved to {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Synthetic DormiKa datasets for load and regression testing.
+
+    python dataset.py --buildings 100 --residents 100000 --seed 7 --out fixture.snap
+
+The same arguments in a fresh process give the same dataset, ids
+included; dates count back from --today (generate(today=...)), which
+defaults to a fixed day rather than the current one. A fixture is a
+snapshot file: load it with load_fixture(), or point DORMIKA_SNAPSHOT at
+it to serve it from the API.
+"""
+import argparse
+import calendar
+import datetime
+import functools
+import gc
+import random
+import string
+import time
+
+from models.dorm import Dorm
+from models.building import Building
+from models.room import Room
+from models.resident import Resident
+from models.contract import Contract
+from models.invoice import Invoice
+from models.employee import Employee
+from models.staff import Cleaner, PlumbingTech, ElectricalTech, ACTech
+from models.share_facility import WashingMachine, MeetingRoom
+from models.maintenance_ticket import MaintenanceTicket
+from models.cleaning_ticket import CleaningTicket
+from models.snapshot import SnapshotRepository
+from models.enum import *
+
+
+FIRST_NAMES = ["Alice", "Bob", "Charlie", "David", "Eve", "Kenny", "Harry", "Sally",
+               "Tom", "Lucy", "Mia", "Oscar", "John", "Jane", "Mike", "Sara", "Leo",
+               "Nina", "Paul", "Rita", "Sam", "Tina", "Victor", "Wendy", "Zack"]
+LAST_NAMES = ["Smith", "Brown", "Wong", "Garcia", "Miller", "Davis", "Lopez", "Wilson",
+              "Moore", "Taylor", "Thomas", "Martin", "Lee", "Clark", "Lewis", "Young"]
+# share of rooms per type; studios are the bulk of a dorm
+ROOM_MIX = ((RoomType.STUDIO_ROOM, 0.5), (RoomType.STANDARD_ROOM, 0.35),
+            (RoomType.ONE_BED_ROOM, 0.15))
+TECHNICIAN_TYPES = (ElectricalTech, PlumbingTech, ACTech)
+ISSUE_CATEGORIES = ("ELECTRICAL", "PLUMBING", "AC")
+# day rent history counts back from by default, so fixtures do not drift
+FIXTURE_TODAY = datetime.date(2026, 1, 1)
+
+
+def _gc_paused(function):
+    """Run function with cyclic GC off; building a dataset only adds objects,
+    and GC passes over them only cost time, as in Dorm.open."""
+    @functools.wraps(function)
+    def paused(*args, **kwargs):
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if collecting:
+                gc.enable()
+    return paused
+
+
+@_gc_paused
+def generate(buildings: int = 10, floors: int = 5, rooms_per_floor: int = 20,
+             residents: int = 1000, months: int = 6, occupancy: float = 0.9,
+             unpaid_rate: float = 0.05, ticket_rate: float = 0.1,
+             booking_rate: float = 0.2, seed: int = 0, today: datetime.date = FIXTURE_TODAY,
+             name: str = "DormiKa") -> Dorm:
+    """Build a Dorm with buildings x floors x rooms_per_floor rooms and residents residents.
+
+    Up to occupancy of the rooms get an active contract, each with up to
+    months of rent history; unpaid_rate of the last two months' invoices
+    are left unpaid. ticket_rate of the rooms carry a resolved maintenance and
+    cleaning ticket, and booking_rate of the tenants have a past
+    facility booking. Entities go in through Dorm.bulk_load. Dates count
+    back from today, FIXTURE_TODAY unless given.
+    """
+    rng = random.Random(seed)
+    dorm = Dorm(name)
+
+    building_list = []
+    rooms = []
+    room_types = [room_type for room_type, _ in ROOM_MIX]
+    weights = [weight for _, weight in ROOM_MIX]
+    for index in range(buildings):
+        building = Building(floor_count=floors, zone=string.ascii_uppercase[index % 26])
+        for floor in range(1, floors + 1):
+            for room_type in rng.choices(room_types, weights, k=rooms_per_floor):
+                room = Room(building, floor, room_type, RoomStatus.AVAILABLE)
+                building.add_room(room)
+                rooms.append(room)
+        for _ in range(max(1, floors // 2)):
+            building.add_washing_machine(WashingMachine())
+        building.add_meeting_room(MeetingRoom())
+        building_list.append(building)
+
+    resident_list = []
+    for index in range(residents):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        resident_list.append(Resident(
+            name=f"{first} {last}",
+            email=f"{first.lower()}.{last.lower()}{index}@example.com",
+            # index-based digits keep every phone number unique
+            phone_number=f"08{index:08d}",
+        ))
+
+    employees = [Employee(name=rng.choice(FIRST_NAMES)) for _ in range(max(2, buildings // 5))]
+    cleaners = [
+        Cleaner(name=rng.choice(FIRST_NAMES), phone_number=f"07{index:08d}",
+                cleaning_supplies_list=["Broom", "Mop"], assigned_rooms=[])
+        for index in range(max(2, buildings))
+    ]
+    technicians = [
+        TECHNICIAN_TYPES[index % 3](
+            name=rng.choice(FIRST_NAMES), phone_number=f"06{index:08d}",
+            status=AvailabilityStatus.AVAILABLE)
+        for index in range(max(3, buildings))
+    ]
+
+    ledger = []
+    tenants = min(residents, int(len(rooms) * occupancy))
+    for resident, room in zip(resident_list, rng.sample(rooms, tenants)):
+        history = rng.randint(1, months) if months > 0 else 0
+        move_in = _add_months(today.replace(day=1), -history)
+        contract = Contract(resident, room, status=ContractStatus.ACTIVE)
+        contract.activate(move_in, Contract.DEFAULT_RENTAL_MONTHS)
+        signing = Invoice(InvoiceType.CONTRACT, room.monthly_rent, InvoiceStatus.PAID,
+                          room.id, date_create=_at(move_in))
+        contract.invoice_id = signing.id
+        resident.add_contract(contract)
+        resident.add_invoice(signing)
+        room.status = RoomStatus.OCCUPIED
+
+        # monthly rent since move-in, as the billing runs would have issued it
+        for month in range(1, history + 1):
+            issued = _add_months(move_in, month)
+            # arrears are mostly recent; older months have been settled
+            overdue = month > history - 2 and rng.random() < unpaid_rate
+            status = InvoiceStatus.UNPAID if overdue else InvoiceStatus.PAID
+            resident.add_invoice(Invoice(InvoiceType.CONTRACT, room.monthly_rent, status,
+                                         room.id, date_create=_at(issued)))
+            ledger.append((contract.id, issued.strftime("%Y-%m")))
+
+        if rng.random() < ticket_rate:
+            _add_tickets(rng, resident, room, technicians, _at(move_in))
+        if rng.random() < booking_rate:
+            _add_booking(rng, resident, room.building, today)
+
+    dorm.bulk_load(buildings=building_list, residents=resident_list, employees=employees,
+                   technicians=technicians, cleaners=cleaners, ledger=ledger)
+    return dorm
+
+
+def _add_months(day: datetime.date, months: int) -> datetime.date:
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    return datetime.date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _at(day: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time(9, 0))
+
+
+def _add_tickets(rng, resident, room, technicians, reported):
+    category = rng.randrange(len(ISSUE_CATEGORIES))
+    technician = technicians[category % len(technicians)]
+    ticket = MaintenanceTicket(resident.id, room.id, ISSUE_CATEGORIES[category], technician.id,
+                               report_time=reported)
+    ticket.status = MaintenanceStatus.RESOLVED
+    room.add_maintenance_ticket(ticket)
+
+    cleaning = CleaningTicket(resident.id, room.id, report_time=reported)
+    cleaning.status = CleaningStatus.FINISHED
+    room.cleaning_tickets.append(cleaning)
+
+
+def _add_booking(rng, resident, building, today):
+    facility = rng.choice(building.washing_machines + building.meeting_rooms)
+    for _ in range(3):
+        day = today - datetime.timedelta(days=rng.randint(1, 30))
+        booking_time = f"{day.isoformat()} {rng.randint(8, 20):02d}:00"
+        try:
+            booking = facility.create_booking(resident.id, facility.id, building.id, booking_time)
+        except ValueError:
+            # slot already taken by another generated booking
+            continue
+        resident.add_booking_share_facility(booking)
+        resident.add_invoice(facility.create_share_facility_invoice(
+            resident.id, booking, date_create=_at(day)))
+        return
+
+
+def load_fixture(path: str) -> Dorm:
+    """Open a fixture written by this script; entities are decoded on first use."""
+    return Dorm.open(SnapshotRepository(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic DormiKa fixture")
+    parser.add_argument("--buildings", type=int, default=10)
+    parser.add_argument("--floors", type=int, default=5)
+    parser.add_argument("--rooms-per-floor", type=int, default=20)
+    parser.add_argument("--residents", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--occupancy", type=float, default=0.9)
+    parser.add_argument("--unpaid-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--today", type=datetime.date.fromisoformat, default=FIXTURE_TODAY,
+                        help=f"ISO date the history ends on (default {FIXTURE_TODAY})")
+    parser.add_argument("--out", required=True, help="snapshot file to write")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dorm = generate(buildings=args.buildings, floors=args.floors,
+                    rooms_per_floor=args.rooms_per_floor, residents=args.residents,
+                    months=args.months, occupancy=args.occupancy,
+                    unpaid_rate=args.unpaid_rate, seed=args.seed, today=args.today)
+    generated = time.perf_counter()
+    dorm.write_snapshot(args.out)
+    print(f"{len(dorm.buildings)} buildings, {len(dorm.residents)} residents "
+          f"generated in {generated - start:.1f}s, written to {args.out} "
+          f"in {time.perf_counter() - generated:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,30 @@
-from fastapi import FastAPI, HTTPException, APIRouter
-from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, APIRouter, Request, Header
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime
+import asyncio
+import inspect
 import uvicorn
 from pydantic import BaseModel, Field
 from typing import Optional
+import json
+import os
+import secrets
+import threading
+import time
 import tester as tester_data
 
 from models.dorm import *
+from models.event_log import log
+from models.repository import SQLiteRepository
+from models.journal import JournalRepository
+from models.snapshot import SnapshotRepository
+from models.id_allocator import ids, SQLiteIdStore
+from models.worker_pool import WorkerPool, PoolFullError
+from models.metrics import metrics
+from models.tracing import tracer
+from models.profiler import profiler, collapsed_text, ProfilerBusyError
+from models.shard import ShardRouter, shard_of
 from models.employee import *
 from models.staff import *
 from models.resident import *
@@ -24,15 +43,211 @@ from models.share_facility import *
 
 dorm = None
 
+# set DORMIKA_DB to a file path, or DORMIKA_JOURNAL to a directory,
+# to keep state across restarts
+DORMIKA_DB = os.environ.get("DORMIKA_DB")
+DORMIKA_JOURNAL = os.environ.get("DORMIKA_JOURNAL")
+# or DORMIKA_SNAPSHOT to a file path to start from a memory-mapped snapshot
+DORMIKA_SNAPSHOT = os.environ.get("DORMIKA_SNAPSHOT")
+# SQLite file holding id high-water marks, shared by every worker process
+DORMIKA_IDS = os.environ.get("DORMIKA_IDS")
+# more than 1 splits the buildings across that many shard processes
+DORMIKA_SHARDS = int(os.environ.get("DORMIKA_SHARDS", 1))
+# /admin endpoints answer only requests sending this in X-Admin-Token;
+# unset disables them
+DORMIKA_ADMIN_TOKEN = os.environ.get("DORMIKA_ADMIN_TOKEN")
+
+
+def open_shard(index, count):
+    """Build one shard's Dorm: the usual store, one per shard, keeping only its buildings."""
+    def seed():
+        shard = tester_data.init_mock_data()
+        shard.retain_shard(lambda key: shard_of(key, count) == index)
+        return shard
+    if DORMIKA_JOURNAL:
+        return Dorm.open(JournalRepository(
+            os.path.join(DORMIKA_JOURNAL, f"shard-{index}")), seed=seed)
+    if DORMIKA_DB:
+        root, extension = os.path.splitext(DORMIKA_DB)
+        return Dorm.open(SQLiteRepository(f"{root}.shard{index}{extension}"), seed=seed)
+    return seed()
+
+
 def init_mock_data():
     global dorm
-    dorm = tester_data.init_mock_data()
+    if DORMIKA_SHARDS > 1:
+        dorm = ShardRouter(DORMIKA_SHARDS, open_shard, DORMIKA_IDS)
+        return
+    if DORMIKA_IDS:
+        ids.use_store(SQLiteIdStore(DORMIKA_IDS))
+    if DORMIKA_JOURNAL:
+        dorm = Dorm.open(JournalRepository(DORMIKA_JOURNAL),
+                         seed=tester_data.init_mock_data)
+    elif DORMIKA_DB:
+        dorm = Dorm.open(SQLiteRepository(DORMIKA_DB),
+                         seed=tester_data.init_mock_data)
+    elif DORMIKA_SNAPSHOT:
+        dorm = Dorm.open(SnapshotRepository(DORMIKA_SNAPSHOT),
+                         seed=tester_data.init_mock_data)
+        if not os.path.exists(DORMIKA_SNAPSHOT):
+            dorm.write_snapshot(DORMIKA_SNAPSHOT)
+    else:
+        dorm = tester_data.init_mock_data()
+
+
+# Dorm calls run on worker threads, never on the event loop. Short
+# workflows and batch jobs get separate pools, so a billing or strike run
+# cannot occupy the threads that serve lookups.
+short_pool = WorkerPool(
+    "short",
+    max_workers=int(os.environ.get("DORMIKA_SHORT_WORKERS", 8)),
+    max_queue=int(os.environ.get("DORMIKA_SHORT_QUEUE", 64)),
+)
+batch_pool = WorkerPool(
+    "batch",
+    max_workers=int(os.environ.get("DORMIKA_BATCH_WORKERS", 2)),
+    max_queue=int(os.environ.get("DORMIKA_BATCH_QUEUE", 4)),
+)
+# read-only lookups should answer fast or not at all. Writes have no
+# timeout: a 504 would not stop one that already started, and a client
+# retrying it could book or pay twice. A full pool still refuses them.
+READ_TIMEOUT = float(os.environ.get("DORMIKA_READ_TIMEOUT", 2))
+
+
+async def run_in_pool(pool, fn, *args, timeout=None):
+    """Run fn(*args) on pool, answering 503 when it is full and 504 on timeout."""
+    try:
+        return await pool.run(fn, *args, timeout=timeout)
+    except PoolFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504, detail=f"{getattr(fn, '__name__', 'call')} timed out")
+
+
+def offload(pool, timeout=None):
+    """Turn a blocking route handler into an async one that runs on pool;
+    only read-only handlers should pass a timeout."""
+    def decorator(handler):
+        async def route(*args, **kwargs):
+            return await run_in_pool(pool, lambda: handler(*args, **kwargs), timeout=timeout)
+        # FastAPI reads the parameters off the signature
+        route.__name__ = handler.__name__
+        route.__doc__ = handler.__doc__
+        route.__signature__ = inspect.signature(handler)
+        return route
+    return decorator
+
+
+HTTP_SECONDS = metrics.histogram(
+    "dormika_http_request_duration_seconds", "Time to answer an API request.", ("router",))
+HTTP_REQUESTS = metrics.counter(
+    "dormika_http_requests_total", "API requests by router, method and status.",
+    ("router", "method", "status"))
+ROOMS = metrics.gauge("dormika_rooms", "Rooms by status.", ("status",))
+UNPAID_INVOICES = metrics.gauge("dormika_unpaid_invoices", "Invoices not paid yet.")
+OPEN_MAINTENANCE_TICKETS = metrics.gauge(
+    "dormika_open_maintenance_tickets", "Maintenance tickets not resolved yet.")
+OPEN_CLEANING_TICKETS = metrics.gauge(
+    "dormika_open_cleaning_tickets", "Cleaning tickets not finished yet.")
+PENDING_PAYMENTS = metrics.gauge(
+    "dormika_pending_payments", "Payment baskets selected but not paid yet.")
+POOL_PENDING = metrics.gauge(
+    "dormika_pool_pending", "Calls running or waiting in a worker pool.", ("pool",))
+# entity counts walk the whole dorm, so scrapes this close together share one walk
+METRICS_GAUGE_TTL = float(os.environ.get("DORMIKA_METRICS_TTL", 15))
+gauges_refreshed = None
+gauges_lock = threading.Lock()
+
+
+def refresh_entity_gauges():
+    global gauges_refreshed
+    # a scrape arriving mid-walk keeps the last counts instead of walking again
+    if not gauges_lock.acquire(blocking=False):
+        return
+    try:
+        counts = dorm.entity_gauges()
+        for status, count in counts["rooms"].items():
+            ROOMS.labels(status=status).set(count)
+        UNPAID_INVOICES.labels().set(counts["unpaid_invoices"])
+        OPEN_MAINTENANCE_TICKETS.labels().set(counts["open_maintenance_tickets"])
+        OPEN_CLEANING_TICKETS.labels().set(counts["open_cleaning_tickets"])
+        PENDING_PAYMENTS.labels().set(counts["pending_payments"])
+        gauges_refreshed = time.monotonic()
+    finally:
+        gauges_lock.release()
+
+
+def router_of(request):
+    """First path segment of the route the request matched; "other" when none did."""
+    # the template, not the URL, so ids in the path cannot grow the label set
+    path = getattr(request.scope.get("route"), "path", None)
+    if path is None:
+        return "other"
+    return "/" + path.strip("/").split("/")[0]
+
+
+# longest the sweeper sleeps when no hold is due sooner
+HOLD_SWEEP_INTERVAL = 60
+# contract transitions are bucketed per day; checking hourly is plenty
+CONTRACT_LIFECYCLE_INTERVAL = 60 * 60
+
+
+def release_expired_holds():
+    """Release due holds; return when the next one falls due."""
+    dorm.release_expired_holds()
+    return dorm.hold_sweeper.next_expiry
+
+
+async def sweep_expired_holds():
+    while True:
+        next_expiry = None
+        try:
+            next_expiry = await short_pool.run(release_expired_holds)
+        except PoolFullError:
+            # a full pool just means this round is skipped
+            pass
+        except Exception as e:
+            log.error("holds.sweep_failed", error=f"{type(e).__name__}: {e}")
+        delay = HOLD_SWEEP_INTERVAL
+        if next_expiry is not None:
+            delay = min(delay, max(
+                0.0, (next_expiry - datetime.now()).total_seconds()))
+        await asyncio.sleep(delay)
+
+
+async def advance_contract_lifecycle():
+    while True:
+        try:
+            await batch_pool.run(dorm.advance_contract_lifecycle)
+        except PoolFullError:
+            pass
+        except Exception as e:
+            log.error("contracts.lifecycle_failed", error=f"{type(e).__name__}: {e}")
+        await asyncio.sleep(CONTRACT_LIFECYCLE_INTERVAL)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_mock_data()
+    tasks = [
+        asyncio.create_task(sweep_expired_holds()),
+        asyncio.create_task(advance_contract_lifecycle()),
+    ]
     yield
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        with suppress(asyncio.CancelledError):
+            await task
+    short_pool.shutdown()
+    batch_pool.shutdown()
+    if isinstance(dorm, ShardRouter):
+        dorm.close()
+        return
+    if isinstance(dorm.repository, SnapshotRepository):
+        dorm.write_snapshot(DORMIKA_SNAPSHOT)
+    dorm.repository.close()
 
 app = FastAPI(
     title="DormiKa API",
@@ -40,6 +255,20 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        router = router_of(request)
+        HTTP_SECONDS.labels(router=router).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(router=router, method=request.method, status=status).inc()
+
 # ==================== Routers ====================
 
 system_router = APIRouter(prefix="",           tags=["System"])
@@ -52,6 +281,7 @@ payment_router = APIRouter(prefix="/payment",     tags=["Payment"])
 invoice_router = APIRouter(prefix="/invoice",     tags=["Invoice"])
 receipt_router = APIRouter(prefix="/receipt",     tags=["Receipt"])
 facility_router = APIRouter(prefix="/facility",    tags=["Facility"])
+admin_router = APIRouter(prefix="/admin",       tags=["Admin"])
 
 
 # ==================================================
@@ -59,25 +289,93 @@ facility_router = APIRouter(prefix="/facility",    tags=["Facility"])
 # ==================================================
 
 class SystemContractInvoiceBody(BaseModel):
-    employeeId: str = Field(..., example="EM-0001")
+    employeeId:    str = Field(..., example="EM-0001")
+    # defaults to the current month
+    billingPeriod: Optional[str] = Field(None, example="2026-03")
+
+
+# how often a progress stream re-checks a running billing run
+BILLING_STREAM_POLL_INTERVAL = 0.1
+# how long a billing run waits for room in a full batch pool
+BILLING_RETRY_INTERVAL = 1.0
+# run_id -> task driving it, so a resumed run is never driven twice
+billing_tasks = {}
+
+
+async def drive_billing_run(run):
+    try:
+        # one chunk per pool call, so other batch jobs get a turn in between
+        while True:
+            try:
+                if not await batch_pool.run(run.run_chunk):
+                    break
+            except PoolFullError:
+                await asyncio.sleep(BILLING_RETRY_INTERVAL)
+            except asyncio.TimeoutError:
+                # the chunk is still running; the next call waits for it
+                pass
+    except Exception:
+        # the run records its own error for pollers
+        pass
 
 
 @system_router.post("/system-contract-invoice")
 async def system_contract_invoice(request: SystemContractInvoiceBody):
-    """Generate monthly contract invoices for all active residents."""
+    """Start (or resume) the billing run for a period; poll or stream it by run_id."""
+    try:
+        run = await run_in_pool(batch_pool, dorm.start_billing_run,
+                                request.employeeId, request.billingPeriod)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if run.id not in billing_tasks:
+        task = asyncio.create_task(drive_billing_run(run))
+        billing_tasks[run.id] = task
+        task.add_done_callback(lambda _: billing_tasks.pop(run.id, None))
+    return run.to_dict()
+
+
+@system_router.get("/billing-run/{run_id}")
+@offload(short_pool, timeout=READ_TIMEOUT)
+def display_billing_run(run_id: str):
+    """Current status and progress counters of a billing run."""
     try:
-        result = dorm.system_contract_invoice(request.employeeId)
+        result = dorm.display_billing_run(run_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     return result
 
 
+@system_router.get("/billing-run/{run_id}/stream")
+async def stream_billing_run(run_id: str):
+    """Stream billing run progress as NDJSON, one line per change, until it finishes."""
+    try:
+        run = dorm.search_billing_run_by_id(run_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def progress():
+        last = None
+        while True:
+            finished = run.is_finished
+            if run.processed != last or finished:
+                last = run.processed
+                yield json.dumps(run.to_dict()) + "\n"
+            if finished:
+                return
+            await asyncio.sleep(BILLING_STREAM_POLL_INTERVAL)
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+
 class AddStrikeBody(BaseModel):
     employeeId: str = Field(..., example="EM-0001")
 
 
 @system_router.post("/add-strike")
-async def add_strike(request: AddStrikeBody):
+@offload(batch_pool)
+def add_strike(request: AddStrikeBody):
     """Add a strike to a resident's account."""
     try:
         result = dorm.add_strike(request.employeeId)
@@ -86,6 +384,35 @@ async def add_strike(request: AddStrikeBody):
     return result
 
 
+@system_router.get("/vacancy/{building_id}")
+@offload(short_pool, timeout=READ_TIMEOUT)
+def display_vacancy(building_id: str):
+    """Count AVAILABLE rooms per room type in a building."""
+    try:
+        result = dorm.display_vacancy(building_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return result
+
+
+@system_router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Request and workflow latency histograms, counters and entity gauges, in Prometheus text format."""
+    if gauges_refreshed is None or time.monotonic() - gauges_refreshed >= METRICS_GAUGE_TTL:
+        # a slow walk finishes in the background and the next scrape sees it
+        with suppress(PoolFullError, asyncio.TimeoutError):
+            await batch_pool.run(refresh_entity_gauges, timeout=READ_TIMEOUT)
+    for pool in (short_pool, batch_pool):
+        POOL_PENDING.labels(pool=pool.name).set(pool.depth)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@system_router.get("/traces")
+async def recent_traces(limit: int = 20):
+    """Latest sampled workflow traces with their nested model-call spans, newest first."""
+    return {"sample_rate": tracer.sample_rate, "traces": tracer.traces(limit)}
+
+
 # ==================================================
 # RESIDENT
 # ==================================================
@@ -97,7 +424,8 @@ class SignInBody(BaseModel):
 
 
 @resident_router.post("/sign-in")
-async def sign_in(request: SignInBody):
+@offload(short_pool)
+def sign_in(request: SignInBody):
     """Register a new resident account."""
     try:
         result = dorm.sign_in(request.name, request.email, request.phoneNumber)
@@ -106,6 +434,22 @@ async def sign_in(request: SignInBody):
     return {"message": result}
 
 
+class BulkSignInBody(BaseModel):
+    applicants: list[SignInBody]
+
+
+@resident_router.post("/bulk-sign-in")
+@offload(batch_pool)
+def bulk_sign_in(request: BulkSignInBody):
+    """Register many applicants at once, rejecting duplicates and blacklisted contacts."""
+    try:
+        result = dorm.bulk_sign_in(
+            [applicant.model_dump() for applicant in request.applicants])
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return result
+
+
 # ==================================================
 # CONTRACT
 # ==================================================
@@ -117,7 +461,8 @@ class RequestBookingBody(BaseModel):
 
 
 @contract_router.post("/request")
-async def request_booking(request: RequestBookingBody):
+@offload(short_pool)
+def request_booking(request: RequestBookingBody):
     """Request a room booking (holds the room for 48 h)."""
     try:
         result = dorm.request_booking(
@@ -134,7 +479,8 @@ class SignContractBody(BaseModel):
 
 
 @contract_router.post("/sign")
-async def sign_contract(request: SignContractBody):
+@offload(short_pool)
+def sign_contract(request: SignContractBody):
     """Sign a draft contract (moves it to PENDING_SIGN)."""
     try:
         result = dorm.sign_contract(request.contractId)
@@ -148,7 +494,8 @@ class PayContractInvoiceBody(BaseModel):
 
 
 @contract_router.post("/pay")
-async def pay_contract_invoice(request: PayContractInvoiceBody):
+@offload(short_pool)
+def pay_contract_invoice(request: PayContractInvoiceBody):
     """Pay a pending contract invoice directly."""
     try:
         result = dorm.pay_contract_invoice(request.invoiceId)
@@ -165,7 +512,8 @@ class ChangeContractBody(BaseModel):
 
 
 @contract_router.post("/change")
-async def change_contract(request: ChangeContractBody):
+@offload(short_pool)
+def change_contract(request: ChangeContractBody):
     """Move a resident to a different room with a prorated upgrade invoice."""
     try:
         result = dorm.change_contract(
@@ -190,7 +538,8 @@ class HandoverBody(BaseModel):
 
 
 @contract_router.post("/handover")
-async def complete_handover(request: HandoverBody):
+@offload(short_pool)
+def complete_handover(request: HandoverBody):
     try:
         result = dorm.complete_handover(request.contractId)
         return {
@@ -212,7 +561,8 @@ class RequestMaintenanceBody(BaseModel):
 
 
 @maintenance_router.post("/request")
-async def request_maintenance(request: RequestMaintenanceBody):
+@offload(short_pool)
+def request_maintenance(request: RequestMaintenanceBody):
     """Submit a maintenance request — assigns an employee and technician automatically."""
     try:
         result = dorm.request_maintenance(
@@ -230,7 +580,8 @@ class StartMaintenanceBody(BaseModel):
 
 
 @maintenance_router.post("/start")
-async def start_maintenance(request: StartMaintenanceBody):
+@offload(short_pool)
+def start_maintenance(request: StartMaintenanceBody):
     """Technician begins work on their assigned ticket."""
     try:
         result = dorm.start_maintenance_workflow(
@@ -245,7 +596,8 @@ class FinishMaintenanceBody(BaseModel):
 
 
 @maintenance_router.post("/finish")
-async def finish_maintenance(request: FinishMaintenanceBody):
+@offload(short_pool)
+def finish_maintenance(request: FinishMaintenanceBody):
     """Technician marks the ticket resolved — generates an invoice for the resident."""
     try:
         result = dorm.finish_maintenance_workflow(request.technicianId)
@@ -264,7 +616,8 @@ class RequestCleaningBody(BaseModel):
 
 
 @cleaning_router.post("/request")
-async def request_cleaning(request: RequestCleaningBody):
+@offload(short_pool)
+def request_cleaning(request: RequestCleaningBody):
     """Submit a cleaning request for a room — assigns an available cleaner."""
     try:
         result = dorm.request_cleaning_room(request.residentId, request.roomId)
@@ -279,7 +632,8 @@ class CleanRoomBody(BaseModel):
 
 
 @cleaning_router.post("/start")
-async def start_cleaning(request: CleanRoomBody):
+@offload(short_pool)
+def start_cleaning(request: CleanRoomBody):
     try:
         # First assign the room to the cleaner, then start cleaning
         result = dorm.start_cleaning_workflow(
@@ -295,7 +649,8 @@ class FinishCleaningBody(BaseModel):
 
 
 @cleaning_router.post("/finish")
-async def finish_cleaning(request: FinishCleaningBody):
+@offload(short_pool)
+def finish_cleaning(request: FinishCleaningBody):
     """Cleaner finishes the job — generates a cleaning invoice for the resident."""
     try:
         result = dorm.finish_cleaning_workflow(
@@ -316,7 +671,8 @@ class CreateMemberBody(BaseModel):
 
 
 @member_router.post("/create")
-async def create_member(request: CreateMemberBody):
+@offload(short_pool)
+def create_member(request: CreateMemberBody):
     """Assign a membership tier to a resident and create a membership invoice."""
     try:
         result = dorm.create_member(request.residentId, request.memberType)
@@ -337,7 +693,8 @@ class SelectPaymentBody(BaseModel):
 
 
 @payment_router.post("/select")
-async def select_payment(request: SelectPaymentBody):
+@offload(short_pool)
+def select_payment(request: SelectPaymentBody):
     """Choose a payment method and select invoices to pay."""
     try:
         result = dorm.select_payment_method_and_invoices(
@@ -354,7 +711,8 @@ class PayBody(BaseModel):
 
 
 @payment_router.post("/pay")
-async def pay(request: PayBody):
+@offload(short_pool)
+def pay(request: PayBody):
     """Submit payment data to confirm and settle selected invoices."""
     try:
         result = dorm.payment_system(request.residentId, request.paymentData)
@@ -368,7 +726,8 @@ async def pay(request: PayBody):
 # ==================================================
 
 @invoice_router.get("/{resident_id}")
-async def display_invoice(resident_id: str):
+@offload(short_pool, timeout=READ_TIMEOUT)
+def display_invoice(resident_id: str):
     """List all pending invoices for a resident."""
     try:
         result = dorm.display_invoice(resident_id)
@@ -382,7 +741,8 @@ async def display_invoice(resident_id: str):
 # ==================================================
 
 @receipt_router.get("/{resident_id}")
-async def display_receipt(resident_id: str):
+@offload(short_pool, timeout=READ_TIMEOUT)
+def display_receipt(resident_id: str):
     """List all payment receipts for a resident."""
     try:
         result = dorm.display_receipt(resident_id)
@@ -404,7 +764,8 @@ class BookShareFacilityBody(BaseModel):
 
 
 @facility_router.post("/book")
-async def book_share_facility(request: BookShareFacilityBody):
+@offload(short_pool)
+def book_share_facility(request: BookShareFacilityBody):
     """Book a shared facility (meeting room, washing machine, etc.). Creates an invoice automatically."""
     try:
         result = dorm.booking_share_facility(
@@ -418,6 +779,63 @@ async def book_share_facility(request: BookShareFacilityBody):
     return result
 
 
+@facility_router.get("/availability/{building_id}")
+@offload(short_pool, timeout=READ_TIMEOUT)
+def facility_availability(building_id: str, startDate: str, endDate: Optional[str] = None):
+    """List free slots of every shared facility in a building, day by day (YYYY-MM-DD)."""
+    try:
+        result = dorm.display_facility_availability(
+            building_id, startDate, endDate)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return result
+
+
+# ==================================================
+# ADMIN
+# ==================================================
+
+def require_admin(token):
+    if not DORMIKA_ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403, detail="admin endpoints are disabled; set DORMIKA_ADMIN_TOKEN")
+    if token is None or not secrets.compare_digest(token, DORMIKA_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="admin token required")
+
+
+class ProfileBody(BaseModel):
+    durationSeconds: float = Field(10, example=10)
+    intervalMs:      float = Field(5, example=5)
+    # also count threads waiting on a lock, queue or socket
+    includeIdle:     bool = Field(False, example=False)
+    # collapsed: one "frame;...;leaf count" line per stack, for flamegraph.pl
+    # or speedscope; json: the same counts with sampling details
+    format:          str = Field("collapsed", example="collapsed")
+
+
+@admin_router.post("/profile")
+async def profile_process(request: ProfileBody,
+                          x_admin_token: Optional[str] = Header(None)):
+    """Sample every thread's stack for a while and return the counts; with
+    DORMIKA_SHARDS > 1 the shard processes are sampled too."""
+    require_admin(x_admin_token)
+    if request.format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'json'")
+    profile = dorm.profile if isinstance(dorm, ShardRouter) else profiler.profile
+    try:
+        # sampling sleeps between stacks, so it waits on its own thread, not a pool's
+        result = await asyncio.to_thread(
+            profile, request.durationSeconds, request.intervalMs / 1000,
+            request.includeIdle)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.format == "json":
+        return result
+    return PlainTextResponse(collapsed_text(result))
+
+
 # ==================== Register Routers ====================
 
 app.include_router(system_router)
@@ -430,6 +848,7 @@ app.include_router(payment_router)
 app.include_router(invoice_router)
 app.include_router(receipt_router)
 app.include_router(facility_router)
+app.include_router(admin_router)
 
 if __name__ == "__main__":
     uvicorn.run("dormika_api:app", host="127.0.0.1", port=8000,
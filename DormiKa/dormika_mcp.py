@@ -1,9 +1,16 @@
 from fastmcp import FastMCP
 from pydantic import BaseModel, Field
 from typing import Optional
+import asyncio
+import os
+import secrets
 import tester as tester_data
 
 from models.dorm import *
+from models.repository import SQLiteRepository
+from models.journal import JournalRepository
+from models.snapshot import SnapshotRepository
+from models.id_allocator import ids, SQLiteIdStore
 from models.enum import *
 from models.invoice import *
 from models.member import *
@@ -21,6 +28,7 @@ from models.staff import *
 from models.contract import *
 from models.employee import *
 from models.resident import *
+from models.profiler import profiler, collapsed_text, ProfilerBusyError
 
 
 # ==================== Global Dorm State ====================
@@ -28,9 +36,35 @@ from models.resident import *
 dorm: Dorm = None
 
 
+# set DORMIKA_DB to a file path, or DORMIKA_JOURNAL to a directory,
+# to keep state across restarts
+DORMIKA_DB = os.environ.get("DORMIKA_DB")
+DORMIKA_JOURNAL = os.environ.get("DORMIKA_JOURNAL")
+# or DORMIKA_SNAPSHOT to a file path to start from a memory-mapped snapshot
+DORMIKA_SNAPSHOT = os.environ.get("DORMIKA_SNAPSHOT")
+# SQLite file holding id high-water marks, shared by every worker process
+DORMIKA_IDS = os.environ.get("DORMIKA_IDS")
+# admin tools run only when called with this token; unset disables them
+DORMIKA_ADMIN_TOKEN = os.environ.get("DORMIKA_ADMIN_TOKEN")
+
+
 def init_mock_data():
     global dorm
-    dorm = tester_data.init_mock_data()
+    if DORMIKA_IDS:
+        ids.use_store(SQLiteIdStore(DORMIKA_IDS))
+    if DORMIKA_JOURNAL:
+        dorm = Dorm.open(JournalRepository(DORMIKA_JOURNAL),
+                         seed=tester_data.init_mock_data)
+    elif DORMIKA_DB:
+        dorm = Dorm.open(SQLiteRepository(DORMIKA_DB),
+                         seed=tester_data.init_mock_data)
+    elif DORMIKA_SNAPSHOT:
+        dorm = Dorm.open(SnapshotRepository(DORMIKA_SNAPSHOT),
+                         seed=tester_data.init_mock_data)
+        if not os.path.exists(DORMIKA_SNAPSHOT):
+            dorm.write_snapshot(DORMIKA_SNAPSHOT)
+    else:
+        dorm = tester_data.init_mock_data()
 
 # ==================== FastMCP ====================
 
@@ -43,8 +77,10 @@ init_mock_data()
 # ==================================================
 
 class SystemContractInvoiceRequest(BaseModel):
-    employeeId: str = Field(...,
-                            description="Employee ID who triggers billing, e.g. EM-0001")
+    employeeId:    str = Field(...,
+                               description="Employee ID who triggers billing, e.g. EM-0001")
+    billingPeriod: Optional[str] = Field(
+        None, description="Billing month in YYYY-MM format (defaults to the current month)")
 
 
 @mcp.tool()
@@ -52,6 +88,8 @@ def system_contract_invoice(request: SystemContractInvoiceRequest) -> dict:
     """
     Generate monthly rent invoices for residents that currently have contracts.
     An employee must authorize this batch billing process.
+    Each contract is billed at most once per billing period, so re-running
+    is safe and an interrupted run resumes where it stopped.
 
     Use when:
     - It is the start of a new billing month
@@ -62,7 +100,8 @@ def system_contract_invoice(request: SystemContractInvoiceRequest) -> dict:
         "Run the monthly billing cycle authorized by EM-0002 for DormiKa mock data."
     """
     try:
-        result = dorm.system_contract_invoice(request.employeeId)
+        result = dorm.system_contract_invoice(
+            request.employeeId, request.billingPeriod)
     except Exception as e:
         return {"error": str(e)}
     return {"message": result}
@@ -98,6 +137,46 @@ def add_strike(request: AddStrikeRequest) -> dict:
         return {"error": str(e)}
     return {"message": result}
 
+
+class ProfileRequest(BaseModel):
+    adminToken:      str = Field(..., description="The server's DORMIKA_ADMIN_TOKEN")
+    durationSeconds: float = Field(10, description="How long to sample, at most 120 seconds")
+    intervalMs:      float = Field(5, description="Milliseconds between stack samples")
+    includeIdle:     bool = Field(
+        False, description="Also count threads waiting on a lock, queue or socket")
+
+
+@mcp.tool()
+async def profile_process(request: ProfileRequest) -> dict:
+    """
+    Profile this server process for a few seconds by sampling every thread's stack.
+    Returns collapsed stacks ("frame;...;leaf count" per line), which flamegraph.pl
+    or speedscope turn into a flamegraph. Admin only.
+
+    Use when:
+    - The server is using more CPU than expected, e.g. during add_strike
+    - Finding which workflow or model call is slow under real load
+
+    Example prompt:
+        "Profile the server for 15 seconds while the strike run is going. Admin token is ..."
+    """
+    if not DORMIKA_ADMIN_TOKEN:
+        return {"error": "admin tools are disabled; set DORMIKA_ADMIN_TOKEN"}
+    if not secrets.compare_digest(request.adminToken, DORMIKA_ADMIN_TOKEN):
+        return {"error": "admin token required"}
+    try:
+        # sampling blocks for the whole duration; keep it off the server's event loop
+        result = await asyncio.to_thread(
+            profiler.profile, request.durationSeconds, request.intervalMs / 1000,
+            request.includeIdle)
+    except (ProfilerBusyError, ValueError) as e:
+        return {"error": str(e)}
+    return {
+        "duration_s": result["duration_s"],
+        "samples": result["samples"],
+        "collapsed": collapsed_text(result),
+    }
+
 # ==================================================
 # RESIDENT
 # ==================================================
@@ -117,15 +196,15 @@ def sign_in(request: SignInRequest) -> dict:
     """
     Register a new resident account in the dormitory system.
     Validates name (letters only), email format, and phone (10 digits).
-    Rejects if the email or phone is blacklisted.
+    Rejects if the email or phone is blacklisted or already registered.
 
     Use when:
     - A new person wants to register as a resident
     - Someone asks to create a new account
 
     Example prompt:
-        "Register a new resident named Fill, email fill@gmail.com, phone 123-456-7890."
-        "Sign up a new tenant: name Nara, email nara@example.com, phone 123-456-7800."
+        "Register a new resident named Fill, email fill@gmail.com, phone 123-456-7800."
+        "Sign up a new tenant: name Nara, email nara@example.com, phone 123-456-7801."
     """
     try:
         result = dorm.sign_in(request.name, request.email, request.phoneNumber)
@@ -662,7 +741,8 @@ class BookFacilityRequest(BaseModel):
 def book_share_facility(request: BookFacilityRequest) -> dict:
     """
     Book a shared facility (meeting room or washing machine) in a building.
-    Will fail if the facility is already booked at the requested time.
+    Each booking holds a one-hour slot starting at the requested time.
+    Will fail if the slot overlaps an existing booking of the facility.
     Automatically creates a facility usage invoice for the resident.
 
     Facility costs:
@@ -689,6 +769,36 @@ def book_share_facility(request: BookFacilityRequest) -> dict:
         return {"error": str(e)}
     return result
 
+
+class FacilityAvailabilityRequest(BaseModel):
+    buildingId: str = Field(..., description="Building ID, e.g. A01")
+    startDate:  str = Field(...,
+                            description="First day in YYYY-MM-DD format, e.g. 2026-03-15")
+    endDate:    Optional[str] = Field(
+        None, description="Last day in YYYY-MM-DD format (defaults to startDate, at most 31 days)")
+
+
+@mcp.tool()
+def facility_availability(request: FacilityAvailabilityRequest) -> dict:
+    """
+    List the free time slots of every washing machine and meeting room in a building,
+    day by day, so a booking can be made without guessing.
+
+    Use when:
+    - A resident asks when a washing machine or meeting room is free
+    - Before book_share_facility, to pick a time that will succeed
+
+    Example prompt:
+        "When is the washing machine in building A01 free on 2026-03-15?"
+        "Show free meeting room slots in A01 from 2026-03-15 to 2026-03-17."
+    """
+    try:
+        result = dorm.display_facility_availability(
+            request.buildingId, request.startDate, request.endDate)
+    except Exception as e:
+        return {"error": str(e)}
+    return result
+
 # ==================== Entrypoint ====================
 
 
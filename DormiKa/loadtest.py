@@ -0,0 +1,431 @@
+"""In-process load generator for dormika_api.
+
+    python loadtest.py --residents 20000 --concurrency 64 --duration 30
+    python loadtest.py --rate 200 --mix booking=5,payment=3,reads=2 --json run.json
+
+Requests go straight into the ASGI app, so no server or network is
+involved, but routing, validation and the worker pools all are. Each
+virtual user runs whole flows picked from --mix:
+
+    booking      POST /contract/request -> /contract/sign -> /contract/pay
+    cleaning     POST /cleaning/request -> /cleaning/start -> /cleaning/finish
+    maintenance  POST /maintenance/request -> /maintenance/start -> /maintenance/finish
+    payment      GET /invoice/{id} -> POST /payment/select -> /payment/pay
+    reads        GET /invoice/{id}, /receipt/{id}, /vacancy/{building}
+
+maintenance is not in the default mix: the approving employee is never
+made available again, so each request uses one up and, once the dorm's
+employees are all taken, the flow fails with "No employee are
+available". A generated dataset has max(2, buildings // 5) of them.
+
+With --rate 0, --concurrency users run flows back to back (closed loop).
+Otherwise flows arrive at --rate per second (Poisson) and at most
+--concurrency run at once; arrivals beyond that are dropped and counted.
+The report gives per-router throughput, error rate, latency percentiles
+and a latency histogram. A response counts as an error when its status
+is 4xx/5xx or when it carries a workflow error in a 200 body.
+
+The app serves a dataset from dataset.generate() with --residents
+residents; --residents 0 keeps whatever the app loads itself (mock data,
+or the DORMIKA_* store). A generated dataset replaces the app's dorm
+after startup, so it is refused when a store or shards are configured:
+their files and processes would be left open.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from urllib.parse import urlencode
+
+# the workflows log every success; keep that cost but not the output
+os.environ.setdefault("DORMIKA_LOG", os.devnull)
+
+from models.enum import *
+
+
+DEFAULT_MIX = "booking=2,cleaning=2,payment=1,reads=4"
+# upper bounds, in ms, of the histogram buckets; the last bucket is open
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+CARD_PAYMENT = "666777, Loadtest, 12/99, 123"
+
+
+class AsgiClient:
+    """Drives an ASGI app in the current event loop: lifespan, then HTTP requests."""
+
+    def __init__(self, app):
+        self.__app = app
+        self.__lifespan = None
+        self.__to_app = None
+        self.__from_app = None
+
+    async def __aenter__(self):
+        self.__to_app = asyncio.Queue()
+        self.__from_app = asyncio.Queue()
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self.__lifespan = asyncio.create_task(
+            self.__app(scope, self.__to_app.get, self.__from_app.put))
+        await self.__to_app.put({"type": "lifespan.startup"})
+        message = await self.__from_app.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"app failed to start: {message.get('message', '')}")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.__to_app.put({"type": "lifespan.shutdown"})
+        await self.__from_app.get()
+        await self.__lifespan
+
+    async def request(self, method, path, body=None, query=None):
+        """Send one request; return (status, decoded JSON body or None)."""
+        payload = b"" if body is None else json.dumps(body).encode()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": urlencode(query or {}).encode(),
+            "root_path": "",
+            "headers": [
+                (b"host", b"loadtest"),
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+            ],
+            "client": ("127.0.0.1", 0),
+            "server": ("loadtest", 80),
+        }
+        responded = asyncio.Event()
+        request_sent = False
+        status = None
+        chunks = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            # anything listening for a disconnect gets one once the response is out
+            await responded.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    responded.set()
+
+        try:
+            await self.__app(scope, receive, send)
+        finally:
+            responded.set()
+        raw = b"".join(chunks)
+        try:
+            return status, json.loads(raw) if raw else None
+        except ValueError:
+            return status, raw.decode(errors="replace")
+
+
+class RouterStats:
+    """Latencies and outcomes of the requests to one router."""
+
+    def __init__(self):
+        self.__latencies = []
+        self.__errors = 0
+        self.__statuses = {}
+
+    def record(self, latency, status, failed):
+        self.__latencies.append(latency)
+        self.__errors += failed
+        self.__statuses[status] = self.__statuses.get(status, 0) + 1
+
+    def summary(self, elapsed):
+        latencies = sorted(self.__latencies)
+        count = len(latencies)
+        histogram = {f"<={bound}ms": 0 for bound in LATENCY_BUCKETS_MS}
+        histogram[f">{LATENCY_BUCKETS_MS[-1]}ms"] = 0
+        labels = list(histogram)
+        bucket = 0
+        for latency in latencies:
+            while bucket < len(LATENCY_BUCKETS_MS) and latency * 1000 > LATENCY_BUCKETS_MS[bucket]:
+                bucket += 1
+            histogram[labels[bucket]] += 1
+        return {
+            "requests": count,
+            "errors": self.__errors,
+            "error_rate": round(self.__errors / count, 4) if count else 0.0,
+            "rps": round(count / elapsed, 1) if elapsed else None,
+            "p50_ms": _percentile_ms(latencies, 0.50),
+            "p90_ms": _percentile_ms(latencies, 0.90),
+            "p99_ms": _percentile_ms(latencies, 0.99),
+            "max_ms": _percentile_ms(latencies, 1.0),
+            "statuses": {str(code): n for code, n in sorted(
+                self.__statuses.items(), key=lambda item: str(item[0]))},
+            "histogram": histogram,
+        }
+
+
+def _percentile_ms(ordered, fraction):
+    if not ordered:
+        return None
+    return round(ordered[max(0, math.ceil(fraction * len(ordered)) - 1)] * 1000, 3)
+
+
+def _failed(status, payload):
+    if status is None or status >= 400:
+        return True
+    # some workflows answer 200 with show_error's {"error": ...}
+    return isinstance(payload, dict) and set(payload) == {"error"}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in LoadTest.FLOWS:
+            raise ValueError(f"unknown flow '{name}'; choose from {', '.join(LoadTest.FLOWS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadTest:
+    """Runs the flow mix against the app through an AsgiClient and collects stats."""
+
+    FLOWS = ("booking", "cleaning", "maintenance", "payment", "reads")
+
+    def __init__(self, client, dorm, mix, seed=0):
+        self.__client = client
+        self.__rng = random.Random(seed)
+        self.__routers = {}
+        self.__flows = {name: {"started": 0, "completed": 0} for name in mix}
+        self.__dropped = 0
+        self.__names = list(mix)
+        self.__weights = [mix[name] for name in self.__names]
+
+        residents = list(dorm.residents)
+        self.__tenants = [
+            (resident.id, contract.room.id)
+            for resident in residents
+            for contract in resident.contracts[-1:]
+            if contract.status == ContractStatus.ACTIVE
+        ]
+        # anyone may book; residents without a contract are the usual case
+        self.__applicants = [resident.id for resident in residents
+                             if not resident.contracts] or [resident.id for resident in residents]
+        self.__residents = [resident.id for resident in residents]
+        self.__buildings = [building.id for building in dorm.buildings]
+        self.__cleaners = [cleaner.id for cleaner in dorm.cleaners]
+        self.__employees = len(dorm.employees)
+        needs = {
+            "booking": (self.__applicants, self.__buildings),
+            "cleaning": (self.__tenants, self.__cleaners),
+            "maintenance": (self.__tenants,),
+            "payment": (self.__residents,),
+            "reads": (self.__residents, self.__buildings),
+        }
+        for name in mix:
+            if not all(needs[name]):
+                raise ValueError(f"the served dorm has nothing to run the {name} flow on")
+
+    async def call(self, method, path, body=None):
+        """One request, recorded under its router; returns the body, or None on failure."""
+        router = "/" + path.strip("/").split("/")[0]
+        started = time.perf_counter()
+        try:
+            status, payload = await self.__client.request(method, path, body)
+        except Exception as e:
+            status, payload = None, str(e)
+        failed = _failed(status, payload)
+        self.__routers.setdefault(router, RouterStats()).record(
+            time.perf_counter() - started, status or "exception", failed)
+        return None if failed else payload
+
+    async def booking(self):
+        rng = self.__rng
+        booked = await self.call("POST", "/contract/request", {
+            "residentId": rng.choice(self.__applicants),
+            "buildingId": rng.choice(self.__buildings),
+            "roomType": rng.choice(list(RoomType)).value,
+        })
+        if booked is None:
+            return False
+        signed = await self.call("POST", "/contract/sign", {"contractId": booked["contract_id"]})
+        if signed is None:
+            return False
+        return await self.call("POST", "/contract/pay", {"invoiceId": signed["invoice_id"]}) is not None
+
+    async def cleaning(self):
+        resident_id, room_id = self.__rng.choice(self.__tenants)
+        requested = await self.call("POST", "/cleaning/request",
+                                    {"residentId": resident_id, "roomId": room_id})
+        if requested is None:
+            return False
+        job = {"cleanerId": self.__rng.choice(self.__cleaners), "roomId": room_id}
+        if await self.call("POST", "/cleaning/start", job) is None:
+            return False
+        return await self.call("POST", "/cleaning/finish", job) is not None
+
+    async def maintenance(self):
+        resident_id, room_id = self.__rng.choice(self.__tenants)
+        requested = await self.call("POST", "/maintenance/request", {
+            "residentId": resident_id,
+            "roomId": room_id,
+            "issueCategory": self.__rng.choice(list(IssueCategory)).value,
+        })
+        if requested is None:
+            return False
+        job = {"technicianId": requested["technician"]}
+        if await self.call("POST", "/maintenance/start", job) is None:
+            return False
+        return await self.call("POST", "/maintenance/finish", job) is not None
+
+    async def payment(self):
+        resident_id = self.__rng.choice(self.__residents)
+        pending = await self.call("GET", f"/invoice/{resident_id}")
+        if not pending or not pending.get("invoices"):
+            return pending is not None
+        selected = await self.call("POST", "/payment/select", {
+            "residentId": resident_id,
+            "paymentMethod": "card",
+            "invoiceIds": pending["invoices"][0]["invoice_id"],
+        })
+        if selected is None:
+            return False
+        return await self.call("POST", "/payment/pay", {
+            "residentId": resident_id, "paymentData": CARD_PAYMENT}) is not None
+
+    async def reads(self):
+        resident_id = self.__rng.choice(self.__residents)
+        results = await asyncio.gather(
+            self.call("GET", f"/invoice/{resident_id}"),
+            self.call("GET", f"/receipt/{resident_id}"),
+            self.call("GET", f"/vacancy/{self.__rng.choice(self.__buildings)}"),
+        )
+        return all(result is not None for result in results)
+
+    async def run_flow(self):
+        name = self.__rng.choices(self.__names, self.__weights)[0]
+        counts = self.__flows[name]
+        counts["started"] += 1
+        if await getattr(self, name)():
+            counts["completed"] += 1
+
+    async def run(self, concurrency, rate, duration):
+        """Generate load for duration seconds and return the report."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + duration
+        if rate:
+            in_flight = set()
+            while loop.time() < deadline:
+                if len(in_flight) < concurrency:
+                    task = asyncio.create_task(self.run_flow())
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+                else:
+                    self.__dropped += 1
+                await asyncio.sleep(self.__rng.expovariate(rate))
+            await asyncio.gather(*in_flight)
+        else:
+            async def user():
+                while loop.time() < deadline:
+                    await self.run_flow()
+            await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = loop.time() - started
+
+        routers = {router: stats.summary(elapsed)
+                   for router, stats in sorted(self.__routers.items())}
+        requests = sum(stats["requests"] for stats in routers.values())
+        errors = sum(stats["errors"] for stats in routers.values())
+        return {
+            "concurrency": concurrency,
+            "rate": rate,
+            "elapsed_s": round(elapsed, 2),
+            "requests": requests,
+            "rps": round(requests / elapsed, 1) if elapsed else None,
+            "error_rate": round(errors / requests, 4) if requests else 0.0,
+            "flows": self.__flows,
+            "dropped_flows": self.__dropped,
+            "employees": self.__employees,
+            "routers": routers,
+        }
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['elapsed_s']}s: {report['rps']} req/s, "
+          f"{report['error_rate']:.1%} errors"
+          + (f", {report['dropped_flows']} flows dropped" if report["dropped_flows"] else ""))
+    for name, counts in report["flows"].items():
+        print(f"  {name:<12} {counts['completed']}/{counts['started']} flows completed")
+    if "maintenance" in report["flows"]:
+        print(f"  (maintenance completes at most {report['employees']} flows: "
+              "employees are not freed after a request)")
+    print(f"\n{'router':<13} {'requests':>9} {'req/s':>8} {'errors':>7} {'p50 ms':>9} "
+          f"{'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}  statuses")
+    for router, stats in report["routers"].items():
+        statuses = " ".join(f"{code}:{n}" for code, n in stats["statuses"].items())
+        print(f"{router:<13} {stats['requests']:>9} {stats['rps']:>8} "
+              f"{stats['error_rate']:>7.1%} {stats['p50_ms']:>9} {stats['p90_ms']:>9} "
+              f"{stats['p99_ms']:>9} {stats['max_ms']:>9}  {statuses}")
+    print("\nlatency histogram (requests per bucket)")
+    labels = list(next(iter(report["routers"].values()))["histogram"]) if report["routers"] else []
+    print(f"{'router':<13} " + " ".join(f"{label:>8}" for label in labels))
+    for router, stats in report["routers"].items():
+        print(f"{router:<13} " + " ".join(f"{n:>8}" for n in stats["histogram"].values()))
+
+
+async def main_async(args):
+    import dormika_api as api
+
+    async with AsgiClient(api.app) as client:
+        if args.residents:
+            from dataset import generate
+            # about one room per resident, most of them let, as in term time
+            api.dorm = generate(buildings=max(1, math.ceil(args.residents / 100)), floors=5,
+                                rooms_per_floor=20, residents=args.residents,
+                                occupancy=args.occupancy, seed=args.seed)
+        test = LoadTest(client, api.dorm, parse_mix(args.mix), args.seed)
+        report = await test.run(args.concurrency, args.rate, args.duration)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nsaved to {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test dormika_api in process")
+    parser.add_argument("--residents", type=int, default=2000,
+                        help="size of the generated dataset; 0 keeps the app's own data")
+    parser.add_argument("--occupancy", type=float, default=0.85)
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="virtual users, or the cap on flows in flight with --rate")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="flows started per second; 0 runs a closed loop")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="flow=weight pairs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this JSON file")
+    args = parser.parse_args()
+    if args.residents:
+        import dormika_api as api
+        configured = [name for name in ("DORMIKA_DB", "DORMIKA_JOURNAL", "DORMIKA_SNAPSHOT")
+                      if getattr(api, name)]
+        if api.DORMIKA_SHARDS > 1:
+            configured.append("DORMIKA_SHARDS")
+        if configured:
+            parser.error(f"--residents cannot be used with {', '.join(configured)} set; "
+                         "pass --residents 0 to load-test the configured dorm")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import threading
+from array import array
+from datetime import datetime
+from .enum import InvoiceStatus
+from .tracing import traced
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; fall back to stdlib arrays
+    np = None
+
+
+class AgingEngine:
+    """Columnar overdue-invoice aging used by the monthly strike audit.
+
+    Every outstanding invoice is a row in flat columns (owner slot and
+    creation time), kept in step as invoices are issued, paid or
+    cancelled and residents come and go; strike tiers are then computed
+    for all rows at once, vectorized with NumPy when it is installed.
+    Residents added in bulk are only read on the next strikes().
+    """
+
+    SECONDS_PER_DAY = 86400
+    DAYS_PER_MONTH = 30
+    MAX_STRIKE = 3
+    SETTLED = (InvoiceStatus.PAID, InvoiceStatus.CANCELLED)
+
+    def __init__(self, residents=()):
+        self.__owners = array("q")
+        self.__created = array("d")
+        # invoice id of each row, and the row of each invoice id
+        self.__row_invoices = []
+        self.__rows = {}
+        # resident id -> slot; slot -> resident, None once removed
+        self.__slots = {}
+        self.__residents = []
+        self.__pending = list(residents)
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        with self.__lock:
+            self.__load_pending()
+            return len(self.__owners)
+
+    def add_resident(self, resident):
+        with self.__lock:
+            self.__pending.append(resident)
+
+    def remove_resident(self, resident):
+        with self.__lock:
+            self.__load_pending()
+            slot = self.__slots.pop(resident.id, None)
+            if slot is None:
+                return
+            self.__residents[slot] = None
+            for invoice in resident.invoices:
+                self.__remove_row(invoice.id)
+
+    def track(self, resident, invoice):
+        """Add a newly issued invoice of resident."""
+        if invoice.status in AgingEngine.SETTLED:
+            return
+        with self.__lock:
+            self.__add_row(self.__slot(resident), invoice)
+
+    def untrack(self, invoice):
+        """Drop an invoice once it is paid or cancelled."""
+        with self.__lock:
+            self.__remove_row(invoice.id)
+
+    def __load_pending(self):
+        pending, self.__pending = self.__pending, []
+        for resident in pending:
+            slot = self.__slot(resident)
+            for invoice in resident.invoices:
+                if invoice.status not in AgingEngine.SETTLED:
+                    self.__add_row(slot, invoice)
+
+    def __slot(self, resident):
+        slot = self.__slots.get(resident.id)
+        if slot is None:
+            slot = self.__slots[resident.id] = len(self.__residents)
+            self.__residents.append(resident)
+        return slot
+
+    def __add_row(self, slot, invoice):
+        if invoice.id in self.__rows:
+            return
+        self.__rows[invoice.id] = len(self.__row_invoices)
+        self.__row_invoices.append(invoice.id)
+        self.__owners.append(slot)
+        self.__created.append(invoice.date_create.timestamp())
+
+    def __remove_row(self, invoice_id):
+        row = self.__rows.pop(invoice_id, None)
+        if row is None:
+            return
+        # the last row fills the hole, so the columns stay dense
+        last = len(self.__row_invoices) - 1
+        if row != last:
+            moved = self.__row_invoices[last]
+            self.__row_invoices[row] = moved
+            self.__owners[row] = self.__owners[last]
+            self.__created[row] = self.__created[last]
+            self.__rows[moved] = row
+        self.__row_invoices.pop()
+        self.__owners.pop()
+        self.__created.pop()
+
+    @traced
+    def strikes(self, now: datetime = None):
+        """(resident, highest strike tier) for every resident with a tier above 0."""
+        now = (now or datetime.now()).timestamp()
+        with self.__lock:
+            self.__load_pending()
+            if not self.__owners:
+                return []
+            if np is not None:
+                max_strike = self.__strikes_numpy(now)
+            else:
+                max_strike = self.__strikes_array(now)
+            return [(self.__residents[slot], tier)
+                    for slot, tier in enumerate(max_strike)
+                    if tier > 0 and self.__residents[slot] is not None]
+
+    @staticmethod
+    def strike_of(resident, now: datetime = None):
+        """Highest strike tier of one resident, read from their invoices."""
+        now = (now or datetime.now()).timestamp()
+        max_strike = 0
+        for invoice in resident.invoices:
+            if invoice.status in AgingEngine.SETTLED:
+                continue
+            days = (now - invoice.date_create.timestamp()) // AgingEngine.SECONDS_PER_DAY
+            tier = int(min(max(days // AgingEngine.DAYS_PER_MONTH, 0),
+                           AgingEngine.MAX_STRIKE))
+            max_strike = max(max_strike, tier)
+        return max_strike
+
+    def __strikes_numpy(self, now):
+        owners = np.frombuffer(self.__owners, dtype=np.int64)
+        created = np.frombuffer(self.__created, dtype=np.float64)
+        days = np.floor((now - created) / AgingEngine.SECONDS_PER_DAY)
+        tiers = np.clip(days // AgingEngine.DAYS_PER_MONTH,
+                        0, AgingEngine.MAX_STRIKE).astype(np.int64)
+        max_strike = np.zeros(len(self.__residents), dtype=np.int64)
+        np.maximum.at(max_strike, owners, tiers)
+        # let go of the buffers, or the columns could not grow again
+        del owners, created
+        return max_strike.tolist()
+
+    def __strikes_array(self, now):
+        max_strike = array("q", [0]) * len(self.__residents)
+        for owner, created in zip(self.__owners, self.__created):
+            days = (now - created) // AgingEngine.SECONDS_PER_DAY
+            tier = int(min(max(days // AgingEngine.DAYS_PER_MONTH, 0),
+                           AgingEngine.MAX_STRIKE))
+            if tier > max_strike[owner]:
+                max_strike[owner] = tier
+        return max_strike.tolist()
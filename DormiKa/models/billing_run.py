@@ -0,0 +1,195 @@
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from .enum import BillingRunStatus, ContractStatus
+from .id_allocator import next_id
+from .tracing import traced
+
+
+class BillingLedger:
+    """Set of (contract_id, billing period) pairs that already have a rent invoice."""
+
+    def __init__(self):
+        self.__billed = set()
+        # restored pairs, only read when the ledger is first used
+        self.__restored = None
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__settled())
+
+    def __iter__(self):
+        return iter(self.__settled())
+
+    def restore(self, entries):
+        self.__restored = entries
+
+    def __settled(self):
+        if self.__restored is not None:
+            with self.__lock:
+                if self.__restored is not None:
+                    self.__billed.update(map(tuple, self.__restored))
+                    self.__restored = None
+        return self.__billed
+
+    def is_billed(self, contract_id, period):
+        return (contract_id, period) in self.__settled()
+
+    def mark_billed(self, contract_id, period):
+        self.__settled().add((contract_id, period))
+
+
+class BillingRun:
+    """One monthly rent billing pass, processed a bounded chunk at a time.
+
+    Progress is checkpointed per contract, so a failed run resumes from its
+    cursor, and the ledger keeps any run from billing a period twice.
+    """
+
+    CHUNK_SIZE = 500
+    # contracts in these states no longer owe rent
+    CLOSED_STATUSES = (ContractStatus.TERMINATED, ContractStatus.EXPIRED)
+
+    def __init__(self, employee, contracts, period, ledger, chunk_size: int = None, on_chunk=None,
+                 guard=None):
+        self.__id = f"BR-{next_id('billing_run'):04d}"
+        self.__employee = employee
+        self.__contracts = contracts
+        self.__period = period
+        self.__ledger = ledger
+        # on_chunk(entities, ledger_keys) is told what each chunk changed
+        self.__on_chunk = on_chunk
+        # guard(resident, room) is the context each contract is billed under
+        self.__guard = guard
+        # one chunk at a time, whichever thread drives the run
+        self.__lock = threading.Lock()
+        self.__chunk_size = chunk_size or BillingRun.CHUNK_SIZE
+        self.__total = len(contracts)
+        self.__cursor = 0
+        self.__invoices_issued = 0
+        self.__skipped = 0
+        self.__status = BillingRunStatus.PENDING
+        self.__error = None
+        self.__date_create = datetime.now()
+        self.__date_finish = None
+
+    @property
+    def id(self):
+        return self.__id
+
+    @property
+    def status(self):
+        return self.__status
+
+    @property
+    def period(self):
+        return self.__period
+
+    @staticmethod
+    def parse_period(period: str = None) -> str:
+        if period is None:
+            return datetime.now().strftime("%Y-%m")
+        try:
+            return datetime.strptime(period.strip(), "%Y-%m").strftime("%Y-%m")
+        except ValueError:
+            raise ValueError("billing period must be in YYYY-MM format")
+
+    @property
+    def processed(self):
+        return self.__cursor
+
+    @property
+    def invoices_issued(self):
+        return self.__invoices_issued
+
+    @property
+    def skipped(self):
+        return self.__skipped
+
+    @property
+    def is_finished(self):
+        return self.__status in (BillingRunStatus.COMPLETED, BillingRunStatus.FAILED)
+
+    @property
+    def cursor(self):
+        return self.__cursor
+
+    @traced
+    def run_chunk(self) -> bool:
+        """Bill the next chunk of contracts; return True while work remains."""
+        with self.__lock:
+            return self.__run_chunk()
+
+    def __run_chunk(self):
+        if self.is_finished:
+            return False
+        self.__status = BillingRunStatus.RUNNING
+        try:
+            end = min(self.__cursor + self.__chunk_size, self.__total)
+            touched = []
+            billed = []
+            for resident, contract in self.__contracts[self.__cursor:end]:
+                with self.__guard(resident, contract.room) if self.__guard else nullcontext():
+                    self.__bill(resident, contract, touched, billed)
+                self.__cursor += 1
+            if self.__on_chunk is not None:
+                self.__on_chunk(touched, billed)
+        except Exception as e:
+            self.__finish(BillingRunStatus.FAILED)
+            self.__error = str(e)
+            raise
+        if self.__cursor >= self.__total:
+            self.__finish(BillingRunStatus.COMPLETED)
+            return False
+        return True
+
+    def __bill(self, resident, contract, touched, billed):
+        if contract.status in BillingRun.CLOSED_STATUSES:
+            return
+        if self.__ledger.is_billed(contract.id, self.__period):
+            self.__skipped += 1
+            return
+        invoice = self.__employee.create_contract_invoice(
+            contract.room.monthly_rent,
+            contract.room.id,
+        )
+        resident.add_invoice(invoice)
+        self.__ledger.mark_billed(contract.id, self.__period)
+        self.__invoices_issued += 1
+        touched.extend((resident, invoice))
+        billed.append((contract.id, self.__period))
+
+    def resume(self):
+        """Clear a failure so the next run_chunk() continues from the cursor."""
+        if self.__status == BillingRunStatus.FAILED:
+            self.__status = BillingRunStatus.PENDING
+            self.__error = None
+            self.__date_finish = None
+        return self
+
+    def run_to_completion(self):
+        while self.run_chunk():
+            pass
+        return self
+
+    def __finish(self, status):
+        self.__status = status
+        self.__date_finish = datetime.now()
+        # a failed run keeps its snapshot so it can resume
+        if status == BillingRunStatus.COMPLETED:
+            self.__contracts = []
+
+    def to_dict(self):
+        return {
+            "run_id": self.__id,
+            "employee_id": self.__employee.id,
+            "billing_period": self.__period,
+            "status": self.__status.value,
+            "total": self.__total,
+            "processed": self.__cursor,
+            "invoices_issued": self.__invoices_issued,
+            "skipped_already_billed": self.__skipped,
+            "error": self.__error,
+            "date_create": str(self.__date_create),
+            "date_finish": str(self.__date_finish) if self.__date_finish else None,
+        }
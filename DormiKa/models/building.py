@@ -1,15 +1,39 @@
+import datetime
+from collections import OrderedDict
+from .enum import RoomStatus, RoomType
+from .id_allocator import next_id
+from .tracing import traced
+
+
 class Building:
-    ID = 1
+    AVAILABILITY_CACHE_DAYS = 62
 
     def __init__(self, floor_count, zone):
-        self.__id = f"{zone}{Building.ID:02d}"
+        self.__id = f"{zone}{next_id('building'):02d}"
         self.__floor_count = floor_count
         self.__rooms = []
         self.__washing_machines = []
         self.__meeting_rooms = []
         self.__lockers = []
+        self.__registry = None
+        # AVAILABLE rooms per RoomType, oldest first, kept in step by the rooms
+        self.__free_rooms = {room_type: OrderedDict() for room_type in RoomType}
+        # day -> free facility slots, dropped whenever that day gets a booking
+        self.__availability_cache = OrderedDict()
 
-        Building.ID += 1
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # registry link, room pools and cache are rebuilt on restore
+        del state["_Building__registry"]
+        del state["_Building__free_rooms"]
+        del state["_Building__availability_cache"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__registry = None
+        self.__free_rooms = {room_type: OrderedDict() for room_type in RoomType}
+        self.__availability_cache = OrderedDict()
 
     @property
     def id(self):
@@ -35,14 +59,43 @@ class Building:
     def meeting_rooms(self, new_meeting_room):
         self.__meeting_rooms.append(new_meeting_room)
 
+    def attach_registry(self, registry):
+        self.__registry = registry
+
     def add_room(self, room):
         self.__rooms.append(room)
+        if room.status == RoomStatus.AVAILABLE:
+            self.__free_rooms[room.type][room.id] = room
+        room.watch_status(self)
+        if self.__registry is not None:
+            self.__registry.register("room", room)
 
-    def find_and_hold_available_room_by_type(self, room_type):
-        from .enum import RoomStatus
+    def rebuild_room_pools(self):
+        for pool in self.__free_rooms.values():
+            pool.clear()
         for room in self.__rooms:
-            if room.type == room_type and room.status == RoomStatus.AVAILABLE:
-                room.hold(48)
+            if room.status == RoomStatus.AVAILABLE:
+                self.__free_rooms[room.type][room.id] = room
+
+    def room_status_changed(self, room, old_status, new_status):
+        if new_status == RoomStatus.AVAILABLE:
+            self.__free_rooms[room.type][room.id] = room
+        elif old_status == RoomStatus.AVAILABLE:
+            self.__free_rooms[room.type].pop(room.id, None)
+
+    def vacancy(self, room_type):
+        return len(self.__free_rooms[room_type])
+
+    def vacancy_by_type(self):
+        return {room_type.value: len(pool)
+                for room_type, pool in self.__free_rooms.items()}
+
+    @traced
+    def find_and_hold_available_room_by_type(self, room_type):
+        pool = self.__free_rooms[room_type]
+        while pool:
+            _, room = pool.popitem(last=False)
+            if room.hold(48):
                 return room
         raise LookupError(
             f"No available room of type '{room_type.value}' in building {self.__id}")
@@ -56,9 +109,41 @@ class Building:
 
     def add_washing_machine(self, wm):
         self.__washing_machines.append(wm)
+        self.__availability_cache.clear()
 
     def add_meeting_room(self, mr):
         self.__meeting_rooms.append(mr)
+        self.__availability_cache.clear()
+
+    def facility_availability(self, day: datetime.date):
+        cached = self.__availability_cache.get(day)
+        if cached is not None:
+            self.__availability_cache.move_to_end(day)
+            return cached
+
+        day_start = datetime.datetime.combine(day, datetime.time.min)
+        day_end = day_start + datetime.timedelta(days=1)
+        availability = []
+        for facility in self.__washing_machines + self.__meeting_rooms:
+            availability.append({
+                "facility_id": facility.id,
+                "facility_type": type(facility).__name__,
+                "free_slots": [
+                    {"start": str(start), "end": str(end)}
+                    for start, end in facility.schedule.free_slots(day_start, day_end)
+                ],
+            })
+
+        self.__availability_cache[day] = availability
+        if len(self.__availability_cache) > Building.AVAILABILITY_CACHE_DAYS:
+            self.__availability_cache.popitem(last=False)
+        return availability
+
+    def invalidate_facility_availability(self, booking):
+        day = booking.start_time.date()
+        while day <= booking.end_time.date():
+            self.__availability_cache.pop(day, None)
+            day += datetime.timedelta(days=1)
 
     def __iter__(self):
         return iter(self.__rooms)
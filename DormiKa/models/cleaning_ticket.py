@@ -1,20 +1,17 @@
 from datetime import datetime
 from .enum import CleaningStatus
+from .id_allocator import next_id
 
 
 class CleaningTicket:
-    ID = 1
-
-    def __init__(self, resident_id, room_id):
-        self.__ticket_id = f"CLTICKET-{CleaningTicket.ID:04d}"
+    def __init__(self, resident_id, room_id, report_time: datetime = None):
+        self.__ticket_id = f"CLTICKET-{next_id('cleaning_ticket'):04d}"
         self.__resident_id = resident_id
         self.__room_id = room_id
-        self.__report_time = datetime.now()
+        self.__report_time = report_time or datetime.now()
         self.__cost = 100
         self.__status = CleaningStatus.REQUESTED
 
-        CleaningTicket.ID += 1
-
     @property
     def id(self):
         return self.__ticket_id
@@ -2,13 +2,15 @@ import datetime
 from .enum import ContractStatus, InvoiceType, InvoiceStatus
 from .invoice import Invoice
 import calendar
+from .id_allocator import next_id
+from .tracing import traced
 
 
 class Contract:
-    ID = 1
+    DEFAULT_RENTAL_MONTHS = 12
 
     def __init__(self, resident, room, status: ContractStatus = ContractStatus.DRAFT):
-        self.__id = f"LC-{Contract.ID:04d}"
+        self.__id = f"LC-{next_id('contract'):04d}"
         self.__date_create = datetime.datetime.now()
         self.__resident = resident
         self.__room = room
@@ -19,8 +21,6 @@ class Contract:
         self.__monthly_rent = None
         self.__invoice_id = None
 
-        Contract.ID += 1
-
     @property
     def id(self) -> str:
         return self.__id
@@ -45,6 +45,24 @@ class Contract:
     def invoice_id(self, inv_id: str):
         self.__invoice_id = inv_id
 
+    @property
+    def move_in_date(self):
+        return self.__move_in_date
+
+    @property
+    def rental_time(self):
+        return self.__rental_time
+
+    @property
+    def end_date(self):
+        if self.__move_in_date is None or self.__rental_time is None:
+            return None
+        month_index = self.__move_in_date.month - 1 + self.__rental_time
+        year = self.__move_in_date.year + month_index // 12
+        month = month_index % 12 + 1
+        day = min(self.__move_in_date.day, calendar.monthrange(year, month)[1])
+        return datetime.date(year, month, day)
+
     @property
     def room(self):
         return self.__room
@@ -53,6 +71,14 @@ class Contract:
     def room(self, room):
         self.__room = room
 
+    @traced
+    def activate(self, move_in_date: datetime.date = None, rental_time: int = None):
+        self.__status = ContractStatus.ACTIVE
+        if self.__move_in_date is None:
+            self.__move_in_date = move_in_date or datetime.date.today()
+        if self.__rental_time is None:
+            self.__rental_time = rental_time or Contract.DEFAULT_RENTAL_MONTHS
+
     def validate_contract_status_for_handover(self):
         valid_statuses = [ContractStatus.ACTIVE, ContractStatus.PENDING_SIGN]
         if self.__status not in valid_statuses:
@@ -0,0 +1,121 @@
+import datetime
+import heapq
+import threading
+from contextlib import nullcontext
+from .enum import ContractStatus
+
+
+class ContractScheduler:
+    """Calendar buckets of pending ENDING_SOON / EXPIRED transitions.
+
+    Each active contract is filed under the two days its status has to
+    change, so advancing the calendar only touches contracts that are due.
+    """
+
+    ENDING_SOON_DAYS = 30
+
+    def __init__(self):
+        self.__buckets = {}
+        self.__days = []
+        self.__subscribers = []
+        self.__lock = threading.Lock()
+        # entries given to restore(), filed on first use
+        self.__restored = None
+
+    def __len__(self):
+        with self.__lock:
+            self.__file_restored()
+            return sum(len(bucket) for bucket in self.__buckets.values())
+
+    @property
+    def next_transition(self):
+        with self.__lock:
+            self.__file_restored()
+            return self.__days[0] if self.__days else None
+
+    def subscribe(self, handler):
+        """Call handler(event) for every transition applied by advance()."""
+        self.__subscribers.append(handler)
+
+    def schedule(self, resident, contract):
+        end_date = contract.end_date
+        if end_date is None:
+            return
+        ending_soon = end_date - \
+            datetime.timedelta(days=ContractScheduler.ENDING_SOON_DAYS)
+        with self.__lock:
+            self.__file_restored()
+            self.__file(ending_soon, resident, contract,
+                        ContractStatus.ENDING_SOON)
+            self.__file(end_date, resident, contract, ContractStatus.EXPIRED)
+
+    def __file(self, day, resident, contract, target_status):
+        bucket = self.__buckets.get(day)
+        if bucket is None:
+            bucket = self.__buckets[day] = []
+            heapq.heappush(self.__days, day)
+        bucket.append((resident, contract, target_status, contract.end_date))
+
+    def entries(self):
+        """(day, resident, contract, target status, end date) of every filed transition."""
+        with self.__lock:
+            self.__file_restored()
+            return [(day, *entry) for day, bucket in self.__buckets.items() for entry in bucket]
+
+    def restore(self, entries):
+        """File entries as returned by entries() once the scheduler is first used;
+        the contracts are not read."""
+        with self.__lock:
+            self.__restored = entries
+
+    def __file_restored(self):
+        if self.__restored is None:
+            return
+        entries, self.__restored = self.__restored, None
+        for day, resident, contract, target_status, end_date in entries:
+            bucket = self.__buckets.get(day)
+            if bucket is None:
+                bucket = self.__buckets[day] = []
+                self.__days.append(day)
+            bucket.append((resident, contract, target_status, end_date))
+        heapq.heapify(self.__days)
+
+    def advance(self, today: datetime.date = None, guard=None):
+        """Apply every transition due on or before today and return the events.
+
+        guard(resident, room), if given, returns the context each
+        transition runs under.
+        """
+        today = today or datetime.date.today()
+        due = []
+        with self.__lock:
+            self.__file_restored()
+            while self.__days and self.__days[0] <= today:
+                day = heapq.heappop(self.__days)
+                due.extend((day, entry) for entry in self.__buckets.pop(day))
+        events = []
+        for day, (resident, contract, target_status, end_date) in due:
+            with guard(resident, contract.room) if guard else nullcontext():
+                if not self.__is_due(contract, target_status, end_date):
+                    continue
+                contract.status = target_status
+                events.append({
+                    "event": target_status.value,
+                    "date": str(day),
+                    "contract_id": contract.id,
+                    "resident_id": resident.id,
+                    "room_id": contract.room.id,
+                    "end_date": str(end_date),
+                })
+        for event in events:
+            for handler in self.__subscribers:
+                handler(event)
+        return events
+
+    def __is_due(self, contract, target_status, end_date):
+        # drop entries for contracts that were terminated or re-dated since
+        if contract.end_date != end_date:
+            return False
+        if target_status == ContractStatus.ENDING_SOON:
+            return contract.status == ContractStatus.ACTIVE
+        return contract.status in (ContractStatus.ACTIVE, ContractStatus.ENDING_SOON)
@@ -6,13 +6,41 @@ from .room import *
 from .resident import *
 from .facility_booking import *
 from .invoice import Invoice
+from .registry import Registry
+from .hold_sweeper import HoldSweeper
+from .contract_scheduler import ContractScheduler
+from .billing_run import BillingRun, BillingLedger
+from .aging import AgingEngine
+from .repository import InMemoryRepository, MEMBER_KINDS, write_counters
+from .snapshot import write_snapshot
+from .lock_stripes import LockStripes
+from contextlib import contextmanager
+from itertools import repeat
 import re
 import datetime
-from pprint import pprint
+import gc
+import threading
+from .event_log import log
+from .metrics import timed
+from .tracing import traced
+
+
+def _columns(prefix, names, rows):
+    values = list(zip(*rows)) or [()] * len(names)
+    return {f"{prefix}.{name}": list(column) for name, column in zip(names, values)}
+
+
+def _rows(snapshot, prefix, names):
+    yield from zip(*(snapshot.column(f"{prefix}.{name}") for name in names))
 
 
 class Dorm:
-    def __init__(self, name: str):
+    AVAILABILITY_MAX_DAYS = 31
+    # fields of the hold and contract transition entries stored in snapshots
+    HOLD_COLUMNS = ("expiry", "resident", "room", "contract")
+    TRANSITION_COLUMNS = ("day", "resident", "contract", "status", "end_date")
+
+    def __init__(self, name: str, repository=None):
         self.__name: str = name
         self.__buildings: list = []
         self.__residents: list = []
@@ -20,6 +48,17 @@ class Dorm:
         self.__technicians: list = []
         self.__cleaners: list = []
         self.__blacklist: list = []
+        self.__registry = Registry()
+        self.__hold_sweeper = HoldSweeper()
+        self.__contract_scheduler = ContractScheduler()
+        self.__billing_runs: dict = {}
+        self.__open_billing_runs: dict = {}
+        self.__billing_ledger = BillingLedger()
+        self.__repository = repository or InMemoryRepository()
+        # per room / resident / building / facility / staff locks for workflows
+        self.__locks = LockStripes()
+        # one strike audit at a time; it takes resident stripes one by one
+        self.__strike_lock = threading.Lock()
 
     @property
     def name(self):
@@ -45,50 +84,355 @@ class Dorm:
     def cleaners(self):
         return self.__cleaners
 
+    @property
+    def hold_sweeper(self):
+        return self.__hold_sweeper
+
+    @property
+    def contract_scheduler(self):
+        return self.__contract_scheduler
+
+    @property
+    def repository(self):
+        return self.__repository
+
+    @classmethod
+    def open(cls, repository, seed=None):
+        """Restore a Dorm from repository, or build it with seed() when the store is empty."""
+        # restoring only adds objects; cyclic GC passes over them only cost time
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            state = repository.load()
+            if state is not None:
+                dorm = cls(state["name"], repository)
+                dorm.__restore(state)
+                return dorm
+        finally:
+            if collecting:
+                gc.enable()
+        dorm = seed() if seed is not None else cls("DormiKa")
+        dorm.attach_repository(repository)
+        dorm.save_all()
+        return dorm
+
+    def attach_repository(self, repository):
+        self.__repository = repository
+
+    def save_all(self):
+        lists = self.__member_lists()
+        entities = [entity for members in lists.values() for entity in members]
+        members = [(list_name, entity.id, True)
+                   for list_name, entities_in_list in lists.items()
+                   for entity in entities_in_list]
+        self.__repository.save(entities, members,
+                               list(self.__billing_ledger), name=self.__name)
+
+    def write_snapshot(self, path):
+        """Write a snapshot SnapshotRepository(path) can open without rebuilding objects."""
+        write_snapshot(path, self.__name, self.__member_lists(),
+                       list(self.__billing_ledger), self.__index_columns())
+
+    def __index_columns(self):
+        columns = {f"registry.{name}": values
+                   for name, values in self.__registry.columns().items()}
+        columns.update(_columns("holds", Dorm.HOLD_COLUMNS, self.__hold_sweeper.entries()))
+        columns.update(_columns("transitions", Dorm.TRANSITION_COLUMNS,
+                                self.__contract_scheduler.entries()))
+        return columns
+
+    def __member_lists(self):
+        return {
+            "buildings": self.__buildings,
+            "residents": self.__residents,
+            "employees": self.__employees,
+            "technicians": self.__technicians,
+            "cleaners": self.__cleaners,
+            "blacklist": self.__blacklist,
+        }
+
+    def __restore(self, state):
+        write_counters(state["counters"])
+        entities = state["entities"]
+        for list_name, members in self.__member_lists().items():
+            kind = repeat(MEMBER_KINDS[list_name])
+            members.extend(map(entities.__getitem__, zip(kind, state["members"][list_name])))
+        self.__billing_ledger.restore(state["ledger"])
+        if state.get("indexes") is None:
+            self.__reindex()
+        else:
+            self.__restore_indexes(state["indexes"])
+
+    def __restore_indexes(self, snapshot):
+        """Load the indexes written with a snapshot, leaving its entities undecoded."""
+        self.__registry.restore_columns(
+            lambda name: snapshot.column(f"registry.{name}"),
+            lambda name: snapshot.column_ids(f"registry.{name}"), self.__residents)
+        self.__hold_sweeper.restore(_rows(snapshot, "holds", Dorm.HOLD_COLUMNS))
+        # read on the first lifecycle pass
+        self.__contract_scheduler.restore(
+            _rows(snapshot, "transitions", Dorm.TRANSITION_COLUMNS))
+        # registry links and room pools are not stored; they are made on decode
+        snapshot.on_decode("resident", self.__attach_resident)
+        snapshot.on_decode("building", self.__attach_building)
+
+    def __attach_resident(self, resident):
+        if self.__registry.lookup("resident", resident.id) is resident:
+            resident.attach_registry(self.__registry)
+
+    def __attach_building(self, building):
+        if self.__registry.lookup("building", building.id) is building:
+            building.attach_registry(self.__registry)
+            building.rebuild_room_pools()
+
+    def __reindex(self):
+        """Build the registry, room pools and schedules from the member lists."""
+        for building in self.__buildings:
+            self.__registry.add_building(building)
+            building.rebuild_room_pools()
+        for employee in self.__employees:
+            self.__registry.register("employee", employee)
+        for technician in self.__technicians:
+            self.__registry.register("technician", technician)
+        for cleaner in self.__cleaners:
+            self.__registry.register("cleaner", cleaner)
+        for resident in self.__blacklist:
+            self.__registry.add_blacklisted(resident)
+
+        for resident in self.__residents:
+            self.__registry.add_resident(resident)
+            for contract in resident.contracts:
+                if (contract.status in (ContractStatus.DRAFT, ContractStatus.PENDING_SIGN)
+                        and contract.room.status == RoomStatus.RESERVED):
+                    self.__hold_sweeper.schedule(resident, contract.room, contract)
+                elif contract.status in (ContractStatus.ACTIVE, ContractStatus.ENDING_SOON):
+                    self.__contract_scheduler.schedule(resident, contract)
+
+    @traced
+    def __save(self, *entities, members=(), ledger=()):
+        self.__repository.save(entities, members, ledger)
+
+    # ==================== Sharding ====================
+
+    def retain_shard(self, owns):
+        """Keep only what this shard owns; owns(key) is asked about building
+        and resident ids.
+
+        Staff stay on every shard; the router dispatches each to one shard
+        at a time through busy_staff(). A resident stays with the building
+        of their latest contract, or with owns(resident id) if they have none.
+        """
+        def home(resident):
+            if resident.contracts:
+                return resident.contracts[-1].room.building.id
+            return resident.id
+
+        with self.__locks.hold(("members",)):
+            self.__buildings[:] = [b for b in self.__buildings if owns(b.id)]
+            self.__residents[:] = [r for r in self.__residents if owns(home(r))]
+            self.__blacklist[:] = [r for r in self.__blacklist if owns(home(r))]
+            self.__rebuild_indexes()
+
+    def __rebuild_indexes(self):
+        self.__registry = Registry()
+        self.__hold_sweeper = HoldSweeper()
+        self.__contract_scheduler = ContractScheduler()
+        self.__reindex()
+
+    def owns(self, kind, entity_id):
+        """Whether this shard holds the entity a request is keyed by."""
+        if kind == "contract":
+            return self.__registry.lookup_contract(entity_id) is not None
+        if kind == "invoice":
+            return self.__registry.lookup_invoice(entity_id) is not None
+        if kind == "technician_task":
+            technician = self.__registry.lookup("technician", entity_id)
+            return technician is not None and technician.current_task is not None
+        return self.__registry.lookup(kind, entity_id) is not None
+
+    def export_resident(self, resident_id):
+        """Remove a resident with no contracts here, to move them to another shard.
+
+        Invoices, receipts and facility bookings refer to rooms and
+        facilities by id, so they travel with the resident; a contract
+        holds its room and pins the resident to this shard.
+        """
+        with self.__locks.hold(("members",), ("resident", resident_id)):
+            resident = self.search_resident_by_id(resident_id)
+            if resident.contracts:
+                raise ValueError(
+                    f"Resident '{resident_id}' already has contracts in other buildings")
+            self.__residents.remove(resident)
+            self.__registry.remove_resident(resident)
+            self.__save(members=[("residents", resident.id, False)])
+            return resident
+
+    def busy_staff(self):
+        """Ids of the employees and technicians dispatched on this shard."""
+        with self.__locks.hold(("technicians",)):
+            return ([employee.id for employee in self.__employees
+                     if employee.status != AvailabilityStatus.AVAILABLE]
+                    + [technician.id for technician in self.__technicians
+                       if technician.current_task is not None])
+
+    def import_resident(self, resident):
+        self.add_resident(resident)
+        return resident.id
+
+    def check_sign_ins(self, applicants):
+        """check_sign_in for each applicant, against this dorm's residents only."""
+        return [self.check_sign_in(a["name"], a["email"], a["phoneNumber"])
+                for a in applicants]
+
+    def run_billing_chunk(self, run_id):
+        """Run one chunk of a billing run and report its progress; a failure is in the report."""
+        run = self.search_billing_run_by_id(run_id)
+        try:
+            run.run_chunk()
+        except Exception:
+            pass
+        return run.to_dict()
+
+    # ==================== Locking ====================
+
+    def __guard(self, resident, room):
+        return self.__locks.hold(("resident", resident.id), *self.__room_keys(room))
+
+    @staticmethod
+    def __room_keys(room):
+        # a room moving in or out of AVAILABLE changes its building's free-room
+        # pool, which request_booking takes under the building key alone
+        return [("room", room.id), ("building", room.building.id)]
+
+    @contextmanager
+    def __hold_resolved(self, resolve):
+        """Lock the keys resolve() derives from current state, retrying until
+        they still hold once the locks are taken."""
+        while True:
+            keys = resolve()
+            with self.__locks.hold(*keys):
+                if resolve() == keys:
+                    yield
+                    return
+
+    def __occupant_keys(self, room_id):
+        keys = [("room", room_id)]
+        resident = self.__registry.lookup_occupant(room_id)
+        if resident is not None:
+            keys.append(("resident", resident.id))
+        return keys
+
+    def __contract_keys(self, contract_id):
+        resident, contract = self.search_contract_by_id(contract_id)
+        return [("resident", resident.id), ("room", contract.room.id)]
+
+    def __invoice_keys(self, invoice_id):
+        resident, _ = self.search_invoice_by_id(invoice_id)
+        keys = [("resident", resident.id)]
+        for contract in resident.contracts:
+            if contract.invoice_id == invoice_id:
+                keys.append(("room", contract.room.id))
+        return keys
+
+    def __task_keys(self, technician_id):
+        technician = self.search_technician_by_id(technician_id)
+        keys = [("staff", technician_id)]
+        if technician.current_task is not None:
+            keys += self.__occupant_keys(technician.current_task.room_id)
+        return keys
+
+    def __change_contract_keys(self, resident_id, contract_id, target_room_id):
+        resident = self.search_resident_by_id(resident_id)
+        keys = [("resident", resident.id), ("room", target_room_id)]
+        target_room = self.__registry.lookup("room", target_room_id)
+        if target_room is not None:
+            keys.append(("building", target_room.building.id))
+        contract = resident.search_contract_by_id(contract_id)
+        if contract is not None:
+            keys += self.__room_keys(contract.room)
+        return keys
+
     def show_success(self, success):
-        pprint(success)
+        log.info("dorm.success", result=success)
         return success
 
     def show_error(self, error):
-        pprint(error)
+        log.warning("dorm.error", error=error)
         return error
 
     def add_employee(self, employee):
-        self.__employees.append(employee)
+        with self.__locks.hold(("members",)):
+            self.__employees.append(employee)
+            self.__registry.register("employee", employee)
+            self.__save(employee, members=[("employees", employee.id, True)])
 
     def add_resident(self, resident):
-        self.__residents.append(resident)
+        with self.__locks.hold(("members",)):
+            self.__residents.append(resident)
+            self.__registry.add_resident(resident)
+            self.__save(resident, members=[("residents", resident.id, True)])
 
     def add_operation_staff(self, employee):
-        self.__employees.append(employee)
+        with self.__locks.hold(("members",)):
+            self.__employees.append(employee)
+            self.__registry.register("employee", employee)
+            self.__save(employee, members=[("employees", employee.id, True)])
 
     def add_technician(self, technician):
-        self.__technicians.append(technician)
+        with self.__locks.hold(("members",)):
+            self.__technicians.append(technician)
+            self.__registry.register("technician", technician)
+            self.__save(technician, members=[
+                        ("technicians", technician.id, True)])
 
     def add_cleaner(self, cleaner):
-        self.__cleaners.append(cleaner)
+        with self.__locks.hold(("members",)):
+            self.__cleaners.append(cleaner)
+            self.__registry.register("cleaner", cleaner)
+            self.__save(cleaner, members=[("cleaners", cleaner.id, True)])
 
     def add_building(self, building):
-        self.__buildings.append(building)
+        with self.__locks.hold(("members",)):
+            self.__buildings.append(building)
+            self.__registry.add_building(building)
+            self.__save(building, members=[("buildings", building.id, True)])
+
+    def bulk_load(self, buildings=(), residents=(), employees=(), technicians=(),
+                  cleaners=(), ledger=()):
+        """Add many prebuilt entities at once, e.g. a generated dataset.
+
+        Skips the sign-in checks and per-entity saves of the add_* methods:
+        indexes are rebuilt once and everything is saved in one write.
+        ledger holds (contract_id, period) pairs already billed.
+        """
+        with self.__locks.hold(("members",)):
+            self.__buildings.extend(buildings)
+            self.__residents.extend(residents)
+            self.__employees.extend(employees)
+            self.__technicians.extend(technicians)
+            self.__cleaners.extend(cleaners)
+            for contract_id, period in ledger:
+                self.__billing_ledger.mark_billed(contract_id, period)
+            self.__rebuild_indexes()
+            self.save_all()
 
     def search_employee_by_id(self, employee_id):
-        for employee in self.__employees:
-            if employee.id == employee_id:
-                return employee
-        raise PermissionError("Employee id : not found")
+        employee = self.__registry.lookup("employee", employee_id)
+        if employee is None:
+            raise PermissionError("Employee id : not found")
+        return employee
 
     def search_resident_by_id(self, resident_id):
-        for resident in self.__residents:
-            if resident.id == resident_id:
-                return resident
-        raise PermissionError("Resident id : not found")
+        resident = self.__registry.lookup("resident", resident_id)
+        if resident is None:
+            raise PermissionError("Resident id : not found")
+        return resident
 
     def search_room_by_id(self, room_id):
-        for building in self.__buildings:
-            for room in building.rooms:
-                if room.id == room_id:
-                    return room
-        raise PermissionError("Room id : not found")
+        room = self.__registry.lookup("room", room_id)
+        if room is None:
+            raise PermissionError("Room id : not found")
+        return room
 
     def search_room_by_contracts(self, resident, room_id):
         for contract in resident.contracts:
@@ -97,476 +441,623 @@ class Dorm:
         raise ValueError("request wrong room resident doesn't in contract")
 
     def search_building_by_id(self, building_id):
-        for building in self.__buildings:
-            if building.id == building_id:
-                return building
-        raise PermissionError("Building id : not found")
+        building = self.__registry.lookup("building", building_id)
+        if building is None:
+            raise PermissionError("Building id : not found")
+        return building
 
     def search_technician_by_id(self, technician_id):
-        for technician in self.__technicians:
-            if technician.id == technician_id:
-                return technician
-        raise ValueError(f"Technician '{technician_id}' not found")
+        technician = self.__registry.lookup("technician", technician_id)
+        if technician is None:
+            raise ValueError(f"Technician '{technician_id}' not found")
+        return technician
 
     def search_cleaner_by_id(self, cleaner_id):
-        for cleaner in self.__cleaners:
-            if cleaner.id == cleaner_id:
-                return cleaner
-        raise ValueError(f"Cleaner '{cleaner_id}' not found")
+        cleaner = self.__registry.lookup("cleaner", cleaner_id)
+        if cleaner is None:
+            raise ValueError(f"Cleaner '{cleaner_id}' not found")
+        return cleaner
 
+    @timed
     def start_cleaning_workflow(self, cleaner_id, room_id):
         try:
             from .enum import CleaningStatus
-            cleaner = self.search_cleaner_by_id(cleaner_id)
-            room = self.search_room_by_id(room_id)
-
-            if room not in cleaner.assigned_rooms:
-                cleaner.assigned_rooms.append(room)
-
-            ticket = None
-            for t in room.cleaning_tickets:
-                if t.room_id == room_id and t.status != CleaningStatus.FINISHED:
-                    ticket = t
-                    break
-
-            if ticket is None:
-                raise ValueError(
-                    f"No active cleaning ticket found for room {room_id}")
-
-            ticket.status = CleaningStatus.CLEANING
-            cleaner.status = "WORKING"
-
-            return {
-                "cleaner_id": cleaner.id,
-                "ticket_id": ticket.id,
-                "room_id": ticket.room_id,
-                "status": ticket.status.value,
-            }
+            with self.__locks.hold(("staff", cleaner_id), ("room", room_id)):
+                cleaner = self.search_cleaner_by_id(cleaner_id)
+                room = self.search_room_by_id(room_id)
+
+                if room not in cleaner.assigned_rooms:
+                    cleaner.assigned_rooms.append(room)
+
+                ticket = None
+                for t in room.cleaning_tickets:
+                    if t.room_id == room_id and t.status != CleaningStatus.FINISHED:
+                        ticket = t
+                        break
+
+                if ticket is None:
+                    raise ValueError(
+                        f"No active cleaning ticket found for room {room_id}")
+
+                ticket.status = CleaningStatus.CLEANING
+                cleaner.status = "WORKING"
+                self.__save(cleaner, ticket)
+
+                return {
+                    "cleaner_id": cleaner.id,
+                    "ticket_id": ticket.id,
+                    "room_id": ticket.room_id,
+                    "status": ticket.status.value,
+                }
         except ValueError as e:
             return self.show_error({"error": str(e)})
 
+    @timed
     def finish_cleaning_workflow(self, cleaner_id, room_id):
         try:
             from .enum import CleaningStatus
-            cleaner = self.search_cleaner_by_id(cleaner_id)
-            room = self.search_room_by_id(room_id)
-
-            ticket = None
-            for t in room.cleaning_tickets:
-                if t.room_id == room_id and t.status != CleaningStatus.FINISHED:
-                    ticket = t
-                    break
-
-            if ticket is None:
-                raise ValueError(
-                    f"No active cleaning ticket found for room {room_id}")
-
-            ticket.status = CleaningStatus.FINISHED
-            if room in cleaner.assigned_rooms:
-                cleaner.assigned_rooms.remove(room)
-            cleaner.status = "AVAILABLE"
-
-            resident = self.search_resident_by_room_id(room_id)
-            if resident:
-                cleaning_invoice = Invoice(
-                    InvoiceType.CLEANER,
-                    ticket.id,
-                    ticket.cost,
-                    InvoiceStatus.UNPAID
-                )
-                resident.add_invoice(cleaning_invoice)
-
-            return {
-                "cleaner_id": cleaner.id,
-                "cleaner_status": cleaner.status,
-                "ticket_id": ticket.id,
-                "room_id": ticket.room_id,
-                "status": ticket.status.value,
-                "invoice_id": cleaning_invoice.id if resident else None,
-                "cost": ticket.cost if resident else None,
-            }
+            with self.__hold_resolved(lambda: [("staff", cleaner_id)] + self.__occupant_keys(room_id)):
+                cleaner = self.search_cleaner_by_id(cleaner_id)
+                room = self.search_room_by_id(room_id)
+
+                ticket = None
+                for t in room.cleaning_tickets:
+                    if t.room_id == room_id and t.status != CleaningStatus.FINISHED:
+                        ticket = t
+                        break
+
+                if ticket is None:
+                    raise ValueError(
+                        f"No active cleaning ticket found for room {room_id}")
+
+                ticket.status = CleaningStatus.FINISHED
+                if room in cleaner.assigned_rooms:
+                    cleaner.assigned_rooms.remove(room)
+                cleaner.status = "AVAILABLE"
+
+                resident = self.search_resident_by_room_id(room_id)
+                if resident:
+                    cleaning_invoice = Invoice(
+                        InvoiceType.CLEANER,
+                        ticket.id,
+                        ticket.cost,
+                        InvoiceStatus.UNPAID
+                    )
+                    resident.add_invoice(cleaning_invoice)
+                self.__save(cleaner, ticket, resident, cleaning_invoice)
+
+                return {
+                    "cleaner_id": cleaner.id,
+                    "cleaner_status": cleaner.status,
+                    "ticket_id": ticket.id,
+                    "room_id": ticket.room_id,
+                    "status": ticket.status.value,
+                    "invoice_id": cleaning_invoice.id if resident else None,
+                    "cost": ticket.cost if resident else None,
+                }
         except ValueError as e:
             return self.show_error({"error": str(e)})
 
     def search_contract_by_id(self, contract_id):
-        for resident in self.__residents:
-            for contract in resident.contracts:
-                if contract.id == contract_id:
-                    return resident, contract
-        raise ValueError(f"Contract '{contract_id}' not found")
+        entry = self.__registry.lookup_contract(contract_id)
+        if entry is None:
+            raise ValueError(f"Contract '{contract_id}' not found")
+        return entry
 
     def search_invoice_by_id(self, invoice_id):
-        for resident in self.__residents:
-            for invoice in resident.invoices:
-                if invoice.id == invoice_id:
-                    return resident, invoice
-        raise ValueError(f"Invoice '{invoice_id}' not found")
+        entry = self.__registry.lookup_invoice(invoice_id)
+        if entry is None:
+            raise ValueError(f"Invoice '{invoice_id}' not found")
+        return entry
 
+    @timed
     def request_booking(self, resident_id, building_id, room_type):
-        # 1. find resident
-        resident = self.search_resident_by_id(resident_id)
+        with self.__locks.hold(("resident", resident_id), ("building", building_id)):
+            # 1. find resident
+            resident = self.search_resident_by_id(resident_id)
 
-        # 2. check account status
-        if resident.status == AccountStatus.SUSPEND:
-            raise PermissionError("Account is suspended")
-        if resident.status == AccountStatus.CLOSED:
-            raise PermissionError("Account is closed")
+            # 2. check account status
+            if resident.status == AccountStatus.SUSPEND:
+                raise PermissionError("Account is suspended")
+            if resident.status == AccountStatus.CLOSED:
+                raise PermissionError("Account is closed")
 
-        # 3. check business hours
-        # if not (8 <= datetime.datetime.now().hour <= 17):
-        #     raise ValueError("Outside business hours (08:00–17:00)")
+            # 3. check business hours
+            # if not (8 <= datetime.datetime.now().hour <= 17):
+            #     raise ValueError("Outside business hours (08:00–17:00)")
 
-        # 3. find building and hold an available room
-        building = self.search_building_by_id(building_id)
-        room = building.find_and_hold_available_room_by_type(room_type)
+            # 3. find building and hold an available room
+            building = self.search_building_by_id(building_id)
+            room = building.find_and_hold_available_room_by_type(room_type)
 
-        # 4. create contract (DRAFT)
-        contract = Contract(resident, room, status=ContractStatus.DRAFT)
-        resident.add_contract(contract)
+            # 4. create contract (DRAFT)
+            contract = Contract(resident, room, status=ContractStatus.DRAFT)
+            resident.add_contract(contract)
+            self.__hold_sweeper.schedule(resident, room, contract)
+            self.__save(resident, room, contract)
 
-        return {
-            "contract_id": contract.id,
-            "resident_id": resident.id,
-            "room_id": room.id,
-            "room_status": room.status.value,
-            "room_type": room.type.value,
-            "contract_status": contract.status.value,
-        }
+            return {
+                "contract_id": contract.id,
+                "resident_id": resident.id,
+                "room_id": room.id,
+                "room_status": room.status.value,
+                "room_type": room.type.value,
+                "contract_status": contract.status.value,
+            }
 
+    @timed
     def sign_contract(self, contract_id):
-        # 1. find contract
-        resident, contract = self.search_contract_by_id(contract_id)
-
-        # 2. validate — must be DRAFT
-        contract.validate_for_signing()
-
-        # 3. create contract invoice from room price
-        invoice = Invoice(
-            InvoiceType.CONTRACT,
-            contract.room.id,
-            contract.room.monthly_rent, InvoiceStatus.UNPAID
-        )
-        resident.add_invoice(invoice)
+        with self.__hold_resolved(lambda: self.__contract_keys(contract_id)):
+            # 1. find contract
+            resident, contract = self.search_contract_by_id(contract_id)
+
+            # 2. validate — must be DRAFT
+            contract.validate_for_signing()
+
+            # 3. create contract invoice from room price
+            invoice = Invoice(
+                InvoiceType.CONTRACT,
+                contract.room.id,
+                contract.room.monthly_rent, InvoiceStatus.UNPAID
+            )
+            resident.add_invoice(invoice)
 
-        # 4. link invoice to contract and advance status
-        contract.invoice_id = invoice.id
-        contract.status = ContractStatus.PENDING_SIGN
+            # 4. link invoice to contract and advance status
+            contract.invoice_id = invoice.id
+            contract.status = ContractStatus.PENDING_SIGN
+            self.__registry.index_contract(resident, contract)
+            self.__save(resident, contract, invoice)
 
-        return {
-            "invoice_id": invoice.id,
-            "contract_id": contract.id,
-            "amount": invoice.amount,
-            "contract_status": contract.status.value,
-        }
+            return {
+                "invoice_id": invoice.id,
+                "contract_id": contract.id,
+                "amount": invoice.amount,
+                "contract_status": contract.status.value,
+            }
 
+    @timed
     def pay_contract_invoice(self, invoice_id):
-        # 1. find invoice
-        resident, invoice = self.search_invoice_by_id(invoice_id)
-
-        # 2. validate not already paid
-        invoice.validate_for_payment()
-
-        # 3. find the contract linked to this invoice
-        contract = next(
-            (c for c in resident.contracts if c.invoice_id == invoice_id), None
-        )
-        if contract is None:
-            raise ValueError(f"No contract linked to invoice '{invoice_id}'")
+        with self.__hold_resolved(lambda: self.__invoice_keys(invoice_id)):
+            # 1. find invoice
+            resident, invoice = self.search_invoice_by_id(invoice_id)
+
+            # 2. validate not already paid
+            invoice.validate_for_payment()
+
+            # 3. find the contract linked to this invoice
+            contract = next(
+                (c for c in resident.contracts if c.invoice_id == invoice_id), None
+            )
+            if contract is None:
+                raise ValueError(f"No contract linked to invoice '{invoice_id}'")
+
+            # 4. mark paid and activate contract + room
+            invoice.status = InvoiceStatus.PAID
+            self.__registry.settle_invoice(invoice)
+            contract.activate()
+            contract.room.status = RoomStatus.OCCUPIED
+            self.__registry.index_contract(resident, contract)
+            self.__contract_scheduler.schedule(resident, contract)
+            self.__save(invoice, contract, contract.room)
 
-        # 4. mark paid and activate contract + room
-        invoice.status = InvoiceStatus.PAID
-        contract.status = ContractStatus.ACTIVE
-        contract.room.status = RoomStatus.OCCUPIED
-
-        return {
-            "invoice_id": invoice.id,
-            "contract_id": contract.id,
-            "contract_status": contract.status.value,
-            "room_id": contract.room.id,
-            "room_status": contract.room.status.value,
-        }
+            return {
+                "invoice_id": invoice.id,
+                "contract_id": contract.id,
+                "contract_status": contract.status.value,
+                "room_id": contract.room.id,
+                "room_status": contract.room.status.value,
+            }
 
+    @timed
     def complete_handover(self, contract_id: str):
-        # 1. find resident and contract
-        resident, contract = self.search_contract_by_id(contract_id)
+        with self.__hold_resolved(lambda: self.__contract_keys(contract_id)):
+            # 1. find resident and contract
+            resident, contract = self.search_contract_by_id(contract_id)
 
-        # 2. validate contract status (must be ACTIVE or PENDING_SIGN)
-        contract.validate_contract_status_for_handover()
+            # 2. validate contract status (must be ACTIVE or PENDING_SIGN)
+            contract.validate_contract_status_for_handover()
 
-        # 3. mark room as OCCUPIED
-        room = contract.room
-        room.status = RoomStatus.OCCUPIED
+            # 3. mark room as OCCUPIED
+            room = contract.room
+            room.status = RoomStatus.OCCUPIED
+            self.__registry.index_contract(resident, contract)
+            self.__save(room)
 
+            return {
+                "contract_id": contract.id,
+                "resident_id": resident.id,
+                "room_id": room.id,
+                "room_status": room.status.value,
+                "contract_status": contract.status.value,
+            }
+
+    @timed
+    def release_expired_holds(self, now=None):
+        released = self.__hold_sweeper.sweep(now, guard=self.__guard)
+        changed = []
+        for resident, contract in released:
+            self.__registry.index_contract(resident, contract)
+            changed += [resident, contract, contract.room]
+            # a signed contract's invoice was cancelled along with it
+            for invoice in resident.invoices:
+                if invoice.id == contract.invoice_id:
+                    self.__registry.settle_invoice(invoice)
+                    changed.append(invoice)
+        if changed:
+            self.__save(*changed)
         return {
-            "contract_id": contract.id,
-            "resident_id": resident.id,
-            "room_id": room.id,
-            "room_status": room.status.value,
-            "contract_status": contract.status.value,
+            "released": [
+                {
+                    "contract_id": contract.id,
+                    "room_id": contract.room.id,
+                    "contract_status": contract.status.value,
+                } for _, contract in released
+            ],
         }
 
+    @timed
+    def advance_contract_lifecycle(self, today=None):
+        events = self.__contract_scheduler.advance(today, guard=self.__guard)
+        changed = []
+        for event in events:
+            entry = self.__registry.lookup_contract(event["contract_id"])
+            if entry is None:
+                continue
+            resident, contract = entry
+            with self.__guard(resident, contract.room):
+                self.__registry.index_contract(resident, contract)
+                if contract.status == ContractStatus.EXPIRED:
+                    contract.room.status = RoomStatus.TURNOVER_CLEANING
+                changed.extend((contract, contract.room))
+        if changed:
+            self.__save(*changed)
+        return {"transitions": events}
+
     def search_resident_by_room_id(self, room_id):
-        for resident in self.__residents:
-            for contract in resident.contracts:
-                if contract.room.id == room_id and contract.status == ContractStatus.ACTIVE:
-                    return resident
-        raise ValueError(f"No active resident found for room '{room_id}'")
+        resident = self.__registry.lookup_occupant(room_id)
+        if resident is None:
+            raise ValueError(f"No active resident found for room '{room_id}'")
+        return resident
 
-    def search_available_employee(self):
+    @traced
+    def search_available_employee(self, busy_staff=()):
         for employee in self.__employees:
-            if employee.status == AvailabilityStatus.AVAILABLE:
+            if employee.status == AvailabilityStatus.AVAILABLE and employee.id not in busy_staff:
                 return employee
         raise ValueError("No employee are available at the moment")
 
+    @timed
     def request_cleaning_room(self, resident_id, room_id):
-        # 1.search resident by id
-        resident = self.search_resident_by_id(resident_id)
-
-        # 2. serach room by id (room resident input)
-        room_input = self.search_room_by_id(room_id)
+        with self.__locks.hold(("resident", resident_id), ("room", room_id)):
+            # 1.search resident by id
+            resident = self.search_resident_by_id(resident_id)
 
-        # 3. search room by contracts (room in resident contract)
-        room_in_contract = self.search_room_by_contracts(
-            resident, room_input.id)
+            # 2. serach room by id (room resident input)
+            room_input = self.search_room_by_id(room_id)
+
+            # 3. search room by contracts (room in resident contract)
+            room_in_contract = self.search_room_by_contracts(
+                resident, room_input.id)
+
+            # 4. get cleaning ticket list
+            cleaning_ticket_list = room_in_contract.cleaning_tickets
+
+            # 5. check status cleaning ticket
+            try:
+                if resident.check_status_cleaning_ticket(cleaning_ticket_list):
+                    # 6. create cleaning ticket
+                    cleaning_ticket = resident.create_cleaning_ticket(
+                        resident_id, room_id)
+                    # 7. add cleaning ticket to room
+                    resident.add_cleaning_ticket(room_in_contract, cleaning_ticket)
+                    self.__save(room_in_contract, cleaning_ticket)
+                    # 8. request success
+                    s = {
+                        "reporter": resident.id,
+                        "room_id": cleaning_ticket.room_id,
+                        "ticket id": cleaning_ticket.id,
+                        "report_time": str(cleaning_ticket.report_time),
+                        "cost": cleaning_ticket.cost,
+                        "status": cleaning_ticket.status.value
+                    }
+                    return self.show_success(s)
+                else:
+                    return self.show_error({"error": "Cleaning ticket already exists or invalid status"})
 
-        # 4. get cleaning ticket list
-        cleaning_ticket_list = room_in_contract.cleaning_tickets
-
-        # 5. check status cleaning ticket
-        try:
-            if resident.check_status_cleaning_ticket(cleaning_ticket_list):
-                # 6. create cleaning ticket
-                cleaning_ticket = resident.create_cleaning_ticket(
-                    resident_id, room_id)
-                # 7. add cleaning ticket to room
-                resident.add_cleaning_ticket(room_in_contract, cleaning_ticket)
-                # 8. request success
-                s = {
-                    "reporter": resident.id,
-                    "room_id": cleaning_ticket.room_id,
-                    "ticket id": cleaning_ticket.id,
-                    "report_time": str(cleaning_ticket.report_time),
-                    "cost": cleaning_ticket.cost,
-                    "status": cleaning_ticket.status.value
-                }
-                return self.show_success(s)
-            else:
-                return self.show_error({"error": "Cleaning ticket already exists or invalid status"})
-
-        except Exception as e:
-            return self.show_error({"error": str(e)})
+            except Exception as e:
+                return self.show_error({"error": str(e)})
 
+    @timed
     def booking_share_facility(self, resident_id, facility_id, building_id, booking_time):
         try:
-            # 1. search resident by id
-            resident = self.search_resident_by_id(resident_id)
+            with self.__locks.hold(("resident", resident_id), ("building", building_id),
+                                   ("facility", facility_id)):
+                # 1. search resident by id
+                resident = self.search_resident_by_id(resident_id)
 
-            # 2. search building by id
-            building = self.search_building_by_id(building_id)
+                # 2. search building by id
+                building = self.search_building_by_id(building_id)
 
-            # 3. search share facility in building
-            share_facility = building.get_share_facility_by_id(facility_id)
+                # 3. search share facility in building
+                share_facility = building.get_share_facility_by_id(facility_id)
 
-            # 4. check all residents' booking list for time overlap
-            for r in self.__residents:
-                for booking in r.booking_share_facility_list:
-                    if booking.check_booking_time(facility_id, booking_time):
-                        return self.show_error({"error": "this share facility already booking"})
+                # 4-5. create booking; the facility's interval index rejects overlaps
+                booking = share_facility.create_booking(
+                    resident_id, facility_id, building_id, booking_time)
 
-            # 5. create booking
-            booking = share_facility.create_booking(
-                resident_id, facility_id, building_id, booking_time)
+                building.invalidate_facility_availability(booking)
 
-            # 6. add booking to resident
-            resident.add_booking_share_facility(booking)
+                # 6. add booking to resident
+                resident.add_booking_share_facility(booking)
 
-            # 7. create invoice (fix cost)
-            invoice = share_facility.create_share_facility_invoice(
-                resident_id, booking)
+                # 7. create invoice (fix cost)
+                invoice = share_facility.create_share_facility_invoice(
+                    resident_id, booking)
 
-            # 8. add invoice to resident
-            resident.add_invoice(invoice)
+                # 8. add invoice to resident
+                resident.add_invoice(invoice)
+                self.__save(resident, share_facility, booking, invoice)
 
-            return self.show_success({
-                "booking_id": booking.id,
-                "share_facility_id": facility_id,
-                "building_id": building_id,
-                "booking_time": booking_time,
-                "invoice_id": invoice.id,
-                "cost": invoice.amount
-            })
+                return self.show_success({
+                    "booking_id": booking.id,
+                    "share_facility_id": facility_id,
+                    "building_id": building_id,
+                    "booking_time": booking_time,
+                    "invoice_id": invoice.id,
+                    "cost": invoice.amount
+                })
 
         except (PermissionError, ValueError) as e:
             return self.show_error({"error": str(e)})
         except Exception as e:
             return self.show_error({"error": str(e)})
 
-    def request_maintenance(self, resident_id, room_id, issue_category):
-        resident = self.search_resident_by_id(resident_id)
-
-        room = self.search_room_by_id(room_id)
+    @timed
+    def display_facility_availability(self, building_id, start_date, end_date=None):
+        building = self.search_building_by_id(building_id)
+        first_day = datetime.date.fromisoformat(start_date)
+        last_day = datetime.date.fromisoformat(end_date or start_date)
+        if last_day < first_day:
+            raise ValueError("end date must not be before start date")
+        if (last_day - first_day).days >= self.AVAILABILITY_MAX_DAYS:
+            raise ValueError(
+                f"date range must be at most {self.AVAILABILITY_MAX_DAYS} days")
+
+        with self.__locks.hold(("building", building_id)):
+            days = []
+            day = first_day
+            while day <= last_day:
+                days.append({
+                    "date": str(day),
+                    "facilities": building.facility_availability(day),
+                })
+                day += datetime.timedelta(days=1)
+            return {
+                "building_id": building.id,
+                "days": days,
+            }
 
-        employee = self.search_available_employee()
+    @timed
+    def request_maintenance(self, resident_id, room_id, issue_category, busy_staff=()):
+        """busy_staff: ids of staff dispatched elsewhere, passed over here."""
+        with self.__locks.hold(("resident", resident_id), ("room", room_id), ("technicians",)):
+            resident = self.search_resident_by_id(resident_id)
 
-        return employee.start_maintenance(
-            resident,
-            self.__technicians,
-            room,
-            issue_category.upper()
-        )
+            room = self.search_room_by_id(room_id)
 
+            employee = self.search_available_employee(busy_staff)
+
+            result = employee.start_maintenance(
+                resident,
+                [technician for technician in self.__technicians
+                 if technician.id not in busy_staff],
+                room,
+                issue_category.upper()
+            )
+            ticket = room.maintenance_tickets[-1]
+            technician = self.search_technician_by_id(
+                ticket.responsible_technician)
+            self.__save(employee, room, ticket, technician)
+            return result
+
+    @timed
     def start_maintenance_workflow(self, technician_id, notes=None):
-        technician = self.search_technician_by_id(technician_id)
-        return technician.start_maintenance(notes)
+        with self.__locks.hold(("staff", technician_id)):
+            technician = self.search_technician_by_id(technician_id)
+            result = technician.start_maintenance(notes)
+            self.__save(technician, technician.current_task)
+            return result
 
+    @timed
     def finish_maintenance_workflow(self, technician_id):
-        # Find and complete maintenance for technician
-        technician = self.search_technician_by_id(technician_id)
-        ticket = technician.complete_task()
-
-        # Create invoice for maintenance work
-        invoice = Invoice(
-            InvoiceType.MAINTENANCE,
-            ticket.room_id, ticket.cost, InvoiceStatus.UNPAID
-        )
-        resident = self.search_resident_by_room_id(ticket.room_id)
-        resident.add_invoice(invoice)
+        with self.__hold_resolved(lambda: self.__task_keys(technician_id)):
+            # Find and complete maintenance for technician
+            technician = self.search_technician_by_id(technician_id)
+            ticket = technician.complete_task()
+
+            # Create invoice for maintenance work
+            invoice = Invoice(
+                InvoiceType.MAINTENANCE,
+                ticket.room_id, ticket.cost, InvoiceStatus.UNPAID
+            )
+            resident = self.search_resident_by_room_id(ticket.room_id)
+            resident.add_invoice(invoice)
+            self.__save(technician, ticket, resident, invoice)
 
-        return {
-            "staff_id": technician.id,
-            "ticket_id": ticket.id,
-            "room_id": ticket.room_id,
-            "issue_category": ticket.issue_category,
-            "ticket_status": ticket.status.value,
-            "start_time": str(ticket.start_time),
-            "end_time": str(ticket.end_time),
-            "cost": ticket.cost,
-            "invoice": {
-                "id": invoice.id,
-                "type": InvoiceType.MAINTENANCE.value,
-                "amount": invoice.amount,
-                "status": InvoiceStatus.UNPAID.value,
-            },
-            "resident_id": resident.id,
-        }
+            return {
+                "staff_id": technician.id,
+                "ticket_id": ticket.id,
+                "room_id": ticket.room_id,
+                "issue_category": ticket.issue_category,
+                "ticket_status": ticket.status.value,
+                "start_time": str(ticket.start_time),
+                "end_time": str(ticket.end_time),
+                "cost": ticket.cost,
+                "invoice": {
+                    "id": invoice.id,
+                    "type": InvoiceType.MAINTENANCE.value,
+                    "amount": invoice.amount,
+                    "status": InvoiceStatus.UNPAID.value,
+                },
+                "resident_id": resident.id,
+            }
 
-    def system_contract_invoice(self, employeeId):
+    @timed
+    def start_billing_run(self, employeeId, billing_period=None, chunk_size=None):
         employee = self.search_employee_by_id(employeeId)
-        residents = []
-        for resident in self.__residents:
-            for contract in resident.contracts:
-                monthly_rent = contract.room.monthly_rent
-                room_id = contract.room.id
-                invoice = employee.create_contract_invoice(
-                    monthly_rent,
-                    room_id,
-                )
-                resident.add_invoice(invoice)
-                residents.append(resident)
+        period = BillingRun.parse_period(billing_period)
+
+        with self.__locks.hold(("billing", period)):
+            # an unfinished run for the same period picks up from its cursor
+            run = self.__open_billing_runs.get(period)
+            if run is not None and run.status != BillingRunStatus.COMPLETED:
+                return run.resume()
+
+            contracts = [
+                (resident, contract)
+                for resident in self.__residents
+                for contract in resident.contracts
+            ]
+            run = BillingRun(employee, contracts, period, self.__billing_ledger,
+                             chunk_size, on_chunk=self.__save_billing_chunk,
+                             guard=self.__guard)
+            self.__billing_runs[run.id] = run
+            self.__open_billing_runs[period] = run
+            return run
+
+    def __save_billing_chunk(self, entities, ledger):
+        self.__save(*entities, ledger=ledger)
+
+    def search_billing_run_by_id(self, run_id):
+        run = self.__billing_runs.get(run_id)
+        if run is None:
+            raise ValueError(f"Billing run '{run_id}' not found")
+        return run
+
+    @timed
+    def display_billing_run(self, run_id):
+        return self.search_billing_run_by_id(run_id).to_dict()
+
+    @timed
+    def system_contract_invoice(self, employeeId, billing_period=None):
+        run = self.start_billing_run(
+            employeeId, billing_period).run_to_completion()
         res = {"system_contract_invoice": "success"}
         self.show_success(res)
         return {
             "system_contract_invoice": "success",
             "employee_id": employeeId,
-            "residents": [
-                {
-                    "id": resident.id,
-                    "invoice": [invoice.id for invoice in resident.invoices]
-                } for resident in residents
-            ]
+            "run_id": run.id,
+            "billing_period": run.period,
+            "contracts_processed": run.processed,
+            "invoices_issued": run.invoices_issued,
+            "skipped_already_billed": run.skipped,
         }
 
+    @timed
     def select_payment_method_and_invoices(self, Resident_ID_input, payment_method_input, invoice_ids):
-        resident = self.search_resident_by_id(Resident_ID_input)
-        payment = resident.set_payment(payment_method_input, invoice_ids)
-        payment_format = payment.payment_method.payment_format()
-        selected_invoices = [
-            {
-                "invoice_id": invoice.id,
-                "amount": invoice.amount,
-                "status": invoice.status.value,
+        with self.__locks.hold(("resident", Resident_ID_input)):
+            resident = self.search_resident_by_id(Resident_ID_input)
+            payment = resident.set_payment(payment_method_input, invoice_ids)
+            self.__save(resident)
+            payment_format = payment.payment_method.payment_format()
+            selected_invoices = [
+                {
+                    "invoice_id": invoice.id,
+                    "amount": invoice.amount,
+                    "status": invoice.status.value,
+                }
+                for invoice in payment.invoice_list
+            ]
+            gross_amount = sum(invoice["amount"] for invoice in selected_invoices)
+            net_amount = payment.net_amount
+
+            result = {
+                "select_payment_method_and_invoices": "success",
+                "resident_id": resident.id,
+                "payment_method": payment_method_input,
+                "selected_invoices": selected_invoices,
+                "summary": {
+                    "gross_amount": gross_amount,
+                    "net_amount": net_amount,
+                    "discount_amount": gross_amount - net_amount,
+                },
+                "payment_format": payment_format,
             }
-            for invoice in payment.invoice_list
-        ]
-        gross_amount = sum(invoice["amount"] for invoice in selected_invoices)
-        net_amount = payment.net_amount
-
-        result = {
-            "select_payment_method_and_invoices": "success",
-            "resident_id": resident.id,
-            "payment_method": payment_method_input,
-            "selected_invoices": selected_invoices,
-            "summary": {
-                "gross_amount": gross_amount,
-                "net_amount": net_amount,
-                "discount_amount": gross_amount - net_amount,
-            },
-            "payment_format": payment_format,
-        }
-        return self.show_success(result)
+            return self.show_success(result)
 
+    @timed
     def payment_system(self, Resident_ID_input, paymentdata):
-        resident = self.search_resident_by_id(Resident_ID_input)
-        receipt = resident.payment(paymentdata)
-        receipt_id = receipt.id
-        s = f'payment_system : success\nreceipt : {receipt_id}'
-        self.show_success(s)
-        return s
-
+        with self.__locks.hold(("resident", Resident_ID_input)):
+            resident = self.search_resident_by_id(Resident_ID_input)
+            receipt = resident.payment(paymentdata)
+            self.__save(resident, receipt, *receipt.payment.invoice_list)
+            receipt_id = receipt.id
+            s = f'payment_system : success\nreceipt : {receipt_id}'
+            self.show_success(s)
+            return s
+
+    @timed
     def change_contract(self,
                         residentId,
                         currentLeaseContractId,
                         targetRoomId,
                         moveDate
                         ):
-        resident = self.search_resident_by_id(residentId)
-        if resident is None:
-            return {"response": "resident not found"}
-
-        current_contract = resident.search_contract_by_id(
-            currentLeaseContractId)
-        if current_contract is None:
-            return {"response": "current contract not found"}
-
-        if current_contract.status == ContractStatus.EXPIRED:
-            return {"response": "expired contract not found"}
-
-        target_room = self.search_room_by_id(targetRoomId)
-
-        if target_room.status != RoomStatus.AVAILABLE:
-            print(target_room.status, RoomStatus.AVAILABLE)
-            return {"response": "target room not available"}
-
-        unpaid_invoices = [
-            invoice for invoice in resident.invoices
-            if invoice.status == InvoiceStatus.UNPAID
-        ]
-        if len(unpaid_invoices) > 0:
-            return {"response": "please settle existing invoices before changing contract"}
+        with self.__hold_resolved(lambda: self.__change_contract_keys(
+                residentId, currentLeaseContractId, targetRoomId)):
+            resident = self.search_resident_by_id(residentId)
+            if resident is None:
+                return {"response": "resident not found"}
+
+            current_contract = resident.search_contract_by_id(
+                currentLeaseContractId)
+            if current_contract is None:
+                return {"response": "current contract not found"}
+
+            if current_contract.status == ContractStatus.EXPIRED:
+                return {"response": "expired contract not found"}
+
+            target_room = self.search_room_by_id(targetRoomId)
+
+            if target_room.status != RoomStatus.AVAILABLE:
+                log.debug("change_contract.room_unavailable",
+                          room_id=target_room.id, status=target_room.status.value)
+                return {"response": "target room not available"}
+
+            unpaid_invoices = [
+                invoice for invoice in resident.invoices
+                if invoice.status == InvoiceStatus.UNPAID
+            ]
+            if len(unpaid_invoices) > 0:
+                return {"response": "please settle existing invoices before changing contract"}
 
-        invoice = current_contract.calculate_upgrade_amount(
-            target_room.monthly_rent, moveDate)
-        old_room = current_contract.room
-        old_room.status = RoomStatus.AVAILABLE
-        current_contract.room = target_room
-        target_room.status = RoomStatus.OCCUPIED
+            invoice = current_contract.calculate_upgrade_amount(
+                target_room.monthly_rent, moveDate)
+            old_room = current_contract.room
+            old_room.status = RoomStatus.AVAILABLE
+            current_contract.room = target_room
+            target_room.status = RoomStatus.OCCUPIED
+            self.__registry.index_contract(resident, current_contract)
 
-        resident.add_invoice(invoice)
-        return {
-            "resident": {
-                "id": resident.id,
-                "new_room": target_room.id,
-                "invoice": {
-                    "id": invoice.id,
-                    "amount": invoice.amount,
-                } if invoice else None,
-            },
-            "old-room": {
-                "id": old_room.id,
-                "status": old_room.status.value,
+            resident.add_invoice(invoice)
+            self.__save(resident, current_contract, old_room, target_room, invoice)
+            return {
+                "resident": {
+                    "id": resident.id,
+                    "new_room": target_room.id,
+                    "invoice": {
+                        "id": invoice.id,
+                        "amount": invoice.amount,
+                    } if invoice else None,
+                },
+                "old-room": {
+                    "id": old_room.id,
+                    "status": old_room.status.value,
+                }
             }
-        }
 
+    @timed
     def display_invoice(self, resident_id_input):
         resident = self.search_resident_by_id(resident_id_input)
         invoices = [
@@ -585,6 +1076,39 @@ class Dorm:
         }
         return self.show_success(result)
 
+    @timed
+    def display_vacancy(self, building_id):
+        building = self.search_building_by_id(building_id)
+        return {
+            "building_id": building.id,
+            "vacancy": building.vacancy_by_type(),
+        }
+
+    def entity_gauges(self):
+        """Counts behind the /metrics gauges. Walks every room and resident, so cache it."""
+        rooms = {status.value: 0 for status in RoomStatus}
+        open_maintenance = open_cleaning = 0
+        for building in self.__buildings:
+            for room in building.rooms:
+                rooms[room.status.value] += 1
+                open_maintenance += sum(1 for ticket in room.maintenance_tickets
+                                        if ticket.status != MaintenanceStatus.RESOLVED)
+                open_cleaning += sum(1 for ticket in room.cleaning_tickets
+                                     if ticket.status != CleaningStatus.FINISHED)
+        unpaid = pending_payments = 0
+        for resident in self.__residents:
+            unpaid += sum(1 for invoice in resident.invoices
+                          if invoice.status == InvoiceStatus.UNPAID)
+            pending_payments += resident.pending_payment is not None
+        return {
+            "rooms": rooms,
+            "unpaid_invoices": unpaid,
+            "open_maintenance_tickets": open_maintenance,
+            "open_cleaning_tickets": open_cleaning,
+            "pending_payments": pending_payments,
+        }
+
+    @timed
     def display_receipt(self, resident_id_input):
         resident = self.search_resident_by_id(resident_id_input)
         receipts = [
@@ -602,90 +1126,140 @@ class Dorm:
         }
         return self.show_success(result)
 
+    @timed
     def create_member(self, resident_id_input, type_member):
-        resident = self.search_resident_by_id(resident_id_input)
-        employee = self.search_available_employee()
-        invoice = employee.assign_member(resident, type_member)
-        resident.add_invoice(invoice)
-        s = f"create_member: success, ID: {invoice.id}, amount: {invoice.amount}"
-        self.show_success(s)
-        return {
-            "response": "success",
-            "invoice_id": invoice.id,
-            "amount": invoice.amount,
-        }
+        with self.__locks.hold(("resident", resident_id_input)):
+            resident = self.search_resident_by_id(resident_id_input)
+            employee = self.search_available_employee()
+            invoice = employee.assign_member(resident, type_member)
+            resident.add_invoice(invoice)
+            self.__save(resident, invoice)
+            s = f"create_member: success, ID: {invoice.id}, amount: {invoice.amount}"
+            self.show_success(s)
+            return {
+                "response": "success",
+                "invoice_id": invoice.id,
+                "amount": invoice.amount,
+            }
 
+    @timed
     def add_strike(self, employee_ID_input):
         employee = self.search_employee_by_id(employee_ID_input)
         now = datetime.datetime.now()
-        residents_to_blacklist = []
-
-        for resident in self.__residents:
-            max_strike = 0
-
-            for invoice in resident.invoices:
-                if invoice.status == InvoiceStatus.PAID:
-                    continue
-
-                age = now - invoice.date_create
-                months_old = age.days // 30
-
-                if months_old >= 3:
-                    strike = 3
-                elif months_old >= 2:
-                    strike = 2
-                elif months_old >= 1:
-                    strike = 1
-                else:
-                    strike = 0
-
-                if strike > max_strike:
-                    max_strike = strike
-
-            if max_strike > 0:
-                resident.add_strike(max_strike)
-
-            if resident.strike >= 3:
-                residents_to_blacklist.append(resident)
-
-        for resident in residents_to_blacklist:
-            self.__residents.remove(resident)
-            self.__blacklist.append(resident)
 
-        s = 'add_strike : success'
-        self.show_success(s)
-        return s
-
-    def sign_in(self, name, email, phone_number):
+        with self.__strike_lock:
+            # strike tiers for every unpaid invoice in one vectorized pass over
+            # the registry's aging columns, taken without workflow locks; each
+            # resident it flags is re-checked under their own
+            struck = []
+            for resident, _ in self.__registry.aging.strikes(now):
+                with self.__locks.hold(("resident", resident.id)):
+                    max_strike = AgingEngine.strike_of(resident, now)
+                    if max_strike > 0:
+                        resident.add_strike(max_strike)
+                        struck.append(resident)
+
+            # the threshold is on every resident's full count, so one who
+            # reached it before, e.g. brought in from another shard, goes too;
+            # strikes only change under the strike lock, and strikes() has
+            # already read every resident
+            candidates = [resident for resident in list(self.__residents) if resident.strike >= 3]
+            with self.__locks.hold(("members",), *(("resident", resident.id)
+                                                    for resident in dict.fromkeys(struck + candidates))):
+                # skip anyone moved off the member list while we were unlocked
+                residents_to_blacklist = [
+                    resident for resident in candidates
+                    if self.__registry.lookup("resident", resident.id) is resident
+                ]
+                if residents_to_blacklist:
+                    blacklisted_ids = {resident.id for resident in residents_to_blacklist}
+                    self.__residents[:] = [
+                        resident for resident in self.__residents
+                        if resident.id not in blacklisted_ids
+                    ]
+                    for resident in residents_to_blacklist:
+                        self.__registry.remove_resident(resident)
+                        self.__registry.add_blacklisted(resident)
+                    self.__blacklist.extend(residents_to_blacklist)
+                self.__save(*struck, members=[
+                    change for resident in residents_to_blacklist
+                    for change in (("residents", resident.id, False),
+                                   ("blacklist", resident.id, True))
+                ])
+
+                s = 'add_strike : success'
+                self.show_success(s)
+                return s
+
+    def check_sign_in(self, name, email, phone_number):
+        """Return the sign-in error message for an applicant, or None if valid."""
         # validate name
         if not name.replace(" ", "").isalpha():
-            e = {"sign_in": "error, name must be letters only"}
-            self.show_error(e)
-            raise ValueError(e)
+            return "error, name must be letters only"
 
         # validate email
         if not re.match(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$", email):
-            e = {"sign_in": "error, invalid email format"}
-            self.show_error(e)
-            raise ValueError(e)
+            return "error, invalid email format"
 
         # validate phone
         if not phone_number.replace("-", "").isdigit() or len(phone_number.replace("-", "").strip()) != 10:
-            e = {"sign_in": "error, phone number must be 10 digits"}
-            self.show_error(e)
-            raise ValueError(e)
+            return "error, phone number must be 10 digits"
 
         # check blacklist
-        for blacklisted in self.__blacklist:
-            if blacklisted.email == email or blacklisted.phone_number == phone_number:
-                e = {"sign_in": "error, email or phone number is blacklisted"}
+        if self.__registry.find_contact("blacklist", email, phone_number) is not None:
+            return "error, email or phone number is blacklisted"
+
+        # check active residents
+        if self.__registry.find_contact("resident", email, phone_number) is not None:
+            return "error, email or phone number is already registered"
+
+        return None
+
+    @timed
+    def sign_in(self, name, email, phone_number):
+        with self.__locks.hold(("members",)):
+            error = self.check_sign_in(name, email, phone_number)
+            if error is not None:
+                e = {"sign_in": error}
                 self.show_error(e)
                 raise ValueError(e)
 
-        resident = Resident(name, email, phone_number)
-        self.add_resident(resident)
-        s = {
-            "sign_in": "success",
-            "your_id_is": resident.id
-        }
-        return self.show_success(s)
+            resident = Resident(name, email, phone_number)
+            self.add_resident(resident)
+            s = {
+                "sign_in": "success",
+                "your_id_is": resident.id
+            }
+            return self.show_success(s)
+
+    @timed
+    def bulk_sign_in(self, applicants):
+        """Register many applicants at once; returns accepted ids and rejections."""
+        accepted = []
+        rejected = []
+        residents = []
+        with self.__locks.hold(("members",)):
+            for applicant in applicants:
+                name = applicant["name"]
+                email = applicant["email"]
+                phone_number = applicant["phoneNumber"]
+                # the indexes already cover earlier applicants of this batch
+                error = self.check_sign_in(name, email, phone_number)
+                if error is not None:
+                    rejected.append({"email": email, "error": error})
+                    continue
+                resident = Resident(name, email, phone_number)
+                self.__residents.append(resident)
+                self.__registry.add_resident(resident)
+                residents.append(resident)
+                accepted.append({"email": email, "resident_id": resident.id})
+            self.__save(*residents, members=[("residents", resident.id, True)
+                                             for resident in residents])
+
+            s = {
+                "bulk_sign_in": "success",
+                "accepted_count": len(accepted),
+                "rejected_count": len(rejected),
+            }
+            self.show_success(s)
+            return {**s, "accepted": accepted, "rejected": rejected}
@@ -3,19 +3,17 @@ from .enum import *
 from .maintenance_ticket import *
 from .invoice import Invoice
 from .member import Standard_Member, Plus_Member, Platinum_Member
+from .id_allocator import next_id
+from .tracing import traced
 
 
 class Employee:
-    ID = 1
-
     def __init__(self, name):
-        self.__id = f"EM-{Employee.ID:04d}"
+        self.__id = f"EM-{next_id('employee'):04d}"
         self.__date_create = datetime.now()
         self.__name = name
         self.__status = AvailabilityStatus.AVAILABLE
 
-        Employee.ID += 1
-
     @property
     def name(self):
         return self.__name
@@ -28,6 +26,7 @@ class Employee:
     def status(self):
         return self.__status
 
+    @traced
     def start_maintenance(self, reporter, technicians, room, issue_category):
         self.__status = AvailabilityStatus.UNAVAILABLE
 
@@ -49,6 +48,7 @@ class Employee:
             "status": f"{ticket.status.value}"
         }
 
+    @traced
     def find_available_technician(self, technicians):
         for tc in technicians:
             if tc.status == AvailabilityStatus.AVAILABLE:
@@ -56,6 +56,7 @@ class Employee:
         self.__status = AvailabilityStatus.AVAILABLE
         raise Exception("no available technician")
 
+    @traced
     def create_maintenance_ticket(self, reporter, room_id, issue_category, technician):
         ticket = MaintenanceTicket(
             reporter.id,
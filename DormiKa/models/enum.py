@@ -55,6 +55,7 @@ class InvoiceType(Enum):
 class InvoiceStatus(Enum):
     PAID = "paid"
     UNPAID = "unpaid"
+    CANCELLED = "cancelled"
 
 
 class AvailabilityStatus(Enum):
@@ -118,3 +119,10 @@ class MaintenanceCost(Enum):
     ELECTRICAL = 750
     PLUMBING = 1000
     AC = 500
+
+
+class BillingRunStatus(Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
@@ -0,0 +1,156 @@
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import weakref
+
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+
+class EventLog:
+    """Structured events written as JSON lines by a background thread.
+
+    emit() only checks the level and sample rate and enqueues; the
+    writer thread serializes and writes events in batches. When the
+    queue is full, events are dropped and counted instead of blocking
+    the caller. WARNING and above are never sampled out.
+    """
+
+    QUEUE_SIZE = 10000
+    BATCH_SIZE = 256
+    # longest an event waits in the queue before being written
+    FLUSH_INTERVAL = 0.2
+
+    def __init__(self, sink=None, level: str = "INFO", sample_rate: float = 1.0,
+                 queue_size: int = None, batch_size: int = None):
+        # a path is opened for appending; None writes to stdout
+        self.__sink = sink
+        self.__file = None
+        self.__level = LEVELS[level.upper()]
+        self.__sample_rate = sample_rate
+        self.__queue_size = queue_size or EventLog.QUEUE_SIZE
+        self.__batch_size = batch_size or EventLog.BATCH_SIZE
+        self.__queue = queue.Queue(self.__queue_size)
+        self.__writer = None
+        self.__start_lock = threading.Lock()
+        self.__dropped = 0
+        log = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: log() is not None and log().__reset())
+        atexit.register(lambda: log() is not None and log().close())
+
+    @property
+    def level(self):
+        return next(name for name, value in LEVELS.items() if value == self.__level)
+
+    @property
+    def sample_rate(self):
+        return self.__sample_rate
+
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    def enabled(self, level: str) -> bool:
+        return LEVELS[level] >= self.__level
+
+    def emit(self, level: str, event: str, **fields):
+        severity = LEVELS[level]
+        if severity < self.__level:
+            return
+        if severity < LEVELS["WARNING"] and self.__sample_rate < 1.0 \
+                and random.random() >= self.__sample_rate:
+            return
+        if self.__writer is None:
+            self.__start()
+        try:
+            self.__queue.put_nowait((time.time(), level, event, fields))
+        except queue.Full:
+            self.__dropped += 1
+
+    def debug(self, event, **fields):
+        self.emit("DEBUG", event, **fields)
+
+    def info(self, event, **fields):
+        self.emit("INFO", event, **fields)
+
+    def warning(self, event, **fields):
+        self.emit("WARNING", event, **fields)
+
+    def error(self, event, **fields):
+        self.emit("ERROR", event, **fields)
+
+    def flush(self):
+        """Block until every event queued so far is written."""
+        if self.__writer is not None:
+            self.__queue.join()
+
+    def close(self):
+        if self.__writer is None:
+            return
+        self.__queue.put(None)
+        self.__writer.join()
+        self.__writer = None
+        if self.__file is not None and self.__file is not sys.stdout:
+            self.__file.close()
+        self.__file = None
+
+    def __start(self):
+        with self.__start_lock:
+            if self.__writer is not None:
+                return
+            if self.__file is None:
+                self.__file = sys.stdout if self.__sink is None else open(
+                    self.__sink, "a", encoding="utf-8")
+            self.__writer = threading.Thread(
+                target=self.__write, name="dormika-event-log", daemon=True)
+            self.__writer.start()
+
+    def __write(self):
+        while True:
+            try:
+                first = self.__queue.get(timeout=EventLog.FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while len(batch) < self.__batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for entry in batch:
+                if entry is None:
+                    continue
+                timestamp, level, event, fields = entry
+                lines.append(json.dumps(
+                    {"ts": round(timestamp, 6), "level": level, "event": event, **fields},
+                    default=str, ensure_ascii=False))
+            if lines:
+                try:
+                    self.__file.write("\n".join(lines) + "\n")
+                    self.__file.flush()
+                except (OSError, ValueError):
+                    self.__dropped += len(lines)
+            for _ in batch:
+                self.__queue.task_done()
+            if None in batch:
+                return
+
+    def __reset(self):
+        # the parent's writer thread does not exist in a forked child
+        self.__queue = queue.Queue(self.__queue_size)
+        self.__writer = None
+        self.__start_lock = threading.Lock()
+
+
+# DORMIKA_LOG names a file to append to; unset or "-" writes to stdout
+log = EventLog(
+    sink=None if os.environ.get("DORMIKA_LOG", "-") == "-" else os.environ["DORMIKA_LOG"],
+    level=os.environ.get("DORMIKA_LOG_LEVEL", "INFO"),
+    sample_rate=float(os.environ.get("DORMIKA_LOG_SAMPLE", 1.0)),
+)
@@ -1,17 +1,20 @@
+from datetime import datetime, timedelta
 from .enum import *
+from .id_allocator import next_id
 
 
 class BookingShareFacility:
-    ID = 1
-
-    def __init__(self, resident_id, facility_id, building_id, booking_time):
-        self.__id = f"BOOKING-{BookingShareFacility.ID:04d}"
+    def __init__(self, resident_id, facility_id, building_id, booking_time, duration_minutes=60):
+        self.__id = f"BOOKING-{next_id('facility_booking'):04d}"
         self.__resident_id = resident_id
         self.__facility_id = facility_id
         self.__building_id = building_id
         self.__booking_time = booking_time
+        self.__start_time = BookingShareFacility.parse_booking_time(
+            booking_time)
+        self.__end_time = self.__start_time + \
+            timedelta(minutes=duration_minutes)
         self.__status = BookingShareFacilityStatus.BOOKED
-        BookingShareFacility.ID += 1
 
     @property
     def id(self):
@@ -25,9 +28,26 @@ class BookingShareFacility:
     def booking_time(self):
         return self.__booking_time
 
+    @property
+    def start_time(self):
+        return self.__start_time
+
+    @property
+    def end_time(self):
+        return self.__end_time
+
     @property
     def status(self):
         return self.__status
 
-    def check_booking_time(self, facility_id, booking_time):
-        return self.__facility_id == facility_id and self.__booking_time == booking_time
+    @staticmethod
+    def parse_booking_time(booking_time):
+        try:
+            return datetime.fromisoformat(booking_time.strip())
+        except (AttributeError, ValueError):
+            raise ValueError(
+                "booking time must be 'YYYY-MM-DD HH:MM' or 'YYYY-MM-DD HH:MM:SS'")
+
+    def check_booking_time(self, facility_id, start_time, end_time):
+        return (self.__facility_id == facility_id
+                and self.__start_time < end_time and start_time < self.__end_time)
@@ -0,0 +1,50 @@
+from bisect import bisect_left, bisect_right
+
+
+class FacilitySchedule:
+    """Sorted, non-overlapping booking intervals for one shared facility.
+
+    Intervals are half-open [start, end), so back-to-back slots do not
+    conflict. Bookings never overlap, which keeps the end times sorted in
+    the same order as the start times.
+    """
+
+    def __init__(self):
+        self.__starts = []
+        self.__ends = []
+        self.__bookings = []
+
+    def __len__(self):
+        return len(self.__starts)
+
+    def conflicts(self, start, end):
+        i = bisect_right(self.__starts, start)
+        if i > 0 and self.__ends[i - 1] > start:
+            return True
+        return i < len(self.__starts) and self.__starts[i] < end
+
+    def add(self, booking):
+        if self.conflicts(booking.start_time, booking.end_time):
+            raise ValueError("this share facility already booking")
+        i = bisect_right(self.__starts, booking.start_time)
+        self.__starts.insert(i, booking.start_time)
+        self.__ends.insert(i, booking.end_time)
+        self.__bookings.insert(i, booking)
+
+    def bookings_between(self, start, end):
+        """Bookings that overlap [start, end), in start order."""
+        i = bisect_right(self.__ends, start)
+        j = bisect_left(self.__starts, end)
+        return self.__bookings[i:j]
+
+    def free_slots(self, start, end):
+        """Gaps in [start, end) not covered by any booking."""
+        slots = []
+        cursor = start
+        for booking in self.bookings_between(start, end):
+            if booking.start_time > cursor:
+                slots.append((cursor, booking.start_time))
+            cursor = max(cursor, booking.end_time)
+        if cursor < end:
+            slots.append((cursor, end))
+        return slots
@@ -0,0 +1,73 @@
+import heapq
+import itertools
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from .enum import ContractStatus, RoomStatus
+
+
+class HoldSweeper:
+    """Min-heap of room holds keyed by expiry time.
+
+    Entries are never removed eagerly; a popped entry whose room was
+    occupied or re-held since it was scheduled is simply dropped. A hold
+    covers signing and paying: a contract still DRAFT or PENDING_SIGN when
+    it runs out is terminated and its unpaid contract invoice cancelled.
+    """
+
+    def __init__(self):
+        self.__heap = []
+        self.__sequence = itertools.count()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__heap)
+
+    @property
+    def next_expiry(self):
+        return self.__heap[0][0] if self.__heap else None
+
+    def schedule(self, resident, room, contract):
+        if room.hold_expiry is None:
+            return
+        with self.__lock:
+            heapq.heappush(self.__heap, (room.hold_expiry, next(self.__sequence),
+                                         resident, room, contract))
+
+    def entries(self):
+        """(expiry, resident, room, contract) of every scheduled hold."""
+        with self.__lock:
+            return [(expiry, resident, room, contract)
+                    for expiry, _, resident, room, contract in self.__heap]
+
+    def restore(self, entries):
+        """Schedule entries as returned by entries(), without reading the rooms."""
+        with self.__lock:
+            for expiry, resident, room, contract in entries:
+                self.__heap.append((expiry, next(self.__sequence), resident, room, contract))
+            heapq.heapify(self.__heap)
+
+    def sweep(self, now: datetime = None, guard=None):
+        """Release every hold that expired by `now`; return (resident, contract) pairs.
+
+        guard(resident, room), if given, returns the context each release
+        runs under, so it cannot interleave with a workflow on the same room.
+        """
+        now = now or datetime.now()
+        due = []
+        with self.__lock:
+            while self.__heap and self.__heap[0][0] <= now:
+                due.append(heapq.heappop(self.__heap))
+        released = []
+        for expiry, _, resident, room, contract in due:
+            with guard(resident, room) if guard else nullcontext():
+                if room.hold_expiry != expiry or room.status != RoomStatus.RESERVED:
+                    continue
+                if contract.status not in (ContractStatus.DRAFT, ContractStatus.PENDING_SIGN):
+                    continue
+                room.is_hold_expired(now)
+                contract.status = ContractStatus.TERMINATED
+                if contract.invoice_id is not None:
+                    resident.cancel_invoice(contract.invoice_id)
+                released.append((resident, contract))
+        return released
@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import threading
+import weakref
+
+
+class MemoryIdStore:
+    """High-water marks kept in this process only."""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__marks = {}
+
+    def reserve(self, sequence, count):
+        """Claim count numbers of sequence and return the first one."""
+        with self.__lock:
+            start = self.__marks.get(sequence, 1)
+            self.__marks[sequence] = start + count
+            return start
+
+    def high_water_marks(self):
+        with self.__lock:
+            return dict(self.__marks)
+
+    def advance(self, marks):
+        """Raise the marks to at least marks; numbers are never handed out twice."""
+        with self.__lock:
+            for sequence, value in marks.items():
+                self.__marks[sequence] = max(self.__marks.get(sequence, 1), value)
+
+
+class SQLiteIdStore:
+    """High-water marks in a SQLite file, shared by every process that opens it."""
+
+    def __init__(self, path: str):
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute(
+            """CREATE TABLE IF NOT EXISTS id_marks (
+                   sequence TEXT PRIMARY KEY,
+                   next INTEGER NOT NULL
+               )""")
+
+    def reserve(self, sequence, count):
+        with self.__lock:
+            connection = self.__connection
+            # IMMEDIATE takes the write lock up front, so two processes
+            # cannot read the same mark
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT next FROM id_marks WHERE sequence = ?", (sequence,)).fetchone()
+                start = row[0] if row is not None else 1
+                connection.execute(
+                    "INSERT OR REPLACE INTO id_marks (sequence, next) VALUES (?, ?)",
+                    (sequence, start + count))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            return start
+
+    def high_water_marks(self):
+        with self.__lock:
+            return dict(self.__connection.execute("SELECT sequence, next FROM id_marks"))
+
+    def advance(self, marks):
+        with self.__lock:
+            connection = self.__connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for sequence, value in marks.items():
+                    connection.execute(
+                        """INSERT INTO id_marks (sequence, next) VALUES (?, ?)
+                           ON CONFLICT (sequence) DO UPDATE SET next = max(next, excluded.next)""",
+                        (sequence, value))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+
+class IdAllocator:
+    """Hands out entity numbers, a block at a time per thread.
+
+    Each thread draws numbers from its own block without locking; only
+    claiming the next block goes through the store, whose high-water
+    mark is what gets persisted. Numbers left in a block when the process
+    stops are skipped, so ids are unique but may have gaps.
+    """
+
+    BLOCK_SIZE = 64
+
+    def __init__(self, store=None, block_size: int = None):
+        self.__store = store or MemoryIdStore()
+        self.__block_size = block_size or IdAllocator.BLOCK_SIZE
+        self.__local = threading.local()
+        # bumped to invalidate every thread's blocks at once
+        self.__epoch = 0
+        allocator = weakref.ref(self)
+        os.register_at_fork(
+            after_in_child=lambda: allocator() is not None and allocator().discard_blocks())
+
+    @property
+    def store(self):
+        return self.__store
+
+    def use_store(self, store):
+        """Switch to store, carrying the current high-water marks over."""
+        store.advance(self.__store.high_water_marks())
+        self.__store = store
+        self.discard_blocks()
+
+    def next(self, sequence: str) -> int:
+        try:
+            block = self.__local.blocks[sequence]
+        except AttributeError:
+            self.__local.blocks = {}
+            block = None
+        except KeyError:
+            block = None
+        if block is None or block[0] >= block[1] or block[2] != self.__epoch:
+            block = self.__claim(sequence)
+        number = block[0]
+        block[0] += 1
+        return number
+
+    def __claim(self, sequence):
+        start = self.__store.reserve(sequence, self.__block_size)
+        block = [start, start + self.__block_size, self.__epoch]
+        self.__local.blocks[sequence] = block
+        return block
+
+    def discard_blocks(self):
+        """Drop every thread's unused numbers, e.g. in a forked child that shares them."""
+        self.__epoch += 1
+
+    def high_water_marks(self):
+        return self.__store.high_water_marks()
+
+    def advance(self, marks):
+        """Raise the marks, e.g. to those of restored state; blocks claimed
+        below them are dropped so no number is handed out twice."""
+        self.__store.advance(marks)
+        self.discard_blocks()
+
+
+ids = IdAllocator()
+
+
+def next_id(sequence: str) -> int:
+    return ids.next(sequence)
@@ -1,19 +1,17 @@
 from datetime import datetime
 from .enum import InvoiceStatus, InvoiceType
+from .id_allocator import next_id
 
 
 class Invoice:
-    _running_number = 1
-
-    def __init__(self, type, amount, status, room_id=None):
-        self.__id = f"INV-{Invoice._running_number:04d}"
+    def __init__(self, type, amount, status, room_id=None, date_create: datetime = None):
+        self.__id = f"INV-{next_id('invoice'):04d}"
         self.__type = type
         self.__amount = amount
         self.__room_id = room_id
         self.__status = status
-        self.__date_create = datetime.now()
-
-        Invoice._running_number += 1
+        # set for invoices loaded from history rather than issued now
+        self.__date_create = date_create or datetime.now()
 
     @property
     def id(self):
@@ -38,6 +36,8 @@ class Invoice:
     def validate_for_payment(self):
         if self.__status == InvoiceStatus.PAID:
             raise ValueError(f"Invoice {self.__id} is already paid")
+        if self.__status == InvoiceStatus.CANCELLED:
+            raise ValueError(f"Invoice {self.__id} was cancelled")
 
     def PAID(self):
         self.__status = InvoiceStatus.PAID
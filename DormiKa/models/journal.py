@@ -0,0 +1,353 @@
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+from .event_log import log
+from .repository import (
+    Repository, MEMBER_LISTS, collect_rows, load_state, read_counters, restore_entities,
+)
+
+
+class JournalRepository(Repository):
+    """Durable storage as an append-only event log plus periodic snapshots.
+
+    Every save() is one event: the states of the entities a workflow
+    touched, its member list changes and billing ledger keys. Events are
+    appended to numbered segment files and made durable with group commit:
+    a single flusher thread fsyncs on behalf of every save waiting on it.
+    Once enough events pile up, a compactor thread folds the latest
+    snapshot and the closed segments after it into a new snapshot and
+    deletes the segments it covers, so a restart reads the latest snapshot
+    and replays only the log tail. Saves never wait for it, and entity
+    state lives only on disk.
+
+    Like SQLiteRepository, events and states are pickles loaded through
+    the same restricted unpickler; only open directories this application
+    wrote itself.
+    """
+
+    SEGMENT_BYTES = 8 * 1024 * 1024
+    SNAPSHOT_EVENTS = 5000
+    # length and crc32 of the payload that follows
+    HEADER = struct.Struct("<II")
+    SNAPSHOT_MAGIC = b"DKSNAP1\n"
+
+    def __init__(self, directory: str, segment_bytes: int = None, snapshot_events: int = None):
+        self.__directory = directory
+        self.__segment_bytes = segment_bytes or JournalRepository.SEGMENT_BYTES
+        self.__snapshot_events = snapshot_events or JournalRepository.SNAPSHOT_EVENTS
+        os.makedirs(directory, exist_ok=True)
+
+        # (kind, id) of every entity saved, so references to them are not written again
+        self.__stored = set()
+
+        self.__lock = threading.Lock()
+        self.__snapshot_lock = threading.Lock()
+        self.__sync = threading.Condition()
+        self.__written = 0
+        self.__synced = 0
+        self.__retired = []
+        self.__closing = False
+        self.__events_since_snapshot = 0
+        self.__compaction = threading.Condition()
+        self.__compaction_due = False
+
+        self.__segment, self.__file, self.__recovered = self.__recover()
+        self.__flusher = threading.Thread(
+            target=self.__flush_loop, name="journal-flusher", daemon=True)
+        self.__flusher.start()
+        self.__compactor = threading.Thread(
+            target=self.__compact_loop, name="journal-compactor", daemon=True)
+        self.__compactor.start()
+
+    @property
+    def directory(self):
+        return self.__directory
+
+    @property
+    def segment(self):
+        return self.__segment
+
+    # ==================== Files ====================
+
+    def __path(self, prefix, number, suffix):
+        return os.path.join(self.__directory, f"{prefix}-{number:08d}{suffix}")
+
+    def __numbered(self, prefix, suffix):
+        numbers = []
+        for file_name in os.listdir(self.__directory):
+            if file_name.startswith(prefix + "-") and file_name.endswith(suffix):
+                number = file_name[len(prefix) + 1:-len(suffix)]
+                if number.isdigit():
+                    numbers.append(int(number))
+        return sorted(numbers)
+
+    def __segment_path(self, number):
+        return self.__path("journal", number, ".log")
+
+    def __snapshot_path(self, number):
+        return self.__path("snapshot", number, ".snap")
+
+    @staticmethod
+    def __frame(payload):
+        return JournalRepository.HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    @staticmethod
+    def __read_frames(data):
+        """Yield (payload, end offset) for every intact frame in data."""
+        header = JournalRepository.HEADER
+        offset = 0
+        while offset + header.size <= len(data):
+            length, crc = header.unpack_from(data, offset)
+            start = offset + header.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            offset = start + length
+            yield payload, offset
+
+    @staticmethod
+    def __torn(data, offset):
+        """Whether the bad frame at offset runs to the end of data, as a cut-off append does."""
+        header = JournalRepository.HEADER
+        if offset + header.size > len(data):
+            return True
+        length, _ = header.unpack_from(data, offset)
+        return offset + header.size + length >= len(data)
+
+    # ==================== Recovery ====================
+
+    def __recover(self):
+        state, segments = self.__fold(recovering=True)
+        self.__stored = set(state["rows"])
+        number = segments[-1] if segments else max(state["snapshot"], 1)
+        return number, open(self.__segment_path(number), "ab", buffering=0), state
+
+    def __fold(self, below=None, recovering=False):
+        """The state in the latest snapshot plus the segments after it, up to below.
+
+        On recovery a torn event at the tail of the last segment is cut
+        off; anything else unreadable is corruption.
+        """
+        state = None
+        for number in reversed(self.__numbered("snapshot", ".snap")):
+            if below is None or number < below:
+                state = self.__read_snapshot(number)
+                if state is not None:
+                    state["snapshot"] = number
+                    break
+        if state is None:
+            state = {"name": None, "rows": {}, "ledger": set(), "counters": {}, "snapshot": 0,
+                     "members": {list_name: {} for list_name in MEMBER_LISTS}}
+
+        segments = [number for number in self.__numbered("journal", ".log")
+                    if number >= state["snapshot"] and (below is None or number < below)]
+        for index, number in enumerate(segments):
+            path = self.__segment_path(number)
+            with open(path, "rb") as segment_file:
+                data = segment_file.read()
+            end = 0
+            for payload, end in JournalRepository.__read_frames(data):
+                JournalRepository.__apply(state, load_state(payload))
+                if recovering:
+                    self.__events_since_snapshot += 1
+            if end < len(data):
+                if (not recovering or index != len(segments) - 1
+                        or not JournalRepository.__torn(data, end)):
+                    raise ValueError(f"Journal segment {path} is corrupt")
+                # a torn write at the tail: drop the partial event
+                with open(path, "r+b") as segment_file:
+                    segment_file.truncate(end)
+        return state, segments
+
+    def __read_snapshot(self, number):
+        with open(self.__snapshot_path(number), "rb") as snapshot_file:
+            data = snapshot_file.read()
+        magic = JournalRepository.SNAPSHOT_MAGIC
+        if not data.startswith(magic):
+            return None
+        frames = list(JournalRepository.__read_frames(data[len(magic):]))
+        if len(frames) != 1:
+            return None
+        state = load_state(frames[0][0])
+        return {
+            "name": state["name"],
+            "rows": state["rows"],
+            "members": {list_name: dict.fromkeys(state["members"].get(list_name, ()))
+                        for list_name in MEMBER_LISTS},
+            "ledger": set(state["ledger"]),
+            "counters": state["counters"],
+        }
+
+    @staticmethod
+    def __apply(state, event):
+        rows, members, ledger, counters, name = event
+        for kind, entity_id, class_name, data in rows:
+            state["rows"][(kind, entity_id)] = (class_name, data)
+        for list_name, entity_id, present in members:
+            if present:
+                state["members"][list_name].setdefault(entity_id)
+            else:
+                state["members"][list_name].pop(entity_id, None)
+        state["ledger"].update(ledger)
+        state["counters"] = counters
+        if name is not None:
+            state["name"] = name
+
+    # ==================== Repository ====================
+
+    def load(self):
+        with self.__snapshot_lock, self.__lock:
+            # what recovery read serves the first load; later ones read the files again
+            state, self.__recovered = self.__recovered, None
+            if state is None:
+                state, _ = self.__fold()
+            if state["name"] is None:
+                return None
+            rows = [(kind, entity_id, class_name, data)
+                    for (kind, entity_id), (class_name, data) in state["rows"].items()]
+            return {
+                "name": state["name"],
+                "entities": restore_entities(rows),
+                "members": {list_name: list(ids) for list_name, ids in state["members"].items()},
+                "counters": dict(state["counters"]),
+                "ledger": list(state["ledger"]),
+            }
+
+    def save(self, entities=(), members=(), ledger=(), name=None):
+        with self.__lock:
+            if self.__closing:
+                raise ValueError("Journal is closed")
+            rows = collect_rows(entities, self.__stored)
+            event = (rows, list(members), list(ledger), read_counters(), name)
+            self.__file.write(JournalRepository.__frame(
+                pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)))
+            self.__stored.update((kind, entity_id) for kind, entity_id, _, _ in rows)
+            self.__written += 1
+            target = self.__written
+            self.__events_since_snapshot += 1
+            if self.__file.tell() >= self.__segment_bytes:
+                self.__rotate()
+            snapshot_due = self.__events_since_snapshot >= self.__snapshot_events
+
+        if snapshot_due:
+            with self.__compaction:
+                self.__compaction_due = True
+                self.__compaction.notify()
+        self.__wait_synced(target)
+
+    def __rotate(self):
+        self.__retired.append(self.__file)
+        self.__segment += 1
+        self.__file = open(self.__segment_path(self.__segment), "ab", buffering=0)
+
+    # ==================== Group commit ====================
+
+    def __wait_synced(self, target):
+        with self.__sync:
+            self.__sync.notify_all()
+            while self.__synced < target and not self.__closing:
+                self.__sync.wait()
+
+    def __flush_loop(self):
+        while True:
+            with self.__sync:
+                while self.__synced == self.__written and not self.__closing:
+                    self.__sync.wait()
+                if self.__closing and self.__synced == self.__written:
+                    return
+            self.__flush()
+
+    def __flush(self):
+        with self.__lock:
+            target = self.__written
+            retired, self.__retired = self.__retired, []
+            current = self.__file
+        # every save up to target is covered by these fsyncs, however many waited
+        for segment_file in retired:
+            os.fsync(segment_file.fileno())
+            segment_file.close()
+        if not current.closed:
+            os.fsync(current.fileno())
+        with self.__sync:
+            self.__synced = max(self.__synced, target)
+            self.__sync.notify_all()
+
+    # ==================== Snapshots ====================
+
+    def __compact_loop(self):
+        while True:
+            with self.__compaction:
+                while not self.__compaction_due and not self.__closing:
+                    self.__compaction.wait()
+                if not self.__compaction_due:
+                    return
+                self.__compaction_due = False
+            try:
+                self.snapshot()
+            except Exception as e:
+                # the segments are all still there; the next compaction retries
+                log.error("journal.compaction_failed", error=repr(e))
+
+    def snapshot(self):
+        """Write the full state and drop the log segments it covers."""
+        with self.__snapshot_lock:
+            with self.__lock:
+                self.__rotate()
+                number = self.__segment
+                self.__events_since_snapshot = 0
+            # the segments below number are closed; no save touches them
+            state, _ = self.__fold(below=number)
+            state = {
+                "name": state["name"],
+                "rows": state["rows"],
+                "members": {list_name: list(ids) for list_name, ids in state["members"].items()},
+                "ledger": list(state["ledger"]),
+                "counters": state["counters"],
+            }
+
+            path = self.__snapshot_path(number)
+            temporary = path + ".tmp"
+            with open(temporary, "wb") as snapshot_file:
+                snapshot_file.write(JournalRepository.SNAPSHOT_MAGIC)
+                snapshot_file.write(JournalRepository.__frame(
+                    pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)))
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            os.replace(temporary, path)
+            self.__fsync_directory()
+
+            for old in self.__numbered("journal", ".log"):
+                if old < number:
+                    os.remove(self.__segment_path(old))
+            for old in self.__numbered("snapshot", ".snap"):
+                if old < number:
+                    os.remove(self.__snapshot_path(old))
+            return number
+
+    def __fsync_directory(self):
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        descriptor = os.open(self.__directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def close(self):
+        self.__flush()
+        with self.__sync:
+            self.__closing = True
+            self.__sync.notify_all()
+        self.__flusher.join()
+        # a compaction already due still runs
+        with self.__compaction:
+            self.__compaction.notify()
+        self.__compactor.join()
+        with self.__lock:
+            for segment_file in self.__retired:
+                segment_file.close()
+            self.__retired = []
+            self.__file.close()
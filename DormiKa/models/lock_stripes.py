@@ -0,0 +1,48 @@
+import threading
+from contextlib import contextmanager
+
+
+class LockStripes:
+    """A fixed set of re-entrant locks shared out by hashing keys.
+
+    Keys are tuples such as ("room", "RM-0001") or ("resident", "RS-0001").
+    hold() takes every stripe the keys map to in ascending stripe order,
+    so two workflows locking overlapping keys can never deadlock. A
+    thread already holding stripes may only add higher ones.
+    """
+
+    STRIPES = 64
+
+    def __init__(self, stripes: int = None):
+        self.__locks = [threading.RLock()
+                        for _ in range(stripes or LockStripes.STRIPES)]
+        self.__local = threading.local()
+
+    def stripe(self, key):
+        return hash(key) % len(self.__locks)
+
+    @contextmanager
+    def hold(self, *keys):
+        held = self.__held()
+        stripes = sorted({self.stripe(key) for key in keys if key is not None})
+        fresh = [stripe for stripe in stripes if stripe not in held]
+        if fresh and held and fresh[0] < max(held):
+            raise RuntimeError(
+                f"Lock order violation: stripe {fresh[0]} requested while holding {max(held)}")
+        acquired = []
+        try:
+            for stripe in stripes:
+                self.__locks[stripe].acquire()
+                acquired.append(stripe)
+                held.append(stripe)
+            yield
+        finally:
+            for stripe in reversed(acquired):
+                held.remove(stripe)
+                self.__locks[stripe].release()
+
+    def __held(self):
+        held = getattr(self.__local, "held", None)
+        if held is None:
+            held = self.__local.held = []
+        return held
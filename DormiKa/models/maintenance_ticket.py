@@ -1,16 +1,16 @@
 from datetime import datetime
 from .enum import MaintenanceStatus
+from .id_allocator import next_id
 
 
 class MaintenanceTicket:
-    ID = 1
-
-    def __init__(self, reporter, room_id, issue_category, responsible_technician=None):
-        self.__id = f'MT-{MaintenanceTicket.ID:04d}'
+    def __init__(self, reporter, room_id, issue_category, responsible_technician=None,
+                 report_time: datetime = None):
+        self.__id = f"MT-{next_id('maintenance_ticket'):04d}"
         self.__reporter = reporter
         self.__room_id = room_id
         self.__issue_category = issue_category
-        self.__report_time = datetime.now()
+        self.__report_time = report_time or datetime.now()
         self.__responsible_technician = responsible_technician
         self.__approve_employee = None
         self.__notes = None
@@ -19,8 +19,6 @@ class MaintenanceTicket:
         self.__cost = None
         self.__status = "IDLE"
 
-        MaintenanceTicket.ID += 1
-
     @property
     def id(self):
         return self.__id
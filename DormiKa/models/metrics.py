@@ -0,0 +1,249 @@
+import bisect
+import functools
+import threading
+import time
+
+from .tracing import tracer
+
+# seconds; covers index lookups through whole-dorm billing and strike runs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Cells:
+    """Per-thread slots for one series; only a scrape adds them up.
+
+    Recording touches the calling thread's own list, so it needs no lock;
+    the lock is taken once per thread, when its slots are created.
+    """
+
+    def __init__(self, size):
+        self.__size = size
+        self.__local = threading.local()
+        self.__rows = []
+        self.__lock = threading.Lock()
+
+    def mine(self):
+        cells = getattr(self.__local, "cells", None)
+        if cells is None:
+            cells = [0] * self.__size
+            with self.__lock:
+                self.__rows.append(cells)
+            self.__local.cells = cells
+        return cells
+
+    def totals(self):
+        with self.__lock:
+            rows = list(self.__rows)
+        return [sum(column) for column in zip(*rows)] if rows else [0] * self.__size
+
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name, help, labels=()):
+        self.__name = name
+        self.__help = help
+        self.__labels = tuple(labels)
+        self.__series = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.__name
+
+    def labels(self, **values):
+        key = tuple(str(values[label]) for label in self.__labels)
+        series = self.__series.get(key)
+        if series is None:
+            with self.__lock:
+                series = self.__series.setdefault(key, self._new_series())
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.__name} {self.__help}", f"# TYPE {self.__name} {self.TYPE}"]
+        with self.__lock:
+            series_by_key = sorted(self.__series.items())
+        for key, series in series_by_key:
+            labels = dict(zip(self.__labels, key))
+            lines.extend(self._render_series(labels, series))
+        return lines
+
+    def _render_series(self, labels, series):
+        raise NotImplementedError
+
+    def _sample(self, suffix, labels, value):
+        return f"{self.__name}{suffix}{_format_labels(labels)} {_format_value(value)}"
+
+
+class _CounterSeries:
+    def __init__(self):
+        self.__cells = _Cells(1)
+
+    def inc(self, amount=1):
+        self.__cells.mine()[0] += amount
+
+    @property
+    def value(self):
+        return self.__cells.totals()[0]
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def _render_series(self, labels, series):
+        return [self._sample("", labels, series.value)]
+
+
+class _HistogramSeries:
+    def __init__(self, buckets):
+        self.__buckets = buckets
+        # one slot per bucket, one for +Inf, then the sum
+        self.__cells = _Cells(len(buckets) + 2)
+
+    def observe(self, value):
+        cells = self.__cells.mine()
+        cells[bisect.bisect_left(self.__buckets, value)] += 1
+        cells[-1] += value
+
+    def snapshot(self):
+        """(cumulative counts per bucket bound, count, sum)."""
+        totals = self.__cells.totals()
+        cumulative = []
+        running = 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.__buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.__buckets)
+
+    def _render_series(self, labels, series):
+        cumulative, count, total = series.snapshot()
+        lines = []
+        for bound, value in zip(self.__buckets + (float("inf"),), cumulative):
+            lines.append(self._sample("_bucket", {**labels, "le": _format_value(bound)}, value))
+        lines.append(self._sample("_sum", labels, total))
+        lines.append(self._sample("_count", labels, count))
+        return lines
+
+
+class _GaugeSeries:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(_Metric):
+    TYPE = "gauge"
+
+    def _new_series(self):
+        return _GaugeSeries()
+
+    def _render_series(self, labels, series):
+        return [self._sample("", labels, series.value)]
+
+
+class MetricsRegistry:
+    """Named metrics, rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def __add(self, metric):
+        with self.__lock:
+            existing = self.__metrics.setdefault(metric.name, metric)
+        if type(existing) is not type(metric):
+            raise ValueError(f"metric '{metric.name}' already registered as a {existing.TYPE}")
+        return existing
+
+    def counter(self, name, help, labels=()):
+        return self.__add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.__add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, labels=()):
+        return self.__add(Gauge(name, help, labels))
+
+    def render(self):
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+metrics = MetricsRegistry()
+
+WORKFLOW_SECONDS = metrics.histogram(
+    "dormika_workflow_duration_seconds", "Time spent in a Dorm workflow.", ("workflow",))
+WORKFLOW_CALLS = metrics.counter(
+    "dormika_workflow_calls_total", "Dorm workflow calls by outcome.", ("workflow", "outcome"))
+
+
+def timed(workflow):
+    """Record a workflow's latency and outcome, and trace it; show_error results count as errors."""
+    name = workflow.__name__
+    span_name = workflow.__qualname__
+    seconds = WORKFLOW_SECONDS.labels(workflow=name)
+    outcomes = {outcome: WORKFLOW_CALLS.labels(workflow=name, outcome=outcome)
+                for outcome in ("ok", "error")}
+
+    @functools.wraps(workflow)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        span = tracer.begin(span_name)
+        error = "exception"
+        try:
+            result = workflow(*args, **kwargs)
+            if isinstance(result, dict) and set(result) == {"error"}:
+                error = str(result["error"])
+            else:
+                error = None
+            return result
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - started)
+            outcomes["ok" if error is None else "error"].inc()
+            tracer.end(span, error)
+    return wrapper
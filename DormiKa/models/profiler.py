@@ -0,0 +1,126 @@
+import os
+import sys
+import threading
+import time
+
+
+# leaf frames of a thread parked on a lock, queue or socket, not using CPU
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    # an executor worker blocked on its C-level SimpleQueue
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+    ("connection.py", "_recv"),
+    ("connection.py", "_poll"),
+}
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+
+class SamplingProfiler:
+    """Statistical profiler for the running process, with no extra dependency.
+
+    A background thread wakes every interval, reads every other thread's
+    current stack from sys._current_frames() and counts it. The counts
+    come out as collapsed stacks ("thread;frame;...;leaf count" per line),
+    the input format of flamegraph.pl, speedscope and similar tools.
+    Threads parked on a lock, queue or socket are left out unless
+    include_idle is set. Only one profile runs at a time.
+    """
+
+    MAX_DURATION = 120
+    MIN_INTERVAL = 0.001
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.__lock.locked()
+
+    def profile(self, duration: float = 10.0, interval: float = 0.005,
+                include_idle: bool = False) -> dict:
+        """Sample for duration seconds; block until done and return the counts."""
+        if not 0 < duration <= SamplingProfiler.MAX_DURATION:
+            raise ValueError(
+                f"duration must be between 0 and {SamplingProfiler.MAX_DURATION} seconds")
+        if interval < SamplingProfiler.MIN_INTERVAL:
+            raise ValueError(
+                f"interval must be at least {SamplingProfiler.MIN_INTERVAL * 1000:g} ms")
+        if not self.__lock.acquire(blocking=False):
+            raise ProfilerBusyError("a profile is already running")
+        try:
+            result = {}
+            sampler = threading.Thread(
+                target=self.__sample, args=(duration, interval, include_idle, result),
+                name="dormika-profiler", daemon=True)
+            sampler.start()
+            sampler.join()
+            return result
+        finally:
+            self.__lock.release()
+
+    def __sample(self, duration, interval, include_idle, result):
+        own = threading.get_ident()
+        stacks = {}
+        samples = 0
+        labels = {}
+        started = time.perf_counter()
+        deadline = started + duration
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(frame.f_code)
+                    frame = frame.f_back
+                if not frames:
+                    continue
+                leaf = frames[0]
+                if not include_idle and (
+                        os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_LEAVES:
+                    continue
+                key = (names.get(ident, f"thread-{ident}"), tuple(reversed(frames)))
+                stacks[key] = stacks.get(key, 0) + 1
+            samples += 1
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            time.sleep(min(interval, deadline - now))
+
+        collapsed = {}
+        for (thread_name, codes), count in stacks.items():
+            parts = [thread_name]
+            for code in codes:
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code)
+                parts.append(label)
+            # ';' separates frames and ' ' the count in the collapsed format
+            line = ";".join(part.replace(";", ":") for part in parts).replace(" ", "_")
+            collapsed[line] = collapsed.get(line, 0) + count
+        result.update({
+            "duration_s": round(time.perf_counter() - started, 3),
+            "interval_ms": interval * 1000,
+            "samples": samples,
+            "stacks": dict(sorted(collapsed.items(), key=lambda item: -item[1])),
+        })
+
+
+def _frame_label(code):
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{os.path.basename(code.co_filename)}:{name}"
+
+
+def collapsed_text(result: dict) -> str:
+    """A profile() result as collapsed-stack lines, ready for flamegraph.pl."""
+    return "".join(f"{stack} {count}\n" for stack, count in result["stacks"].items())
+
+
+profiler = SamplingProfiler()
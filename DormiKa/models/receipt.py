@@ -1,17 +1,19 @@
 from datetime import datetime
+from .id_allocator import next_id
 
 # ================== Receipt
 
 
 class Receipt:
-    __running_number = 1
-
     def __init__(self, payment):
-        self.__id = f"RC-{Receipt.__running_number:04d}"
-        Receipt.__running_number += 1
+        self.__id = f"RC-{next_id('receipt'):04d}"
         self.__payment = payment
         self.__date_create = datetime.now()
 
     @property
     def id(self):
         return self.__id
+
+    @property
+    def payment(self):
+        return self.__payment
@@ -0,0 +1,208 @@
+from .enum import ContractStatus
+from .aging import AgingEngine
+
+
+class Registry:
+    """Dict-backed indexes over every entity the Dorm owns, keyed by id."""
+
+    KINDS = ("resident", "employee", "technician", "cleaner", "building", "room")
+    OCCUPYING = (ContractStatus.ACTIVE, ContractStatus.ENDING_SOON)
+
+    def __init__(self):
+        self.__indexes = {kind: {} for kind in Registry.KINDS}
+        # reverse maps kept in step with residents' contracts and invoices
+        self.__contracts = {}
+        self.__invoices = {}
+        self.__occupants = {}
+        self.__contract_rooms = {}
+        # residents whose invoices are indexed on the first invoice lookup,
+        # so restoring a large dorm does not walk every invoice up front
+        self.__unindexed_invoices = []
+        # outstanding invoices in columns, for the strike audit
+        self.__aging = AgingEngine()
+        # normalized email / phone -> resident, for sign-up checks
+        self.__contacts = {
+            group: {"email": {}, "phone": {}} for group in ("resident", "blacklist")
+        }
+
+    def register(self, kind, entity):
+        # keep the first entity for an id, like the old linear scans did
+        self.__indexes[kind].setdefault(entity.id, entity)
+
+    def unregister(self, kind, entity):
+        if self.__indexes[kind].get(entity.id) is entity:
+            del self.__indexes[kind][entity.id]
+
+    @property
+    def aging(self):
+        return self.__aging
+
+    def lookup(self, kind, entity_id):
+        return self.__indexes[kind].get(entity_id)
+
+    def count(self, kind):
+        return len(self.__indexes[kind])
+
+    def add_building(self, building):
+        self.register("building", building)
+        for room in building.rooms:
+            self.register("room", room)
+        building.attach_registry(self)
+
+    @staticmethod
+    def normalize_email(email):
+        return email.strip().lower() if email else None
+
+    @staticmethod
+    def normalize_phone(phone_number):
+        if not phone_number:
+            return None
+        return "".join(ch for ch in phone_number if ch.isdigit())
+
+    def __index_contacts(self, group, resident):
+        contacts = self.__contacts[group]
+        email = Registry.normalize_email(resident.email)
+        phone = Registry.normalize_phone(resident.phone_number)
+        if email:
+            contacts["email"].setdefault(email, resident)
+        if phone:
+            contacts["phone"].setdefault(phone, resident)
+
+    def __unindex_contacts(self, group, resident):
+        contacts = self.__contacts[group]
+        for field, key in (("email", Registry.normalize_email(resident.email)),
+                           ("phone", Registry.normalize_phone(resident.phone_number))):
+            if key and contacts[field].get(key) is resident:
+                del contacts[field][key]
+
+    def find_contact(self, group, email=None, phone_number=None):
+        """Resident in group ('resident' or 'blacklist') sharing the email or phone."""
+        contacts = self.__contacts[group]
+        email = Registry.normalize_email(email)
+        phone = Registry.normalize_phone(phone_number)
+        if email and email in contacts["email"]:
+            return contacts["email"][email]
+        if phone and phone in contacts["phone"]:
+            return contacts["phone"][phone]
+        return None
+
+    def add_blacklisted(self, resident):
+        self.__index_contacts("blacklist", resident)
+
+    def add_resident(self, resident):
+        self.register("resident", resident)
+        self.__index_contacts("resident", resident)
+        for contract in resident.contracts:
+            self.index_contract(resident, contract)
+        self.__unindexed_invoices.append(resident)
+        self.__aging.add_resident(resident)
+        resident.attach_registry(self)
+
+    def remove_resident(self, resident):
+        self.unregister("resident", resident)
+        self.__unindex_contacts("resident", resident)
+        for contract in resident.contracts:
+            self.unindex_contract(contract)
+        for invoice in resident.invoices:
+            self.unindex_invoice(invoice)
+        self.__aging.remove_resident(resident)
+        resident.attach_registry(None)
+
+    def index_contract(self, resident, contract):
+        self.__contracts.setdefault(contract.id, (resident, contract))
+        self.__release_occupancy(contract)
+        if contract.status in Registry.OCCUPYING:
+            room_id = contract.room.id
+            self.__occupants.setdefault(room_id, (resident, contract))
+            self.__contract_rooms[contract.id] = room_id
+
+    def unindex_contract(self, contract):
+        entry = self.__contracts.get(contract.id)
+        if entry is not None and entry[1] is contract:
+            del self.__contracts[contract.id]
+        self.__release_occupancy(contract)
+
+    def __release_occupancy(self, contract):
+        room_id = self.__contract_rooms.pop(contract.id, None)
+        if room_id is None:
+            return
+        occupant = self.__occupants.get(room_id)
+        if occupant is not None and occupant[1] is contract:
+            del self.__occupants[room_id]
+
+    def __index_pending_invoices(self):
+        pending, self.__unindexed_invoices = self.__unindexed_invoices, []
+        for resident in pending:
+            for invoice in resident.invoices:
+                self.__invoices.setdefault(invoice.id, (resident, invoice))
+
+    def index_invoice(self, resident, invoice):
+        if self.__unindexed_invoices:
+            self.__index_pending_invoices()
+        self.__invoices.setdefault(invoice.id, (resident, invoice))
+        self.__aging.track(resident, invoice)
+
+    def unindex_invoice(self, invoice):
+        if self.__unindexed_invoices:
+            self.__index_pending_invoices()
+        entry = self.__invoices.get(invoice.id)
+        if entry is not None and entry[1] is invoice:
+            del self.__invoices[invoice.id]
+        self.__aging.untrack(invoice)
+
+    def settle_invoice(self, invoice):
+        """Keep a paid or cancelled invoice findable but out of strike aging."""
+        self.__aging.untrack(invoice)
+
+    def lookup_contract(self, contract_id):
+        return self.__contracts.get(contract_id)
+
+    def lookup_invoice(self, invoice_id):
+        if self.__unindexed_invoices:
+            self.__index_pending_invoices()
+        return self.__invoices.get(invoice_id)
+
+    def lookup_occupant(self, room_id):
+        occupant = self.__occupants.get(room_id)
+        return occupant[0] if occupant is not None else None
+
+    # ==================== Snapshots ====================
+
+    def columns(self):
+        """The indexes as name -> list columns, for a snapshot to store."""
+        columns = {kind: list(index.values()) for kind, index in self.__indexes.items()}
+        for group, fields in self.__contacts.items():
+            for field, index in fields.items():
+                columns[f"{group}.{field}"] = list(index)
+                columns[f"{group}.{field}.resident"] = list(index.values())
+        columns["contracts.resident"] = [resident for resident, _ in self.__contracts.values()]
+        columns["contracts.contract"] = [contract for _, contract in self.__contracts.values()]
+        columns["occupants.room"] = list(self.__occupants)
+        columns["occupants.resident"] = [resident for resident, _ in self.__occupants.values()]
+        columns["occupants.contract"] = [contract for _, contract in self.__occupants.values()]
+        columns["contract_rooms.contract"] = list(self.__contract_rooms)
+        columns["contract_rooms.room"] = list(self.__contract_rooms.values())
+        return columns
+
+    def restore_columns(self, column, column_ids, residents):
+        """Load indexes stored from columns(); column(name) reads one back
+        and column_ids(name) the ids of an entity column.
+
+        Entities restored from a snapshot stay undecoded; invoices and
+        strike aging are indexed on first use.
+        """
+        for kind in Registry.KINDS:
+            self.__indexes[kind] = dict(zip(column_ids(kind), column(kind)))
+        for group, fields in self.__contacts.items():
+            for field in fields:
+                fields[field] = dict(zip(column(f"{group}.{field}"),
+                                         column(f"{group}.{field}.resident")))
+        self.__contracts = dict(zip(column_ids("contracts.contract"), zip(
+            column("contracts.resident"), column("contracts.contract"))))
+        self.__occupants = dict(zip(column("occupants.room"), zip(
+            column("occupants.resident"), column("occupants.contract"))))
+        self.__contract_rooms = dict(zip(column("contract_rooms.contract"),
+                                         column("contract_rooms.room")))
+        self.__invoices = {}
+        self.__unindexed_invoices = list(residents)
+        self.__aging = AgingEngine(residents)
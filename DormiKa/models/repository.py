@@ -0,0 +1,367 @@
+import io
+import pickle
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+from .building import Building
+from .room import Room
+from .resident import Resident
+from .contract import Contract
+from .invoice import Invoice
+from .receipt import Receipt
+from .employee import Employee
+from .staff import Staff
+from .cleaning_ticket import CleaningTicket
+from .maintenance_ticket import MaintenanceTicket
+from .share_facility import ShareFacility
+from .facility_booking import BookingShareFacility
+from .id_allocator import ids
+
+
+# entity kind -> base class; every entity has a unique string id within its kind
+ENTITY_KINDS = {
+    "building": Building,
+    "room": Room,
+    "resident": Resident,
+    "contract": Contract,
+    "invoice": Invoice,
+    "receipt": Receipt,
+    "employee": Employee,
+    "staff": Staff,
+    "cleaning_ticket": CleaningTicket,
+    "maintenance_ticket": MaintenanceTicket,
+    "share_facility": ShareFacility,
+    "facility_booking": BookingShareFacility,
+}
+
+# ordered lists the Dorm keeps of its top-level members
+MEMBER_LISTS = ("buildings", "residents", "employees",
+                "technicians", "cleaners", "blacklist")
+# entity kind of each member list
+MEMBER_KINDS = {"buildings": "building", "residents": "resident", "employees": "employee",
+                "technicians": "staff", "cleaners": "staff", "blacklist": "resident"}
+
+
+def _all_subclasses(cls):
+    yield cls
+    for sub in cls.__subclasses__():
+        yield from _all_subclasses(sub)
+
+
+_kind_by_type = {}
+
+
+def entity_kind(obj):
+    cls = type(obj)
+    try:
+        return _kind_by_type[cls]
+    except KeyError:
+        pass
+    kind = next((kind for kind, base in ENTITY_KINDS.items()
+                 if issubclass(cls, base)), None)
+    _kind_by_type[cls] = kind
+    return kind
+
+
+def entity_class(name):
+    for base in ENTITY_KINDS.values():
+        for cls in _all_subclasses(base):
+            if cls.__qualname__ == name:
+                return cls
+    raise LookupError(f"Unknown entity class '{name}'")
+
+
+def _overrides(entity, method):
+    return any(method in vars(cls) for cls in type(entity).__mro__[:-1])
+
+
+# class -> whether it defines __getstate__ (object's default does not count)
+_custom_state = {}
+
+
+def entity_state(entity):
+    """The attributes to persist; models drop rebuildable indexes in __getstate__."""
+    cls = type(entity)
+    custom = _custom_state.get(cls)
+    if custom is None:
+        custom = _custom_state[cls] = _overrides(entity, "__getstate__")
+    return entity.__getstate__() if custom else vars(entity)
+
+
+def read_counters():
+    return ids.high_water_marks()
+
+
+def write_counters(counters):
+    ids.advance(counters)
+
+
+class _StatePickler(pickle.Pickler):
+    """Pickles one entity's state with every other entity replaced by (kind, id)."""
+
+    def __init__(self, file, on_reference):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__on_reference = on_reference
+
+    def persistent_id(self, obj):
+        kind = entity_kind(obj)
+        if kind is None:
+            return None
+        self.__on_reference(kind, obj)
+        return kind, obj.id
+
+
+_PACKAGE = __name__.rpartition(".")[0]
+# modules whose classes may sit inline in an entity's state; entities
+# themselves are stored as (kind, id) references
+_STATE_MODULES = {f"{_PACKAGE}.{name}" for name in (
+    "enum", "facility_schedule", "member", "payment", "payment_gateway", "room_booking")}
+_STATE_GLOBALS = {("datetime", "date"), ("datetime", "datetime"), ("datetime", "timedelta"),
+                  ("collections", "OrderedDict")}
+
+
+def entity_reference(*reference):
+    """Stands for an entity in state pickled by reference, as a call the
+    state unpickler answers with the entity itself."""
+    raise LookupError(f"Entity reference {reference} outside stored state")
+
+
+class _StateUnpickler(pickle.Unpickler):
+    """Loads entity state, resolving only the classes entity state can hold.
+
+    A pickle can name any importable callable, so an altered database
+    could otherwise run code on load; anything else is refused.
+    """
+
+    def __init__(self, file, entities):
+        super().__init__(file)
+        self.__entities = entities
+
+    def find_class(self, module, name):
+        if (module, name) == (__name__, entity_reference.__name__):
+            return self.__reference
+        if (module, name) in _STATE_GLOBALS:
+            return super().find_class(module, name)
+        if module in _STATE_MODULES:
+            cls = super().find_class(module, name)
+            if isinstance(cls, type) and cls.__module__ == module:
+                return cls
+        raise pickle.UnpicklingError(f"Refusing to load '{module}.{name}' from stored state")
+
+    def persistent_load(self, pid):
+        try:
+            return self.__entities[tuple(pid)]
+        except KeyError:
+            raise pickle.UnpicklingError(f"Dangling reference to {pid}")
+
+    def __reference(self, *pid):
+        return self.persistent_load(pid)
+
+
+def dump_state(entity, on_reference=lambda kind, obj: None):
+    buffer = io.BytesIO()
+    _StatePickler(buffer, on_reference).dump(entity_state(entity))
+    return buffer.getvalue()
+
+
+def load_state(data, entities=None):
+    """Unpickles stored state; entities maps the (kind, id) references in
+    it, and stored state that is not an entity's has none."""
+    return _StateUnpickler(io.BytesIO(data), {} if entities is None else entities).load()
+
+
+def collect_rows(entities, stored):
+    """(kind, id, class name, state) rows for entities and anything they
+    reference that is not in stored yet."""
+    pending = {}
+
+    def on_reference(kind, obj):
+        key = (kind, obj.id)
+        if key not in stored and key not in pending:
+            pending[key] = obj
+
+    for entity in entities:
+        pending[(entity_kind(entity), entity.id)] = entity
+
+    rows = []
+    written = set()
+    while pending:
+        key, entity = pending.popitem()
+        if key in written:
+            continue
+        written.add(key)
+        # state first: dumping a lazily loaded entity settles its class
+        state = dump_state(entity, on_reference)
+        rows.append((key[0], key[1], type(entity).__qualname__, state))
+    return rows
+
+
+def restore_entities(rows):
+    """Rebuild an object graph from (kind, id, class name, state) rows.
+
+    Every entity is allocated first so that references, including cycles
+    such as room <-> building, resolve to the final objects.
+    """
+    entities = {}
+    for kind, entity_id, class_name, _ in rows:
+        cls = entity_class(class_name)
+        entities[(kind, entity_id)] = cls.__new__(cls)
+    for kind, entity_id, _, data in rows:
+        apply_state(entities[(kind, entity_id)], load_state(data, entities))
+    return entities
+
+
+def apply_state(entity, state):
+    if _overrides(entity, "__setstate__"):
+        entity.__setstate__(state)
+    else:
+        entity.__dict__.update(state)
+
+
+class Repository(ABC):
+    """Where a Dorm keeps its state between restarts.
+
+    save() is called once per workflow with every entity it touched, so
+    an implementation can write them as a single batch.
+    """
+
+    @abstractmethod
+    def load(self):
+        """Return the stored state as a dict, or None when the store is empty."""
+
+    @abstractmethod
+    def save(self, entities=(), members=(), ledger=(), name=None):
+        """Persist entities, (list, id, present) member changes and ledger keys."""
+
+    def close(self):
+        pass
+
+
+class InMemoryRepository(Repository):
+    """Keeps nothing beyond the live objects; the default for a Dorm."""
+
+    def load(self):
+        return None
+
+    def save(self, entities=(), members=(), ledger=(), name=None):
+        pass
+
+
+class SQLiteRepository(Repository):
+    """Durable storage in a single SQLite file (WAL mode, one transaction per save).
+
+    Entity state is stored as pickles. Loading resolves only model
+    classes, enums and dates, but the file is still trusted to hold the
+    state this application wrote: keep it where only the service can
+    write it.
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS entities (
+               kind TEXT NOT NULL,
+               id TEXT NOT NULL,
+               class TEXT NOT NULL,
+               state BLOB NOT NULL,
+               PRIMARY KEY (kind, id)
+           ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS members (
+               seq INTEGER PRIMARY KEY AUTOINCREMENT,
+               list TEXT NOT NULL,
+               id TEXT NOT NULL
+           )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS members_list_id ON members (list, id)",
+        """CREATE TABLE IF NOT EXISTS counters (
+               name TEXT PRIMARY KEY,
+               value INTEGER NOT NULL
+           )""",
+        """CREATE TABLE IF NOT EXISTS billing_ledger (
+               contract_id TEXT NOT NULL,
+               period TEXT NOT NULL,
+               PRIMARY KEY (contract_id, period)
+           ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS meta (
+               key TEXT PRIMARY KEY,
+               value TEXT NOT NULL
+           )""",
+    )
+
+    UPSERT_ENTITY = "INSERT OR REPLACE INTO entities (kind, id, class, state) VALUES (?, ?, ?, ?)"
+    INSERT_MEMBER = "INSERT OR IGNORE INTO members (list, id) VALUES (?, ?)"
+    DELETE_MEMBER = "DELETE FROM members WHERE list = ? AND id = ?"
+    UPSERT_COUNTER = "INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)"
+    INSERT_LEDGER = "INSERT OR IGNORE INTO billing_ledger (contract_id, period) VALUES (?, ?)"
+    UPSERT_META = "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)"
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SQLiteRepository.SCHEMA:
+            self.__connection.execute(statement)
+        # entities already on disk; anything else a saved entity refers to
+        # is written along with it
+        self.__stored = set(self.__connection.execute(
+            "SELECT kind, id FROM entities"))
+
+    @property
+    def path(self):
+        return self.__path
+
+    def load(self):
+        with self.__lock:
+            connection = self.__connection
+            name = connection.execute(
+                "SELECT value FROM meta WHERE key = 'name'").fetchone()
+            if name is None:
+                return None
+            rows = connection.execute(
+                "SELECT kind, id, class, state FROM entities").fetchall()
+            members = {list_name: [] for list_name in MEMBER_LISTS}
+            for list_name, entity_id in connection.execute(
+                    "SELECT list, id FROM members ORDER BY seq"):
+                members[list_name].append(entity_id)
+            counters = dict(connection.execute(
+                "SELECT name, value FROM counters"))
+            ledger = list(connection.execute(
+                "SELECT contract_id, period FROM billing_ledger"))
+
+        return {
+            "name": name[0],
+            "entities": restore_entities(rows),
+            "members": members,
+            "counters": counters,
+            "ledger": ledger,
+        }
+
+    def save(self, entities=(), members=(), ledger=(), name=None):
+        with self.__lock:
+            rows = collect_rows(entities, self.__stored)
+
+            connection = self.__connection
+            connection.execute("BEGIN")
+            try:
+                connection.executemany(SQLiteRepository.UPSERT_ENTITY, rows)
+                for list_name, entity_id, present in members:
+                    statement = SQLiteRepository.INSERT_MEMBER if present else SQLiteRepository.DELETE_MEMBER
+                    connection.execute(statement, (list_name, entity_id))
+                connection.executemany(
+                    SQLiteRepository.INSERT_LEDGER, ledger)
+                connection.executemany(
+                    SQLiteRepository.UPSERT_COUNTER, read_counters().items())
+                if name is not None:
+                    connection.execute(
+                        SQLiteRepository.UPSERT_META, ("name", name))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            self.__stored.update((kind, entity_id)
+                                 for kind, entity_id, _, _ in rows)
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
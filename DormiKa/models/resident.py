@@ -5,14 +5,14 @@ from .receipt import Receipt
 from .cleaning_ticket import *
 from .room import *
 from .enum import AccountStatus, CleaningStatus, InvoiceStatus
+from .id_allocator import next_id
+from .tracing import traced
 
 
 class Resident:
-    ID = 1
-
     def __init__(self, name: str, email: str = None, phone_number: str = None,
                  status: AccountStatus = AccountStatus.ACTIVE):
-        self.__id = f"RS-{Resident.ID:04d}"
+        self.__id = f"RS-{next_id('resident'):04d}"
         self.__name = name
         self.__email = email
         self.__phone_number = phone_number
@@ -26,8 +26,17 @@ class Resident:
         self.__invoices = []
         self.__receipts = []
         self.__booking_share_facility_list = []
+        self.__registry = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # the registry re-attaches itself when the resident is restored
+        del state["_Resident__registry"]
+        return state
 
-        Resident.ID += 1
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__registry = None
 
     @property
     def name(self):
@@ -75,6 +84,11 @@ class Resident:
     def receipts(self):
         return self.__receipts
 
+    @property
+    def pending_payment(self):
+        """The Payment basket selected but not paid yet, if any."""
+        return self.__payment
+
     @property
     def booking_share_facility_list(self):
         return self.__booking_share_facility_list
@@ -82,20 +96,39 @@ class Resident:
     def set_member(self, member):
         self.__member = member
 
+    def attach_registry(self, registry):
+        self.__registry = registry
+
     def add_contract(self, contract):
         self.__contracts.append(contract)
+        if self.__registry is not None:
+            self.__registry.index_contract(self, contract)
 
     def add_invoice(self, invoice):
         self.__invoices.append(invoice)
+        if self.__registry is not None:
+            self.__registry.index_invoice(self, invoice)
 
     def add_booking_share_facility(self, booking):
         self.__booking_share_facility_list.append(booking)
 
+    def cancel_invoice(self, invoice_id):
+        """Cancel an invoice not paid yet; a selected basket holding it is dropped."""
+        for invoice in self.__invoices:
+            if invoice.id == invoice_id and invoice.status not in (
+                    InvoiceStatus.PAID, InvoiceStatus.CANCELLED):
+                invoice.status = InvoiceStatus.CANCELLED
+                if self.__payment is not None and invoice in self.__payment.invoice_list:
+                    self.__payment = None
+                return invoice
+        return None
+
     def calculate_net_amount(self, amount, discount):
         discount = 1 - discount
         amount = amount * discount
         return amount
 
+    @traced
     def set_payment(self, payment_method_input, invoice_ids):
         payment_method = Payment_Method.format_payment_method(
             payment_method_input)
@@ -141,6 +174,7 @@ class Resident:
         self.__payment = payment
         return payment
 
+    @traced
     def payment(self, raw_payment):
         if self.__payment == None:
             raise ValueError('Payment : None')
@@ -150,6 +184,8 @@ class Resident:
         for invoice in self.__payment.invoice_list:
             invoice.PAID()
             self.__invoices.remove(invoice)
+            if self.__registry is not None:
+                self.__registry.unindex_invoice(invoice)
         receipt = Receipt(self.__payment)
         self.__receipts.append(receipt)
         self.__payment = None
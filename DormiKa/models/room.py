@@ -1,11 +1,10 @@
 from enum import Enum
 from datetime import datetime, timedelta
 from .enum import RoomStatus, RoomPrice, RoomType
+from .id_allocator import next_id
 
 
 class Room:
-    ID = 1
-
     def __init__(
         self,
         building: object,
@@ -13,7 +12,7 @@ class Room:
         room_type: RoomType = RoomType.STANDARD_ROOM,
         status: RoomStatus = RoomStatus.AVAILABLE,
     ):
-        self.__room_id = f"RM-{Room.ID:04d}"
+        self.__room_id = f"RM-{next_id('room'):04d}"
         self.__building = building
         self.__floor = floor
         self.__type = room_type
@@ -22,8 +21,7 @@ class Room:
         self.__maintenance_tickets: list = []
         self.__cleaning_tickets: list = []
         self.__hold_expiry = None
-
-        Room.ID += 1
+        self.__status_listener = None
 
     def define_monthly_rent(self, room_type):
         for type in RoomType:
@@ -56,7 +54,24 @@ class Room:
 
     @status.setter
     def status(self, new_status):
+        self.__set_status(new_status)
+
+    def watch_status(self, listener):
+        """Register the object notified via room_status_changed on every status change."""
+        self.__status_listener = listener
+
+    def __set_status(self, new_status):
+        old_status = self.__status
         self.__status = new_status
+        if new_status != RoomStatus.RESERVED:
+            self.__hold_expiry = None
+        if self.__status_listener is not None and old_status != new_status:
+            self.__status_listener.room_status_changed(
+                self, old_status, new_status)
+
+    @property
+    def hold_expiry(self):
+        return self.__hold_expiry
 
     @property
     def room_log(self):
@@ -99,18 +114,17 @@ class Room:
         if self.__status != RoomStatus.AVAILABLE:
             return False
 
-        self.__status = RoomStatus.RESERVED
         self.__hold_expiry = datetime.now() + timedelta(hours=hours)
+        self.__set_status(RoomStatus.RESERVED)
         return True
 
-    def is_hold_expired(self) -> bool:
+    def is_hold_expired(self, now: datetime = None) -> bool:
         """Return True if the current hold has expired and reset status."""
         if self.__hold_expiry is None:
             return False
 
-        if datetime.now() >= self.__hold_expiry:
-            self.__hold_expiry = None
-            self.__status = RoomStatus.AVAILABLE
+        if (now or datetime.now()) >= self.__hold_expiry:
+            self.__set_status(RoomStatus.AVAILABLE)
             return True
 
         return False
@@ -0,0 +1,587 @@
+import itertools
+import multiprocessing
+import os
+import tempfile
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+from .billing_run import BillingRun
+from .enum import BillingRunStatus
+from .id_allocator import ids, next_id, SQLiteIdStore
+from .metrics import timed
+from .profiler import profiler, ProfilerBusyError
+from .registry import Registry
+
+
+# calls a shard works on at once; its Dorm locks keep them apart
+SHARD_THREADS = 8
+# process-wide calls a shard answers besides its Dorm's methods
+_PROCESS_CALLS = {"profile": profiler.profile}
+
+
+def shard_of(key: str, count: int) -> int:
+    """The shard that owns key; stable across processes, unlike hash()."""
+    return zlib.crc32(key.encode()) % count
+
+
+def _serve(connection, factory, index, count, ids_path):
+    """Shard process main: build the Dorm, then answer calls until the pipe closes."""
+    dorm = factory(index, count)
+    # seeded ids match on every shard; new ones come from the shared marks
+    ids.use_store(SQLiteIdStore(ids_path))
+    send_lock = threading.Lock()
+
+    def reply(message):
+        with send_lock:
+            try:
+                connection.send(message)
+            except Exception as e:
+                connection.send((message[0], False, RuntimeError(repr(e))))
+
+    def handle(request_id, name, args):
+        try:
+            target = _PROCESS_CALLS.get(name)
+            if target is None:
+                target = dorm
+                for part in name.split("."):
+                    target = getattr(target, part)
+            result = target(*args) if args is not None else target
+            # a run holds locks and contract snapshots; callers get its progress
+            if isinstance(result, BillingRun):
+                result = result.to_dict()
+            reply((request_id, True, result))
+        except Exception as e:
+            reply((request_id, False, e))
+
+    executor = ThreadPoolExecutor(SHARD_THREADS, thread_name_prefix=f"dormika-shard{index}")
+    reply((None, True, index))
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        executor.submit(handle, *message)
+    executor.shutdown(wait=True)
+    dorm.repository.close()
+    connection.close()
+
+
+class _ShardClient:
+    """Router-side end of one shard's pipe; replies resolve futures by request id."""
+
+    def __init__(self, index, process, connection):
+        self.__index = index
+        self.__process = process
+        self.__connection = connection
+        self.__send_lock = threading.Lock()
+        self.__pending = {}
+        self.__request_ids = itertools.count()
+        # the first message is the shard saying its Dorm is ready
+        _, ok, error = connection.recv()
+        if not ok:
+            raise error
+        self.__reader = threading.Thread(
+            target=self.__read, name=f"dormika-shard{index}-reader", daemon=True)
+        self.__reader.start()
+
+    @property
+    def index(self):
+        return self.__index
+
+    def call(self, name, *args) -> Future:
+        return self.__submit(name, args)
+
+    def get(self, name) -> Future:
+        return self.__submit(name, None)
+
+    def __submit(self, name, args):
+        future = Future()
+        with self.__send_lock:
+            request_id = next(self.__request_ids)
+            self.__pending[request_id] = future
+            self.__connection.send((request_id, name, args))
+        return future
+
+    def __read(self):
+        while True:
+            try:
+                request_id, ok, result = self.__connection.recv()
+            except (EOFError, OSError):
+                break
+            future = self.__pending.pop(request_id)
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+        for future in list(self.__pending.values()):
+            future.set_exception(RuntimeError(f"shard {self.__index} exited"))
+        self.__pending.clear()
+
+    def close(self):
+        with self.__send_lock:
+            self.__connection.send(None)
+        self.__process.join()
+        self.__connection.close()
+
+
+class _ScatteredHolds:
+    """The hold sweeper view of a sharded dorm: the earliest expiry on any shard."""
+
+    def __init__(self, shards):
+        self.__shards = shards
+
+    @property
+    def next_expiry(self):
+        futures = [shard.get("hold_sweeper.next_expiry") for shard in self.__shards]
+        expiries = [future.result() for future in futures]
+        expiries = [expiry for expiry in expiries if expiry is not None]
+        return min(expiries) if expiries else None
+
+
+class _ScatteredRun:
+    """One billing run spread over every shard, driven a chunk per shard at a time."""
+
+    def __init__(self, period, shards, shard_runs):
+        self.__id = f"BR-{next_id('billing_run'):04d}"
+        self.__period = period
+        self.__shards = shards
+        # shard index -> that shard's run, as of its last chunk
+        self.__shard_runs = shard_runs
+        self.__date_create = datetime.now()
+        self.__lock = threading.Lock()
+
+    @property
+    def id(self):
+        return self.__id
+
+    @property
+    def period(self):
+        return self.__period
+
+    @property
+    def processed(self):
+        return sum(run["processed"] for run in self.__shard_runs.values())
+
+    @property
+    def invoices_issued(self):
+        return sum(run["invoices_issued"] for run in self.__shard_runs.values())
+
+    @property
+    def skipped(self):
+        return sum(run["skipped_already_billed"] for run in self.__shard_runs.values())
+
+    @property
+    def status(self):
+        statuses = {run["status"] for run in self.__shard_runs.values()}
+        if BillingRunStatus.FAILED.value in statuses:
+            return BillingRunStatus.FAILED
+        if statuses <= {BillingRunStatus.COMPLETED.value}:
+            return BillingRunStatus.COMPLETED
+        if BillingRunStatus.RUNNING.value in statuses:
+            return BillingRunStatus.RUNNING
+        return BillingRunStatus.PENDING
+
+    @property
+    def is_finished(self):
+        return all(run["status"] in (BillingRunStatus.COMPLETED.value, BillingRunStatus.FAILED.value)
+                   for run in self.__shard_runs.values())
+
+    def run_chunk(self) -> bool:
+        """Bill the next chunk on every shard still working; True while any is."""
+        with self.__lock:
+            futures = {
+                index: self.__shards[index].call("run_billing_chunk", run["run_id"])
+                for index, run in self.__shard_runs.items()
+                if run["status"] not in (BillingRunStatus.COMPLETED.value,
+                                         BillingRunStatus.FAILED.value)
+            }
+            for index, future in futures.items():
+                self.__shard_runs[index] = future.result()
+            return not self.is_finished
+
+    def resume(self, shard_runs):
+        """Take up the shards' runs again after they were restarted for this period."""
+        with self.__lock:
+            self.__shard_runs = shard_runs
+        return self
+
+    def run_to_completion(self):
+        while self.run_chunk():
+            pass
+        return self
+
+    def to_dict(self):
+        runs = list(self.__shard_runs.values())
+        errors = [run["error"] for run in runs if run["error"]]
+        finishes = [run["date_finish"] for run in runs]
+        return {
+            "run_id": self.__id,
+            "employee_id": runs[0]["employee_id"] if runs else None,
+            "billing_period": self.__period,
+            "status": self.status.value,
+            "total": sum(run["total"] for run in runs),
+            "processed": self.processed,
+            "invoices_issued": self.invoices_issued,
+            "skipped_already_billed": self.skipped,
+            "error": "; ".join(errors) or None,
+            "date_create": str(self.__date_create),
+            "date_finish": max(finishes) if runs and None not in finishes else None,
+            "shard_runs": [run["run_id"] for run in runs],
+        }
+
+
+class ShardRouter:
+    """Stands in for a Dorm whose buildings are split across worker processes.
+
+    Each shard process runs factory(index, count), which must return a
+    Dorm holding only the buildings shard_of(building_id) gives it. Calls
+    keyed by a building go straight to its shard; calls keyed by another
+    id go to the shard found to hold it, remembered after the first ask.
+    Strikes, billing and the hold and contract sweeps run on every shard
+    at once and their results are merged.
+
+    Staff are on every shard. Maintenance dispatch goes through the
+    router one request at a time and passes over staff already busy on
+    any shard, so a technician's open task is on exactly one shard.
+
+    A resident signs in on the shard picked by their email and moves,
+    with their invoices and receipts, to a building's shard on their first
+    booking there; a move that fails half way puts them back. A resident
+    who already holds a contract on one shard cannot book on another, nor
+    change their contract to a room there.
+    """
+
+    def __init__(self, count: int, factory, ids_path: str = None):
+        self.__count = count
+        if ids_path is None:
+            handle, ids_path = tempfile.mkstemp(prefix="dormika-ids-", suffix=".db")
+            os.close(handle)
+        context = multiprocessing.get_context("spawn")
+        pipes = []
+        for index in range(count):
+            local, remote = context.Pipe()
+            process = context.Process(
+                target=_serve, args=(remote, factory, index, count, ids_path),
+                name=f"dormika-shard{index}", daemon=True)
+            process.start()
+            remote.close()
+            pipes.append((index, process, local))
+        self.__shards = [_ShardClient(*pipe) for pipe in pipes]
+        ids.use_store(SQLiteIdStore(ids_path))
+        # (kind, id) -> shard index, for ids that do not name their shard
+        self.__locations = {}
+        # sign-ins and resident moves must see every shard's contacts unchanged
+        self.__placement_lock = threading.Lock()
+        self.__dispatch_lock = threading.Lock()
+        self.__billing_runs = {}
+        self.__open_billing_runs = {}
+        self.__billing_lock = threading.Lock()
+
+    @property
+    def shard_count(self):
+        return self.__count
+
+    @property
+    def hold_sweeper(self):
+        return _ScatteredHolds(self.__shards)
+
+    def close(self):
+        for shard in self.__shards:
+            shard.close()
+
+    # ==================== Routing ====================
+
+    def __on(self, index, name, *args):
+        return self.__shards[index].call(name, *args).result()
+
+    def __gather(self, name, args=()):
+        """Call name on every shard at once; results in shard order."""
+        futures = [shard.call(name, *args) for shard in self.__shards]
+        return [future.result() for future in futures]
+
+    def __building(self, building_id):
+        return shard_of(building_id, self.__count)
+
+    def __locate(self, kind, entity_id):
+        """The shard holding entity_id; shard 0 answers for ids nobody holds."""
+        index = self.__locations.get((kind, entity_id))
+        if index is not None:
+            return index
+        for index, owned in enumerate(self.__gather("owns", (kind, entity_id))):
+            if owned:
+                # technicians move between tasks, so only their task is looked up fresh
+                if kind != "technician_task":
+                    self.__locations[(kind, entity_id)] = index
+                return index
+        return 0
+
+    def __by(self, kind, entity_id, name, *args):
+        return self.__on(self.__locate(kind, entity_id), name, *args)
+
+    # ==================== Sign-in ====================
+
+    @timed
+    def sign_in(self, name, email, phone_number):
+        with self.__placement_lock:
+            for error in self.__gather("check_sign_in", (name, email, phone_number)):
+                if error is not None:
+                    raise ValueError({"sign_in": error})
+            home = shard_of(email.strip().lower(), self.__count)
+            result = self.__on(home, "sign_in", name, email, phone_number)
+            self.__locations[("resident", result["your_id_is"])] = home
+            return result
+
+    @timed
+    def bulk_sign_in(self, applicants):
+        with self.__placement_lock:
+            errors = [None] * len(applicants)
+            for shard_errors in self.__gather("check_sign_ins", (applicants,)):
+                errors = [mine or theirs for mine, theirs in zip(errors, shard_errors)]
+            # applicants sharing a contact may go to different shards, so the
+            # batch is checked against itself here, earliest applicant first
+            taken = set()
+            for position, applicant in enumerate(applicants):
+                if errors[position] is not None:
+                    continue
+                keys = {("email", Registry.normalize_email(applicant["email"])),
+                        ("phone", Registry.normalize_phone(applicant["phoneNumber"]))}
+                if keys & taken:
+                    errors[position] = "error, email or phone number is already registered"
+                else:
+                    taken |= keys
+            rejected = [{"email": applicant["email"], "error": error}
+                        for applicant, error in zip(applicants, errors) if error is not None]
+            groups = {}
+            for applicant, error in zip(applicants, errors):
+                if error is None:
+                    home = shard_of(applicant["email"].strip().lower(), self.__count)
+                    groups.setdefault(home, []).append(applicant)
+            futures = {index: self.__shards[index].call("bulk_sign_in", group)
+                       for index, group in groups.items()}
+            accepted = []
+            for index, future in futures.items():
+                result = future.result()
+                for entry in result["accepted"]:
+                    self.__locations[("resident", entry["resident_id"])] = index
+                accepted.extend(result["accepted"])
+                rejected.extend(result["rejected"])
+        return {
+            "bulk_sign_in": "success",
+            "accepted_count": len(accepted),
+            "rejected_count": len(rejected),
+            "accepted": accepted,
+            "rejected": rejected,
+        }
+
+    # ==================== Building-keyed ====================
+
+    @timed
+    def request_booking(self, resident_id, building_id, room_type):
+        index = self.__building(building_id)
+        with self.__placement_lock:
+            home = self.__locate("resident", resident_id)
+            if home != index and self.__on(home, "owns", "resident", resident_id):
+                self.__move_resident(resident_id, home, index)
+        return self.__on(index, "request_booking", resident_id, building_id, room_type)
+
+    def __move_resident(self, resident_id, source, target):
+        resident = self.__on(source, "export_resident", resident_id)
+        try:
+            self.__on(target, "import_resident", resident)
+        except BaseException:
+            # the export already removed them; never leave them on no shard
+            self.__on(source, "import_resident", resident)
+            raise
+        self.__locations[("resident", resident_id)] = target
+        for invoice in resident.invoices:
+            self.__locations.pop(("invoice", invoice.id), None)
+
+    @timed
+    def booking_share_facility(self, resident_id, facility_id, building_id, booking_time):
+        return self.__on(self.__building(building_id), "booking_share_facility",
+                         resident_id, facility_id, building_id, booking_time)
+
+    @timed
+    def display_facility_availability(self, building_id, start_date, end_date=None):
+        return self.__on(self.__building(building_id), "display_facility_availability",
+                         building_id, start_date, end_date)
+
+    @timed
+    def display_vacancy(self, building_id):
+        return self.__on(self.__building(building_id), "display_vacancy", building_id)
+
+    # ==================== Entity-keyed ====================
+
+    @timed
+    def sign_contract(self, contract_id):
+        return self.__by("contract", contract_id, "sign_contract", contract_id)
+
+    @timed
+    def complete_handover(self, contract_id):
+        return self.__by("contract", contract_id, "complete_handover", contract_id)
+
+    @timed
+    def pay_contract_invoice(self, invoice_id):
+        return self.__by("invoice", invoice_id, "pay_contract_invoice", invoice_id)
+
+    @timed
+    def change_contract(self, residentId, currentLeaseContractId, targetRoomId, moveDate):
+        # a resident with a lease stays on its shard, so no placement lock;
+        # the lease, its invoices and both rooms must be on that one shard
+        home = self.__locate("resident", residentId)
+        index = self.__locate("room", targetRoomId)
+        if index != home and self.__on(index, "owns", "room", targetRoomId):
+            raise ValueError(f"Room {targetRoomId} is in a building on another shard; "
+                             "a contract can only change to a room on the resident's shard")
+        return self.__on(home, "change_contract",
+                         residentId, currentLeaseContractId, targetRoomId, moveDate)
+
+    @timed
+    def request_maintenance(self, resident_id, room_id, issue_category):
+        # every shard has the staff list; one dispatch at a time keeps a
+        # technician or employee from being sent out by two shards
+        with self.__dispatch_lock:
+            busy_staff = {staff_id for busy in self.__gather("busy_staff")
+                          for staff_id in busy}
+            return self.__by("room", room_id, "request_maintenance",
+                             resident_id, room_id, issue_category, busy_staff)
+
+    @timed
+    def start_maintenance_workflow(self, technician_id, notes=None):
+        return self.__by("technician_task", technician_id, "start_maintenance_workflow",
+                         technician_id, notes)
+
+    @timed
+    def finish_maintenance_workflow(self, technician_id):
+        return self.__by("technician_task", technician_id, "finish_maintenance_workflow",
+                         technician_id)
+
+    @timed
+    def request_cleaning_room(self, resident_id, room_id):
+        return self.__by("room", room_id, "request_cleaning_room", resident_id, room_id)
+
+    @timed
+    def start_cleaning_workflow(self, cleaner_id, room_id):
+        return self.__by("room", room_id, "start_cleaning_workflow", cleaner_id, room_id)
+
+    @timed
+    def finish_cleaning_workflow(self, cleaner_id, room_id):
+        return self.__by("room", room_id, "finish_cleaning_workflow", cleaner_id, room_id)
+
+    @timed
+    def create_member(self, resident_id_input, type_member):
+        return self.__by("resident", resident_id_input, "create_member",
+                         resident_id_input, type_member)
+
+    @timed
+    def select_payment_method_and_invoices(self, Resident_ID_input, payment_method_input, invoice_ids):
+        return self.__by("resident", Resident_ID_input, "select_payment_method_and_invoices",
+                         Resident_ID_input, payment_method_input, invoice_ids)
+
+    @timed
+    def payment_system(self, Resident_ID_input, paymentdata):
+        return self.__by("resident", Resident_ID_input, "payment_system",
+                         Resident_ID_input, paymentdata)
+
+    @timed
+    def display_invoice(self, resident_id_input):
+        return self.__by("resident", resident_id_input, "display_invoice", resident_id_input)
+
+    @timed
+    def display_receipt(self, resident_id_input):
+        return self.__by("resident", resident_id_input, "display_receipt", resident_id_input)
+
+    # ==================== Scatter / gather ====================
+
+    @timed
+    def add_strike(self, employee_ID_input):
+        return self.__gather("add_strike", (employee_ID_input,))[0]
+
+    @timed
+    def release_expired_holds(self, now=None):
+        return {"released": [contract for result in self.__gather("release_expired_holds", (now,))
+                             for contract in result["released"]]}
+
+    @timed
+    def advance_contract_lifecycle(self, today=None):
+        return {"transitions": [event for result in self.__gather("advance_contract_lifecycle", (today,))
+                                for event in result["transitions"]]}
+
+    def profile(self, duration: float = 10.0, interval: float = 0.005,
+                include_idle: bool = False) -> dict:
+        """SamplingProfiler.profile() over the router and every shard at once.
+
+        Each stack starts with its process ("router", "shard0", ...), so
+        one flamegraph shows all of them side by side.
+        """
+        if profiler.running:
+            raise ProfilerBusyError("a profile is already running")
+        futures = [shard.call("profile", duration, interval, include_idle)
+                   for shard in self.__shards]
+        result = profiler.profile(duration, interval, include_idle)
+        stacks = {f"router;{stack}": count for stack, count in result["stacks"].items()}
+        shard_samples = []
+        for shard, future in zip(self.__shards, futures):
+            shard_result = future.result()
+            shard_samples.append(shard_result["samples"])
+            stacks.update((f"shard{shard.index};{stack}", count)
+                          for stack, count in shard_result["stacks"].items())
+        result["stacks"] = dict(sorted(stacks.items(), key=lambda item: -item[1]))
+        result["shard_samples"] = shard_samples
+        return result
+
+    def entity_gauges(self):
+        merged = None
+        for gauges in self.__gather("entity_gauges"):
+            if merged is None:
+                merged = gauges
+                continue
+            for key, value in gauges.items():
+                if key == "rooms":
+                    for status, count in value.items():
+                        merged["rooms"][status] += count
+                else:
+                    merged[key] += value
+        return merged
+
+    @timed
+    def start_billing_run(self, employeeId, billing_period=None, chunk_size=None):
+        period = BillingRun.parse_period(billing_period)
+        with self.__billing_lock:
+            # each shard resumes its own unfinished run for the period, like Dorm does
+            shard_runs = dict(enumerate(
+                self.__gather("start_billing_run", (employeeId, period, chunk_size))))
+            run = self.__open_billing_runs.get(period)
+            if run is not None and run.status != BillingRunStatus.COMPLETED:
+                return run.resume(shard_runs)
+            run = _ScatteredRun(period, self.__shards, shard_runs)
+            self.__billing_runs[run.id] = run
+            self.__open_billing_runs[period] = run
+            return run
+
+    def search_billing_run_by_id(self, run_id):
+        run = self.__billing_runs.get(run_id)
+        if run is None:
+            raise ValueError(f"Billing run '{run_id}' not found")
+        return run
+
+    @timed
+    def display_billing_run(self, run_id):
+        return self.search_billing_run_by_id(run_id).to_dict()
+
+    @timed
+    def system_contract_invoice(self, employeeId, billing_period=None):
+        run = self.start_billing_run(employeeId, billing_period).run_to_completion()
+        return {
+            "system_contract_invoice": "success",
+            "employee_id": employeeId,
+            "run_id": run.id,
+            "billing_period": run.period,
+            "contracts_processed": run.processed,
+            "invoices_issued": run.invoices_issued,
+            "skipped_already_billed": run.skipped,
+        }
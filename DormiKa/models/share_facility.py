@@ -1,17 +1,21 @@
+from datetime import timedelta
 from .enum import *
 from .facility_booking import *
 from .invoice import *
+from .facility_schedule import FacilitySchedule
+from .id_allocator import next_id
+from .tracing import traced
 
 
 class ShareFacility:
-    ID = 1
+    SLOT_MINUTES = 60
 
     def __init__(self, cost=0):
-        self.__id = f"SHARE-{ShareFacility.ID:04d}"
+        self.__id = f"SHARE-{next_id('share_facility'):04d}"
         self.__status = ShareFacilityStatus.AVAILABLE
         self.__facility_log = []
         self.__cost = cost
-        ShareFacility.ID += 1
+        self.__schedule = FacilitySchedule()
 
     # getter attribute ShareFacility
     @property
@@ -30,13 +34,24 @@ class ShareFacility:
     def cost(self):
         return self.__cost
 
+    @property
+    def schedule(self):
+        return self.__schedule
+
+    @traced
     def create_booking(self, resident_id, facility_id, building_id, booking_time):
+        start_time = BookingShareFacility.parse_booking_time(booking_time)
+        end_time = start_time + timedelta(minutes=self.SLOT_MINUTES)
+        if self.__schedule.conflicts(start_time, end_time):
+            raise ValueError("this share facility already booking")
         booking = BookingShareFacility(
-            resident_id, facility_id, building_id, booking_time)
+            resident_id, facility_id, building_id, booking_time, self.SLOT_MINUTES)
+        self.__schedule.add(booking)
         return booking
 
-    def create_share_facility_invoice(self, resident_id, booking):
-        return Invoice(InvoiceType.SHARE_FACILITY, self.cost, InvoiceStatus.UNPAID, booking.id)
+    def create_share_facility_invoice(self, resident_id, booking, date_create=None):
+        return Invoice(InvoiceType.SHARE_FACILITY, self.cost, InvoiceStatus.UNPAID, booking.id,
+                       date_create=date_create)
 
 
 class WashingMachine(ShareFacility):
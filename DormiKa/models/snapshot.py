@@ -0,0 +1,496 @@
+import gc
+import io
+import mmap
+import os
+import pickle
+import struct
+import threading
+from array import array
+from collections import deque
+from itertools import compress, repeat
+from operator import attrgetter, eq, is_, itemgetter, setitem
+
+from .repository import (
+    Repository, MEMBER_KINDS, MEMBER_LISTS, apply_state, entity_class,
+    entity_kind, entity_reference, entity_state, load_state, read_counters,
+)
+
+
+MAGIC = b"DKMMAP1\0"
+# header offset and length, right after the magic
+PREAMBLE = struct.Struct("<QQ")
+# per entity: state offset, state length, class index
+TABLE_ENTRY = 3
+# entity states pickled and written at a time
+WRITE_BATCH = 4096
+
+# the one attribute a lazy entity carries until it is decoded
+_LAZY_POSITION = "_lazy_position"
+_decode_lock = threading.RLock()
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """Writes references as (kind index, position), numbering entities as they are met.
+
+    Pickle asks persistent_id about every object, strings and ints
+    included, so references go through reducer_override, which it skips
+    for builtins. States are added back to back to one buffer, with a
+    fresh memo each, and written out a batch at a time.
+    """
+
+    def __init__(self, writer):
+        self.__buffer = io.BytesIO()
+        super().__init__(self.__buffer, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__reference = writer.reference
+
+    def reducer_override(self, obj):
+        reference = self.__reference(obj)
+        if reference is None:
+            return NotImplemented
+        return entity_reference, reference
+
+    def add(self, state):
+        """Pickle state after the ones already added; returns its length."""
+        self.clear_memo()
+        start = self.__buffer.tell()
+        self.dump(state)
+        return self.__buffer.tell() - start
+
+    def write_to(self, file):
+        with self.__buffer.getbuffer() as added:
+            file.write(added)
+        self.__buffer.seek(0)
+        self.__buffer.truncate()
+
+
+class _SnapshotWriter:
+    def __init__(self):
+        self.kinds = []
+        self.kind_index = {}
+        self.ids = []
+        self.positions = []
+        self.pending = []
+        # class -> kind index, None for classes that are not entities
+        self.__class_kinds = {}
+
+    def __kind(self, kind):
+        index = self.kind_index.get(kind)
+        if index is None:
+            index = self.kind_index[kind] = len(self.kinds)
+            self.kinds.append(kind)
+            self.ids.append([])
+            self.positions.append({})
+        return index
+
+    def __number(self, index, entity):
+        ids = self.ids[index]
+        position = self.positions[index][entity.id] = len(ids)
+        ids.append(entity.id)
+        self.pending.append((index, position, entity))
+        return position
+
+    def reference(self, obj):
+        try:
+            index = self.__class_kinds[type(obj)]
+        except KeyError:
+            kind = entity_kind(obj)
+            index = self.__class_kinds[type(obj)] = None if kind is None else self.__kind(kind)
+        if index is None:
+            return None
+        position = self.positions[index].get(obj.id)
+        if position is None:
+            position = self.__number(index, obj)
+        return index, position
+
+    def references(self, entities):
+        """(kind index, positions) of entities that are all of one kind."""
+        kinds = {entity_kind(entity) for entity in {type(entity): entity
+                                                     for entity in entities}.values()}
+        if len(kinds) != 1 or None in kinds:
+            raise ValueError("Expected entities of one kind")
+        index = self.__kind(kinds.pop())
+        positions = list(map(self.positions[index].get, map(attrgetter("id"), entities)))
+        for number, position in enumerate(positions):
+            if position is None:
+                # the same entity may appear twice before it is numbered
+                position = self.positions[index].get(entities[number].id)
+                positions[number] = (self.__number(index, entities[number])
+                                     if position is None else position)
+        return index, positions
+
+
+def _column(writer, values):
+    """An index column for the header: entities become (kind index, positions)."""
+    values = list(values)
+    if not values or entity_kind(values[0]) is None:
+        return "values", values
+    try:
+        kind_index, positions = writer.references(values)
+    except ValueError:
+        raise ValueError("An index column mixes entity kinds") from None
+    return "entities", (kind_index, array("q", positions).tobytes())
+
+
+def write_snapshot(path, name, member_lists, ledger, indexes=None):
+    """Write every entity reachable from member_lists to a snapshot file.
+
+    Layout: magic, preamble, the pickled state of every entity back to
+    back, one fixed-width table per kind locating each state by position,
+    then a pickled header with ids, member lists, ledger, id counters and
+    the columns of indexes (name -> list of values or of entities).
+    References between entities are stored as positions, so loading
+    needs no id lookups.
+    """
+    # every state dumped allocates; with a large heap cyclic GC passes
+    # over it only cost time, as on load
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        _write(path, name, member_lists, ledger, indexes)
+    finally:
+        if collecting:
+            gc.enable()
+
+
+def _write(path, name, member_lists, ledger, indexes):
+    writer = _SnapshotWriter()
+    members = {list_name: writer.references(entities)[1] if entities else []
+               for list_name, entities in member_lists.items()}
+    columns = {column: _column(writer, values) for column, values in (indexes or {}).items()}
+
+    classes = []
+    class_index = {}
+    tables = []
+    pickler = _SnapshotPickler(writer)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as snapshot_file:
+        snapshot_file.write(MAGIC)
+        snapshot_file.write(PREAMBLE.pack(0, 0))
+        offset = len(MAGIC) + PREAMBLE.size
+        while writer.pending:
+            # a batch of the entities found so far; dumping them numbers
+            # the ones they reference, which join the pending list
+            batch = writer.pending[-WRITE_BATCH:]
+            del writer.pending[-WRITE_BATCH:]
+            # state first: dumping a lazily loaded entity settles its class
+            lengths = [pickler.add(entity_state(entity)) for _, _, entity in batch]
+            pickler.write_to(snapshot_file)
+            for index, ids in enumerate(writer.ids):
+                if len(tables) <= index:
+                    tables.append(array("Q"))
+                missing = len(ids) * TABLE_ENTRY - len(tables[index])
+                if missing > 0:
+                    tables[index].frombytes(bytes(missing * tables[index].itemsize))
+            for (index, position, entity), length in zip(batch, lengths):
+                number = class_index.get(type(entity))
+                if number is None:
+                    number = class_index[type(entity)] = len(classes)
+                    classes.append(type(entity).__qualname__)
+                table = tables[index]
+                entry = position * TABLE_ENTRY
+                table[entry] = offset
+                table[entry + 1] = length
+                table[entry + 2] = number
+                offset += length
+
+        def blob(value):
+            nonlocal offset
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            snapshot_file.write(data)
+            offset += len(data)
+            return offset - len(data), len(data)
+
+        kinds = {}
+        for index, kind in enumerate(writer.kinds):
+            padding = -offset % 8
+            snapshot_file.write(b"\0" * padding)
+            offset += padding
+            kinds[kind] = {"index": index, "count": len(writer.ids[index]), "table": offset}
+            data = tables[index].tobytes()
+            snapshot_file.write(data)
+            offset += len(data)
+            # ids, ledger and index columns are read only when first needed
+            kinds[kind]["ids"] = blob(writer.ids[index])
+        ledger = blob(list(ledger))
+        columns = {column: blob(data) for column, data in columns.items()}
+
+        header = pickle.dumps({
+            "name": name,
+            "members": members,
+            "ledger": ledger,
+            "counters": read_counters(),
+            "classes": classes,
+            "kinds": kinds,
+            "columns": columns,
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+        snapshot_file.write(header)
+        snapshot_file.seek(len(MAGIC))
+        snapshot_file.write(PREAMBLE.pack(offset, len(header)))
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temporary, path)
+
+
+def _lazy_id(self):
+    lazy = type(self)
+    return lazy._snapshot.ids(lazy._snapshot_kind)[self.__dict__[_LAZY_POSITION]]
+
+
+def _lazy_getattr(self, name):
+    if _LAZY_POSITION not in self.__dict__:
+        raise AttributeError(name)
+    _decode(self)
+    return getattr(self, name)
+
+
+def _lazy_setattr(self, name, value):
+    _decode(self)
+    object.__setattr__(self, name, value)
+
+
+def _lazy_getstate(self):
+    _decode(self)
+    return entity_state(self)
+
+
+def _decode(entity):
+    with _decode_lock:
+        lazy = type(entity)
+        position = entity.__dict__.pop(_LAZY_POSITION, None)
+        if position is None:
+            return
+        state = lazy._snapshot.decode(lazy._snapshot_kind, position)
+        apply_state(entity, state)
+        object.__setattr__(entity, "__class__", lazy._snapshot_class)
+        lazy._snapshot.decoded(lazy._snapshot_kind, entity)
+
+
+class MappedSnapshot:
+    """A snapshot file mapped into memory; entities are decoded on first access.
+
+    Until then an entity is an instance of a look-alike subclass that
+    knows its id, and swaps itself back to the real class once any other
+    attribute is read or written.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as snapshot_file:
+            self.__map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.__map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a DormiKa snapshot")
+        header_offset, header_length = PREAMBLE.unpack_from(self.__map, len(MAGIC))
+        self.__header = load_state(self.__map[header_offset:header_offset + header_length])
+        self.__classes = [entity_class(name) for name in self.__header["classes"]]
+
+        kinds = sorted(self.__header["kinds"].items(), key=lambda item: item[1]["index"])
+        self.__kind_index = {kind: info["index"] for kind, info in kinds}
+        # (offset, length) of each kind's pickled ids until they are first read
+        self.__ids = [info["ids"] for _, info in kinds]
+        self.__tables = [
+            memoryview(self.__map)[info["table"]:
+                                   info["table"] + info["count"] * TABLE_ENTRY * 8].cast("Q")
+            for _, info in kinds
+        ]
+        self.__entities = [[None] * info["count"] for _, info in kinds]
+        self.__ledger = None
+        self.__lazy_classes = {}
+        self.__on_decode = {}
+        self.__references = _References(self)
+
+    @property
+    def header(self):
+        return self.__header
+
+    def __blob(self, location):
+        offset, length = location
+        return load_state(self.__map[offset:offset + length])
+
+    def ids(self, kind_index):
+        ids = self.__ids[kind_index]
+        if isinstance(ids, tuple):
+            ids = self.__ids[kind_index] = self.__blob(ids)
+        return ids
+
+    def kind_ids(self, kind):
+        return self.ids(self.__kind_index[kind])
+
+    @property
+    def ledger(self):
+        if self.__ledger is None:
+            self.__ledger = self.__blob(self.__header["ledger"])
+        return self.__ledger
+
+    def __lazy_class(self, kind_index, class_index):
+        key = (kind_index, class_index)
+        lazy = self.__lazy_classes.get(key)
+        if lazy is None:
+            cls = self.__classes[class_index]
+            lazy = type(cls.__name__, (cls,), {
+                "__slots__": (),
+                "__qualname__": cls.__qualname__,
+                "__module__": cls.__module__,
+                "_snapshot": self,
+                "_snapshot_kind": kind_index,
+                "_snapshot_class": cls,
+                # ids are known from the snapshot without decoding
+                "id": property(_lazy_id),
+                "__getattr__": _lazy_getattr,
+                "__setattr__": _lazy_setattr,
+                "__getstate__": _lazy_getstate,
+            })
+            self.__lazy_classes[key] = lazy
+        return lazy
+
+    def entity(self, kind, position):
+        return self.persistent_load((self.__kind_index[kind], position))
+
+    def column(self, name):
+        """An index column written with the snapshot; entities come back undecoded."""
+        form, data = self.__blob(self.__header["columns"][name])
+        if form == "values":
+            return data
+        kind_index, positions = data
+        return self.__shells(kind_index, array("q", positions).tolist())
+
+    def entities(self, kind, positions):
+        """The entities of kind at positions, undecoded unless already in use."""
+        return self.__shells(self.__kind_index[kind], positions)
+
+    def __shells(self, kind_index, positions):
+        entities = self.__entities[kind_index]
+        missing = list(dict.fromkeys(
+            compress(positions, map(is_, _pick(entities, positions), repeat(None)))))
+        if missing:
+            # built with map() rather than a loop: a column can hold 100k entities
+            classes = _pick(self.__tables[kind_index][2::TABLE_ENTRY], missing)
+            class_indexes = set(classes)
+            for class_index in class_indexes:
+                group = missing if len(class_indexes) == 1 else list(
+                    compress(missing, map(eq, classes, repeat(class_index))))
+                shells = list(map(object.__new__,
+                                  repeat(self.__lazy_class(kind_index, class_index), len(group))))
+                deque(map(setitem, map(vars, shells), repeat(_LAZY_POSITION), group), maxlen=0)
+                deque(map(entities.__setitem__, group, shells), maxlen=0)
+        return _pick(entities, positions)
+
+    def column_ids(self, name):
+        """Ids of the entities in an index column, without making the entities."""
+        _, (kind_index, positions) = self.__blob(self.__header["columns"][name])
+        return _pick(self.ids(kind_index), array("q", positions).tolist())
+
+    def on_decode(self, kind, handler):
+        """Call handler(entity) whenever an entity of kind is decoded."""
+        kind_index = self.__kind_index.get(kind)
+        if kind_index is not None:
+            self.__on_decode[kind_index] = handler
+
+    def decoded(self, kind_index, entity):
+        handler = self.__on_decode.get(kind_index)
+        if handler is not None:
+            handler(entity)
+
+    def persistent_load(self, reference):
+        kind_index, position = reference
+        entities = self.__entities[kind_index]
+        entity = entities[position]
+        if entity is None:
+            class_index = self.__tables[kind_index][position * TABLE_ENTRY + 2]
+            entity = object.__new__(self.__lazy_class(kind_index, class_index))
+            entity.__dict__[_LAZY_POSITION] = position
+            entities[position] = entity
+        return entity
+
+    def decode(self, kind_index, position):
+        table = self.__tables[kind_index]
+        offset = table[position * TABLE_ENTRY]
+        length = table[position * TABLE_ENTRY + 1]
+        # a resident can reference hundreds of thousands of invoices; each
+        # becomes a shell, and cyclic GC passes over them only cost time
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            return load_state(self.__map[offset:offset + length], self.__references)
+        finally:
+            if collecting:
+                gc.enable()
+
+
+class _References:
+    """The (kind index, position) references in entity state, as entities."""
+
+    def __init__(self, snapshot):
+        self.__resolve = snapshot.persistent_load
+
+    def __getitem__(self, reference):
+        try:
+            return self.__resolve(reference)
+        except (IndexError, TypeError, ValueError):
+            raise KeyError(reference) from None
+
+
+def _pick(values, positions):
+    if len(positions) < 2:
+        return [values[position] for position in positions]
+    return list(itemgetter(*positions)(values))
+
+
+class _Ledger:
+    """The snapshot's billing ledger, read on first iteration."""
+
+    def __init__(self, snapshot):
+        self.__snapshot = snapshot
+
+    def __iter__(self):
+        return iter(self.__snapshot.ledger)
+
+
+class _Members:
+    """Answers Dorm restore's (kind, id) lookups for member lists from snapshot positions."""
+
+    def __init__(self, snapshot):
+        self.__entities = {}
+        for list_name, positions in snapshot.header["members"].items():
+            kind = MEMBER_KINDS[list_name]
+            ids = _pick(snapshot.kind_ids(kind), positions)
+            self.__entities.update(zip(zip(repeat(kind), ids), snapshot.entities(kind, positions)))
+
+    def __getitem__(self, key):
+        return self.__entities[key]
+
+
+class SnapshotRepository(Repository):
+    """Cold-start image of a Dorm, read through mmap.
+
+    The file is written with Dorm.write_snapshot; saves in between are not
+    kept, so pair it with a durable repository when changes must survive a
+    crash. Header, tables and entity state go through the restricted
+    unpickler SQLiteRepository uses.
+    """
+
+    def __init__(self, path: str):
+        self.__path = path
+
+    @property
+    def path(self):
+        return self.__path
+
+    def load(self):
+        if not os.path.exists(self.__path):
+            return None
+        snapshot = MappedSnapshot(self.__path)
+        header = snapshot.header
+        members = {list_name: [] for list_name in MEMBER_LISTS}
+        for list_name, positions in header["members"].items():
+            members[list_name] = _pick(snapshot.kind_ids(MEMBER_KINDS[list_name]), positions)
+        return {
+            "name": header["name"],
+            "entities": _Members(snapshot),
+            "members": members,
+            "counters": header["counters"],
+            "ledger": _Ledger(snapshot),
+            # prebuilt indexes, so restoring does not decode every entity
+            "indexes": snapshot if header.get("columns") else None,
+        }
+
+    def save(self, entities=(), members=(), ledger=(), name=None):
+        pass
@@ -1,6 +1,8 @@
 from datetime import datetime
 from .enum import *
 from .maintenance_ticket import MaintenanceTicket
+from .id_allocator import next_id
+from .tracing import traced
 
 
 class Staff:
@@ -60,10 +62,8 @@ class Staff:
 
 
 class Cleaner(Staff):
-    ID = 1
-
     def __init__(self, name: str, phone_number: str, cleaning_supplies_list=None, assigned_rooms=None, status: str = "ACTIVE"):
-        cl_id = f"CL-{Cleaner.ID:04d}"
+        cl_id = f"CL-{next_id('cleaner'):04d}"
         super().__init__(id=cl_id,
                          name=name,
                          phone_number=phone_number,
@@ -71,8 +71,6 @@ class Cleaner(Staff):
         self.__cleaning_supplies_list = cleaning_supplies_list or []
         self.__assigned_rooms = assigned_rooms or []
 
-        Cleaner.ID += 1
-
     @property
     def cleaning_supplies_list(self):
         return self.__cleaning_supplies_list
@@ -105,6 +103,7 @@ class Cleaner(Staff):
         self.__assigned_rooms.remove(room)
         return {"room_id": room.id, "status": "available"}
 
+    @traced
     def complete_task(self):
         completed_room = self.current_task
         if completed_room is None:
@@ -114,8 +113,6 @@ class Cleaner(Staff):
 
 
 class Technician(Staff):
-    ID = 1
-
     def __init__(
         self,
         name: str,
@@ -125,13 +122,15 @@ class Technician(Staff):
         current_task=None,
         status=AvailabilityStatus.AVAILABLE,
     ):
-        tech_id = f"TC-{Technician.ID:04d}"
+        tech_id = f"TC-{next_id('technician'):04d}"
         super().__init__(tech_id, name, phone_number, status=status)
         self.__capabilities = capabilities or []
         self.__schedule = schedule
         self._current_task = current_task
 
-        Technician.ID += 1
+    @property
+    def current_task(self):
+        return self._current_task
 
     @property
     def capabilities(self):
@@ -144,6 +143,7 @@ class Technician(Staff):
     def show_all_mt(self, building_id):
         return []
 
+    @traced
     def start_maintenance(self, notes: str = None):
         if self._current_task is None:
             raise ValueError(f"Technician {self.id} has no assigned ticket")
@@ -169,6 +169,7 @@ class Technician(Staff):
             "notes": ticket.notes,
         }
 
+    @traced
     def complete_task(self):
         if self._current_task is None:
             raise ValueError(f"Technician {self.id} has no assigned ticket")
@@ -188,6 +189,7 @@ class Technician(Staff):
 
         return completed_ticket
 
+    @traced
     def assign_ticket(self, ticket):
         self.status = AvailabilityStatus.UNAVAILABLE
         self._current_task = ticket
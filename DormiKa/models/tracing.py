@@ -0,0 +1,156 @@
+import collections
+import contextvars
+import functools
+import itertools
+import os
+import random
+import time
+
+from .event_log import EventLog
+
+
+# marks a trace the head decided not to sample, so nothing below it records
+_UNSAMPLED = object()
+_current = contextvars.ContextVar("dormika_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "started")
+
+    def __init__(self, trace_id, parent_id, name):
+        self.trace_id = trace_id
+        self.span_id = f"{os.getpid():x}.{next(_span_ids):x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.started = time.perf_counter()
+
+    def finish(self, error=None):
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+        }
+        if error is not None:
+            record["error"] = error
+        return record
+
+
+class Tracer:
+    """Nested spans over Dorm workflows and the model calls inside them.
+
+    Sampling is decided once per trace, at the outermost workflow: an
+    unsampled trace costs its calls one context variable lookup each.
+    Finished spans go to a ring buffer of the latest buffer_size and,
+    when sink is a path, to a JSON-lines file through an EventLog writer.
+    """
+
+    def __init__(self, sample_rate: float = 0.01, buffer_size: int = 2048, sink: str = None):
+        self.__sample_rate = sample_rate
+        self.__spans = collections.deque(maxlen=buffer_size)
+        self.__export = None if sink is None else EventLog(sink=sink)
+
+    @property
+    def sample_rate(self):
+        return self.__sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, rate: float):
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError("sample rate must be between 0 and 1")
+        self.__sample_rate = rate
+
+    def begin(self, name):
+        """Open a span under the current one, or start a trace if there is none.
+
+        Returns a handle for end(), or None inside an unsampled trace.
+        """
+        parent = _current.get()
+        if parent is _UNSAMPLED:
+            return None
+        if parent is None:
+            if random.random() >= self.__sample_rate:
+                return None, _current.set(_UNSAMPLED)
+            span = Span(f"{random.getrandbits(64):016x}", None, name)
+        else:
+            span = Span(parent.trace_id, parent.span_id, name)
+        return span, _current.set(span)
+
+    def begin_child(self, name):
+        """Like begin(), but only inside a sampled trace; never starts one."""
+        parent = _current.get()
+        if parent is None or parent is _UNSAMPLED:
+            return None
+        span = Span(parent.trace_id, parent.span_id, name)
+        return span, _current.set(span)
+
+    def end(self, handle, error=None):
+        if handle is None:
+            return
+        span, token = handle
+        _current.reset(token)
+        if span is None:
+            return
+        record = span.finish(error)
+        self.__spans.append(record)
+        if self.__export is not None:
+            self.__export.info("span", **record)
+
+    def recent(self, limit: int = None):
+        """Finished spans, oldest first."""
+        spans = list(self.__spans)
+        return spans if limit is None else spans[-limit:]
+
+    def traces(self, limit: int = 20):
+        """The latest traces still in the buffer, newest first, spans in start order."""
+        grouped = {}
+        for span in self.__spans:
+            grouped.setdefault(span["trace_id"], []).append(span)
+        traces = []
+        for trace_id, spans in reversed(grouped.items()):
+            spans.sort(key=lambda span: span["start"])
+            root = next((span for span in spans if span["parent_id"] is None), spans[0])
+            traces.append({
+                "trace_id": trace_id,
+                "name": root["name"],
+                "duration_ms": root["duration_ms"],
+                "spans": spans,
+            })
+            if len(traces) >= limit:
+                break
+        return traces
+
+    def flush(self):
+        if self.__export is not None:
+            self.__export.flush()
+
+
+def traced(method):
+    """Record a span for method when it runs inside a sampled trace."""
+    name = method.__qualname__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        handle = tracer.begin_child(name)
+        if handle is None:
+            return method(*args, **kwargs)
+        try:
+            result = method(*args, **kwargs)
+        except BaseException as e:
+            tracer.end(handle, f"{type(e).__name__}: {e}")
+            raise
+        tracer.end(handle)
+        return result
+    return wrapper
+
+
+# DORMIKA_TRACE names a JSON-lines file for spans; unset keeps them in memory only
+tracer = Tracer(
+    sample_rate=float(os.environ.get("DORMIKA_TRACE_SAMPLE", 0.01)),
+    buffer_size=int(os.environ.get("DORMIKA_TRACE_BUFFER", 2048)),
+    sink=os.environ.get("DORMIKA_TRACE"),
+)
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolFullError(RuntimeError):
+    """Raised when a pool already has as many calls waiting as it allows."""
+
+
+class WorkerPool:
+    """A bounded thread pool that async code hands blocking Dorm calls to.
+
+    At most max_workers calls run at once and max_queue more may wait;
+    past that run() refuses straight away rather than letting a backlog
+    build. A caller that waits longer than its timeout gets TimeoutError;
+    a call that had not started yet is dropped, one already running
+    finishes in the background.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, timeout: float = None):
+        self.__name = name
+        self.__max_workers = max_workers
+        self.__max_queue = max_queue
+        self.__timeout = timeout
+        self.__executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix=f"dormika-{name}")
+        self.__lock = threading.Lock()
+        self.__pending = 0
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def max_workers(self):
+        return self.__max_workers
+
+    @property
+    def max_queue(self):
+        return self.__max_queue
+
+    @property
+    def timeout(self):
+        return self.__timeout
+
+    @property
+    def depth(self):
+        """Calls running or waiting in this pool."""
+        return self.__pending
+
+    async def run(self, fn, *args, timeout: float = None):
+        """Run fn(*args) on a pool thread and return its result."""
+        with self.__lock:
+            if self.__pending >= self.__max_workers + self.__max_queue:
+                raise PoolFullError(
+                    f"{self.__name} pool is full ({self.__pending} calls pending)")
+            self.__pending += 1
+        try:
+            future = self.__executor.submit(fn, *args)
+        except Exception:
+            self.__done(None)
+            raise
+        future.add_done_callback(self.__done)
+        timeout = self.__timeout if timeout is None else timeout
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    def __done(self, _):
+        with self.__lock:
+            self.__pending -= 1
+
+    def shutdown(self):
+        self.__executor.shutdown(wait=True, cancel_futures=True)
@@ -8,18 +8,19 @@ from models.staff import Cleaner, PlumbingTech, ElectricalTech, ACTech
 from models.share_facility import WashingMachine, MeetingRoom
 
 from models.enum import *
+from models.event_log import log
 from pprint import pprint
 
 
 def init_mock_data():
     global dorm
     dorm = Dorm("========== DormiKa ==========")
-    print(dorm.name)
+    log.debug("mock.dorm", name=dorm.name)
 
     # Add a building
     building = Building(floor_count=5, zone="A")
     dorm.add_building(building)
-    print(f"Building ID: {building.id}\n")
+    log.debug("mock.building", building_id=building.id)
 
     # Add rooms to the building
     rooms = [
@@ -33,8 +34,7 @@ def init_mock_data():
     ]
     for room in rooms:
         building.add_room(room)
-        print(
-            f"Added Room ID: {room.id}, Type: {room.type.value}, Rent: {room.monthly_rent}\n")
+        log.debug("mock.room", room_id=room.id, type=room.type.value, rent=room.monthly_rent)
 
     # Add shared facilities
     building.add_meeting_room(MeetingRoom())
@@ -49,8 +49,7 @@ def init_mock_data():
             phone_number=f"123-456-789{i}"
         )
         dorm.add_resident(resident)
-        print(f"Added Resident: {resident.name}".ljust(25), end="")
-        print(f"{resident.id}")
+        log.debug("mock.resident", name=resident.name, resident_id=resident.id)
 
     # Add contract for the first resident
     resident = dorm.residents[0]
@@ -58,7 +57,7 @@ def init_mock_data():
     contract = Contract(resident, room)
     resident.add_contract(contract)
     room.status = RoomStatus.OCCUPIED
-    print(f"\nAdded {contract.id} to {resident.id}")
+    log.debug("mock.contract", contract_id=contract.id, resident_id=resident.id)
 
     # Add employees
     names = ["Harry", "Sally", "Tom", "Lucy", "Mia", "Oscar"]
@@ -67,8 +66,7 @@ def init_mock_data():
             name=names[i],
         )
         dorm.add_employee(employee)
-        print(f"Added Employee: {employee.name}".ljust(25), end="")
-        print(f"{employee.id}")
+        log.debug("mock.employee", name=employee.name, employee_id=employee.id)
 
     # Add cleaners
     names = ["John", "Jane"]
@@ -80,8 +78,7 @@ def init_mock_data():
             assigned_rooms=[]
         )
         dorm.add_cleaner(cleaner)
-        print(f"Added Cleaner: {cleaner.name}".ljust(25), end="")
-        print(f"{cleaner.id}")
+        log.debug("mock.cleaner", name=cleaner.name, cleaner_id=cleaner.id)
 
     # Add technicians
     names = ["Mike", "Sara", "Leo"]
@@ -114,8 +111,7 @@ def init_mock_data():
     ]
     for t in technicians:
         dorm.add_technician(t)
-        print(f"Added Technician: {t.name}".ljust(25), end="")
-        print(f"{t.id}")
+        log.debug("mock.technician", name=t.name, technician_id=t.id)
 
     return dorm
 
@@ -167,7 +163,7 @@ def run_tests():
     dorm.sign_in(
         "Fill",
         "fill@gmail.com",
-        "123-456-7890"
+        "123-456-7800"
     )
 
     print("\n=== Request Booking ===")
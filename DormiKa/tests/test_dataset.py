@@ -0,0 +1,27 @@
+import os
+
+os.environ.setdefault("DORMIKA_LOG", os.devnull)
+
+import datetime
+
+from dataset import generate, FIXTURE_TODAY
+
+
+def _invoice_dates(dorm):
+    return sorted(invoice.date_create.date() for resident in dorm.residents
+                  for invoice in resident.invoices)
+
+
+def test_history_counts_back_from_the_fixture_day_by_default():
+    dates = _invoice_dates(generate(buildings=1, floors=2, rooms_per_floor=5, residents=8))
+    assert dates
+    assert dates[-1] <= FIXTURE_TODAY
+    assert dates == _invoice_dates(generate(buildings=1, floors=2, rooms_per_floor=5,
+                                            residents=8, today=FIXTURE_TODAY))
+
+
+def test_today_moves_the_history():
+    today = datetime.date(2030, 7, 1)
+    dates = _invoice_dates(generate(buildings=1, floors=2, rooms_per_floor=5, residents=8,
+                                    today=today))
+    assert FIXTURE_TODAY < dates[0] and dates[-1] <= today
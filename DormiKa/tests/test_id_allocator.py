@@ -0,0 +1,64 @@
+import threading
+
+from models.id_allocator import IdAllocator, MemoryIdStore, SQLiteIdStore
+
+
+def test_numbers_are_unique_across_threads():
+    allocator = IdAllocator(block_size=16)
+    drawn = [[] for _ in range(8)]
+
+    def draw(numbers):
+        for _ in range(500):
+            numbers.append(allocator.next("resident"))
+
+    workers = [threading.Thread(target=draw, args=(numbers,)) for numbers in drawn]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    numbers = [number for thread_numbers in drawn for number in thread_numbers]
+    assert len(set(numbers)) == len(numbers) == 4000
+    # each thread counts up within its own blocks
+    assert all(thread_numbers == sorted(thread_numbers) for thread_numbers in drawn)
+
+
+def test_sequences_are_independent():
+    allocator = IdAllocator()
+    assert allocator.next("room") == 1
+    assert allocator.next("resident") == 1
+    assert allocator.next("room") == 2
+
+
+def test_advance_drops_a_block_claimed_below_the_marks():
+    allocator = IdAllocator()
+    assert allocator.next("invoice") == 1
+    # e.g. restored state that already used numbers up to 99
+    allocator.advance({"invoice": 100})
+    assert allocator.next("invoice") >= 100
+
+
+def test_advance_never_lowers_a_mark():
+    allocator = IdAllocator(block_size=4)
+    for _ in range(10):
+        allocator.next("contract")
+    allocator.advance({"contract": 2})
+    assert allocator.next("contract") > 10
+
+
+def test_use_store_carries_the_marks_over():
+    allocator = IdAllocator(block_size=4)
+    drawn = [allocator.next("booking") for _ in range(6)]
+    allocator.use_store(MemoryIdStore())
+    assert allocator.next("booking") > max(drawn)
+
+
+def test_allocators_sharing_a_sqlite_store_do_not_overlap(tmp_path):
+    path = str(tmp_path / "ids.db")
+    stores = [SQLiteIdStore(path), SQLiteIdStore(path)]
+    first, second = (IdAllocator(store, block_size=8) for store in stores)
+    numbers = [allocator.next("ticket") for _ in range(20)
+               for allocator in (first, second)]
+    assert len(set(numbers)) == len(numbers)
+    assert stores[0].high_water_marks()["ticket"] > max(numbers)
+    for store in stores:
+        store.close()
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from models.lock_stripes import LockStripes
+
+
+def _keys_on_stripes(stripes, count):
+    """count keys on distinct stripes, lowest stripe first."""
+    found = {}
+    number = 0
+    while len(found) < count:
+        key = ("room", f"RM-{number:04d}")
+        found.setdefault(stripes.stripe(key), key)
+        number += 1
+    return [found[stripe] for stripe in sorted(found)][:count]
+
+
+def _held_elsewhere(stripes, key):
+    """Whether another thread has to wait for key's stripe."""
+    acquired = threading.Event()
+
+    def take():
+        with stripes.hold(key):
+            acquired.set()
+
+    threading.Thread(target=take, daemon=True).start()
+    return not acquired.wait(0.2)
+
+
+def test_hold_is_reentrant():
+    stripes = LockStripes()
+    low, high = _keys_on_stripes(stripes, 2)
+    with stripes.hold(low, high):
+        with stripes.hold(high):
+            with stripes.hold(low, high):
+                pass
+
+
+def test_higher_stripes_may_be_added():
+    stripes = LockStripes()
+    low, high = _keys_on_stripes(stripes, 2)
+    with stripes.hold(low):
+        with stripes.hold(high, None):
+            pass
+
+
+def test_lower_stripe_while_holding_a_higher_one_is_refused():
+    stripes = LockStripes()
+    low, high = _keys_on_stripes(stripes, 2)
+    with stripes.hold(high):
+        with pytest.raises(RuntimeError, match="Lock order violation"):
+            with stripes.hold(low):
+                pass
+        # nothing was taken by the refused call
+        assert not _held_elsewhere(stripes, low)
+    with stripes.hold(low):
+        pass
+
+
+def test_stripes_are_released_on_error():
+    stripes = LockStripes()
+    key, = _keys_on_stripes(stripes, 1)
+    with pytest.raises(ValueError):
+        with stripes.hold(key):
+            assert _held_elsewhere(stripes, key)
+            raise ValueError("workflow failed")
+    assert not _held_elsewhere(stripes, key)
+
+
+def test_overlapping_keys_in_any_order_do_not_deadlock():
+    stripes = LockStripes()
+    keys = _keys_on_stripes(stripes, 4)
+    counter = [0]
+
+    def work(ordered):
+        for _ in range(2000):
+            with stripes.hold(*ordered):
+                counter[0] += 1
+
+    workers = [threading.Thread(target=work, args=(keys,), daemon=True),
+               threading.Thread(target=work, args=(keys[::-1],), daemon=True),
+               threading.Thread(target=work, args=(keys[1:] + keys[:1],), daemon=True)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+        assert not worker.is_alive()
+    assert counter[0] == 6000
@@ -0,0 +1,74 @@
+import os
+
+os.environ.setdefault("DORMIKA_LOG", os.devnull)
+
+import pytest
+
+from models.building import Building
+from models.dorm import Dorm
+from models.enum import RoomStatus, RoomType
+from models.room import Room
+from models.shard import ShardRouter, shard_of
+
+SHARDS = 3
+ZONES = "ABCDEF"
+
+
+def build(index, count):
+    """Six buildings of ten studios (RM-0001 to RM-0060, ten per building),
+    keeping this shard's buildings."""
+    dorm = Dorm("sharded")
+    for zone in ZONES:
+        building = Building(floor_count=3, zone=zone)
+        dorm.add_building(building)
+        for number in range(10):
+            building.add_room(Room(building, number % 3 + 1, RoomType.STUDIO_ROOM,
+                                   RoomStatus.AVAILABLE))
+    dorm.retain_shard(lambda key: shard_of(key, count) == index)
+    return dorm
+
+
+@pytest.fixture(scope="module")
+def router():
+    router = ShardRouter(SHARDS, build)
+    yield router
+    router.close()
+
+
+def _applicant(name, email, phone_number):
+    return {"name": name, "email": email, "phoneNumber": phone_number}
+
+
+def test_bulk_sign_in_rejects_contacts_repeated_across_shards(router):
+    first = "dedupe0@example.com"
+    elsewhere = next(email for email in (f"dedupe{number}@example.com" for number in range(1, 20))
+                     if shard_of(email, SHARDS) != shard_of(first, SHARDS))
+    result = router.bulk_sign_in([
+        _applicant("First", first, "555-200-0000"),
+        # same phone, an email routed to another shard
+        _applicant("Second", elsewhere, "5552000000"),
+        # same email, spelled differently
+        _applicant("Third", first.upper(), "555-200-0001"),
+    ])
+    assert result["accepted_count"] == 1
+    assert result["accepted"][0]["email"] == first
+    assert [rejection["email"] for rejection in result["rejected"]] == [elsewhere, first.upper()]
+
+
+def test_change_contract_to_another_shard_is_refused(router):
+    resident_id = router.sign_in("Mover", "mover@example.com", "555-300-0000")["your_id_is"]
+    booked = router.request_booking(resident_id, "A01", RoomType.STUDIO_ROOM)
+    invoice_id = router.sign_contract(booked["contract_id"])["invoice_id"]
+    router.pay_contract_invoice(invoice_id)
+
+    home = shard_of("A01", SHARDS)
+    away = next(position for position, zone in enumerate(ZONES)
+                if shard_of(f"{zone}{position + 1:02d}", SHARDS) != home)
+    with pytest.raises(ValueError, match="another shard"):
+        router.change_contract(resident_id, booked["contract_id"],
+                               f"RM-{away * 10 + 1:04d}", "2026-03-15")
+
+    # a room in the same building is still a plain change
+    target = "RM-0010" if booked["room_id"] != "RM-0010" else "RM-0009"
+    result = router.change_contract(resident_id, booked["contract_id"], target, "2026-03-15")
+    assert "response" not in result
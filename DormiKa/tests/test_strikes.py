@@ -0,0 +1,26 @@
+import os
+
+os.environ.setdefault("DORMIKA_LOG", os.devnull)
+
+from dataset import generate
+
+
+def _blacklisted(dorm, resident):
+    return (dorm.check_sign_in("Someone", resident.email, "0000000000")
+            == "error, email or phone number is blacklisted")
+
+
+def test_threshold_counts_strikes_from_earlier_runs():
+    # every invoice paid: this run strikes nobody
+    dorm = generate(buildings=1, floors=2, rooms_per_floor=5, residents=6,
+                    unpaid_rate=0, booking_rate=0)
+    struck_out, warned = dorm.residents[:2]
+    struck_out.add_strike(3)
+    warned.add_strike(2)
+
+    dorm.add_strike(dorm.employees[0].id)
+
+    assert _blacklisted(dorm, struck_out)
+    assert struck_out not in dorm.residents
+    assert not _blacklisted(dorm, warned)
+    assert warned in dorm.residents